@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -79,6 +80,18 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than SQLite's shared in-memory database, so tests of the
+        # threaded pipeline wait on locks (busy timeout) as production does
+        'TEST': {'NAME': Path(tempfile.gettempdir()) / 'GradeMate-test.sqlite3'},
+    }
+}
+
+# Shared by every web and worker process, so invalidation in one reaches all.
+# The table is created by a Student migration (createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'grademate_cache',
     }
 }
 
@@ -123,6 +136,61 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Background job queue (Student.services.jobs, run with `manage.py run_workers`)
+JOB_QUEUE = {
+    'LEASE_SECONDS': 600,        # a running job's worker renews this lease; if it dies the job is reclaimed after this
+    'POLL_INTERVAL': 1.0,        # seconds an idle worker waits before polling again
+    'MAX_ATTEMPTS': 5,           # attempts before a job is dead-lettered
+    'RETRY_BACKOFF': 10,         # first retry delay in seconds, doubled on every attempt
+    'RETRY_BACKOFF_MAX': 3600,
+    'EAGER': False,              # run jobs inline when enqueued (no worker process needed)
+    'PRIORITY_AGING': 600,       # seconds after which any waiting job competes with interactive work
+    'FAIR_SHARE_WINDOW': 60,     # seconds of recent starts counted when picking the next classroom/teacher
+}
+
+# Grade memo (Student/services/memo.py): results keyed by key, answer and engine version
+GRADE_MEMO = {
+    'ENABLED': True,
+    'TTL_DAYS': 30,              # memos unused for this long are discarded
+    'MAX_ENTRIES': 100_000,      # least recently used memos beyond this are evicted
+    'PRUNE_EVERY': 500,          # stores between eviction passes
+}
+
+# Admission control around model inference (Student/services/admission.py), per process
+ADMISSION_CONTROL = {
+    'OCR_CONCURRENCY': 1,        # OCR calls running at once
+    'OCR_QUEUE_SIZE': 4,         # OCR calls allowed to wait for a slot; more are rejected with 503
+    'EMBEDDING_CONCURRENCY': 2,  # embedding model calls running at once
+    'EMBEDDING_QUEUE_SIZE': 16,
+    'QUEUE_TIMEOUT': 10,         # seconds a web request waits for a slot before it is rejected
+    'RETRY_AFTER': 5,            # Retry-After seconds sent with a 503
+}
+
+# Staged batch evaluation (Student/services/stages.py)
+EVALUATION_PIPELINE = {
+    'OCR_PROCESSES': 2,          # extraction processes (and the threads feeding them)
+    'EMBED_BATCH_SIZE': 32,      # answers encoded per embedding model call
+    'EMBED_MAX_WAIT': 0.05,      # seconds the embedder waits for a batch to fill
+    'SCORE_WORKERS': 4,          # plagiarism check and grading threads
+    'QUEUE_SIZE': 64,            # items each stage may have waiting before it blocks the one feeding it
+}
+
+# Per-student assignment visibility cache (Student/services/visibility.py)
+ASSIGNMENT_VISIBILITY = {
+    'CACHE_TIMEOUT': 300,        # seconds a student's visible assignment set is kept
+}
+
+# Assignment notification fan-out (Student/services/notifications.py)
+ASSIGNMENT_NOTIFICATIONS = {
+    'INLINE_LIMIT': 200,         # classrooms with more students are notified by a background job
+    'BATCH_SIZE': 500,           # notifications written per INSERT/UPDATE
+}
+
+# Keyset pagination of the submission, result and notification lists (Student/services/pagination.py)
+KEYSET_PAGINATION = {
+    'COMPAT_PAGES': 5,           # ?page=N links still served (by OFFSET) up to this page
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import StudentAnswer, StudentAssignment
+from .models import StudentAnswer, StudentAssignment, Job, GradeMemo, UserCounters, TeacherStats
 
 # Register your models here.
 
@@ -8,6 +8,8 @@ class StudentAnswerAdmin(admin.ModelAdmin):
     list_display = ['id', 'student', 'question_id', 'score', 'uploaded_at', 'evaluated_at']
     list_filter = ['score', 'uploaded_at', 'evaluated_at', 'question']
     search_fields = ['student__name', 'student__username', 'answer_text', 'feedback']
+    # __str__ (the row's checkbox label) shows the student and question
+    list_select_related = ['student', 'question']
     readonly_fields = ['uploaded_at', 'evaluated_at']
     
     fieldsets = (
@@ -33,17 +35,78 @@ class StudentAssignmentAdmin(admin.ModelAdmin):
     list_display = ['student', 'assignment', 'score', 'is_graded', 'plagiarism', 'submitted_at', 'evaluated_at']
     list_filter = ['is_graded', 'plagiarism', 'submitted_at', 'evaluated_at', 'assignment__subject']
     search_fields = ['student__name', 'assignment__title', 'answer_text', 'feedback']
-    readonly_fields = ['submitted_at', 'evaluated_at']
+    # Assignment.__str__ shows the classroom and subject
+    list_select_related = ['student', 'assignment__classroom', 'assignment__subject']
+    readonly_fields = ['submitted_at', 'evaluated_at', 'duplicate_of']
     
     fieldsets = (
         ('Submission Details', {
             'fields': ('student', 'assignment', 'file', 'answer_text')
         }),
         ('Evaluation Results', {
-            'fields': ('score', 'feedback', 'is_graded', 'plagiarism')
+            'fields': ('score', 'feedback', 'is_graded', 'plagiarism', 'duplicate_of')
         }),
         ('Timestamps', {
             'fields': ('submitted_at', 'evaluated_at'),
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'fair_key', 'attempts', 'max_attempts', 'run_after', 'wait_seconds', 'locked_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'priority', 'name']
+    search_fields = ['name', 'fair_key', 'last_error']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'locked_by', 'locked_until', 'wait_seconds', 'last_error']
+    actions = ['requeue_jobs']
+    
+    def requeue_jobs(self, request, queryset):
+        """Admin action to retry dead or stuck jobs"""
+        from .services.jobs import requeue
+        count = requeue(queryset.exclude(status=Job.STATUS_RUNNING))
+        self.message_user(request, f'Requeued {count} job(s).')
+    requeue_jobs.short_description = 'Requeue selected jobs'
+
+
+@admin.register(GradeMemo)
+class GradeMemoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'key_hash', 'answer_hash', 'engine_version', 'similarity', 'created_at', 'last_used_at']
+    list_filter = ['engine_version']
+    search_fields = ['key_hash', 'answer_hash']
+    readonly_fields = ['key_hash', 'answer_hash', 'engine_version', 'similarity', 'point_similarities', 'feedback', 'created_at', 'last_used_at']
+
+
+@admin.register(UserCounters)
+class UserCountersAdmin(admin.ModelAdmin):
+    list_display = ['user', 'unread_notifications', 'pending_assignments', 'ungraded_submissions', 'stale', 'updated_at']
+    list_filter = ['stale']
+    search_fields = ['user__name', 'user__username']
+    list_select_related = ['user']
+    readonly_fields = ['updated_at']
+    actions = ['recount']
+    
+    def recount(self, request, queryset):
+        """Admin action to recount the selected counters from the tables"""
+        from .services.counters import reconcile
+        repaired = reconcile(queryset.values_list('user_id', flat=True))
+        self.message_user(request, f'Repaired {repaired} of {queryset.count()} counter row(s).')
+    recount.short_description = 'Recount from the tables'
+
+
+
+@admin.register(TeacherStats)
+class TeacherStatsAdmin(admin.ModelAdmin):
+    list_display = ['teacher', 'assignments', 'active_assignments', 'students', 'graded_submissions', 'average_percentage', 'stale', 'updated_at']
+    list_filter = ['stale']
+    search_fields = ['teacher__name', 'teacher__username']
+    list_select_related = ['teacher']
+    readonly_fields = ['updated_at']
+    actions = ['recount']
+    
+    def recount(self, request, queryset):
+        """Admin action to recount the selected stats from the tables"""
+        from .services.teacher_stats import reconcile
+        repaired = reconcile(queryset.values_list('teacher_id', flat=True))
+        self.message_user(request, f'Repaired {repaired} row(s) for {queryset.count()} teacher(s).')
+    recount.short_description = 'Recount from the tables'
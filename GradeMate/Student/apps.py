@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class StudentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Student'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - connects the visibility cache signals
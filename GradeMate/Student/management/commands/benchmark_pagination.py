@@ -0,0 +1,65 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from Student.models import StudentAssignment
+from Student.services.pagination import benchmark
+from Teacher.models import Assignment, Classroom, Subject
+from USER.models import User
+
+
+class Command(BaseCommand):
+    help = "Compare offset and keyset pagination latency of a teacher's submission list at increasing page depths (synthetic data, rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Submissions to generate")
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 10000], help="Page depths to load")
+        parser.add_argument('--per-page', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5, help="Loads per measurement (the median is reported)")
+        parser.add_argument('--json', action='store_true', help="Print raw results as JSON")
+
+    def handle(self, *args, **options):
+        rows, per_page = options['rows'], options['per_page']
+        pages = [page for page in options['pages'] if (page - 1) * per_page < rows]
+        with transaction.atomic():
+            started = time.perf_counter()
+            teacher = self.seed(rows)
+            self.stdout.write(f"Generated {rows} submissions in {time.perf_counter() - started:.1f}s")
+            results = benchmark(
+                StudentAssignment.objects.filter(teacher=teacher), 'submitted_at', per_page, pages, options['repeat']
+            )
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{results['rows']} rows, {per_page} per page"))
+        self.stdout.write("      page   offset ms   keyset ms")
+        for row in results['pages']:
+            self.stdout.write(f"  {row['page']:>8}  {row['offset_ms']:>10.2f}  {row['keyset_ms']:>10.2f}")
+
+    def seed(self, rows, batch_size=5000):
+        """One teacher with rows submissions: a square-ish grid of assignments by students."""
+        width = max(int(rows ** 0.5), 1)
+        teacher = User.objects.create(username='benchmark-teacher', name='Benchmark Teacher', role='teacher')
+        subject = Subject.objects.create(name='Benchmark')
+        classroom = Classroom.objects.create(name='Benchmark', grade='0', section='Z')
+        now = timezone.now()
+        assignments = Assignment.objects.bulk_create([
+            Assignment(title=f'Assignment {i}', teacher=teacher, subject=subject, classroom=classroom, due_date=now)
+            for i in range(-(-rows // width))
+        ])
+        students = User.objects.bulk_create([
+            User(username=f'benchmark-student-{i}', name=f'Student {i}', role='student') for i in range(width)
+        ])
+        batch = []
+        for i in range(rows):
+            batch.append(StudentAssignment(
+                assignment=assignments[i // width], student=students[i % width], teacher=teacher, is_graded=i % 3 == 0,
+            ))
+            if len(batch) == batch_size:
+                StudentAssignment.objects.bulk_create(batch)
+                batch = []
+        StudentAssignment.objects.bulk_create(batch)
+        return teacher
@@ -0,0 +1,63 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from Student.services.benchmark import (
+    DEFAULT_SIZES, DEFAULT_THRESHOLDS, SEED_TEXTS, HashingEmbedder, ModelEmbedder, run_benchmark
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the plagiarism engine on synthetic classes and report precision/recall per threshold. "
+        "Runs in a throwaway test database, like manage.py test."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Class sizes to generate")
+        parser.add_argument('--thresholds', type=float, nargs='+', default=list(DEFAULT_THRESHOLDS))
+        parser.add_argument('--copy-rate', type=float, default=0.05, help="Share of answers that are re-typed copies")
+        parser.add_argument('--paraphrase-rate', type=float, default=0.1, help="Share of answers that paraphrase an earlier one")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--seed-file', help="Text file with one seed answer per paragraph (blank-line separated)")
+        parser.add_argument('--embedder', choices=['hashing', 'model'], default='hashing',
+                            help="'hashing' runs offline; 'model' uses the sentence-transformer")
+        parser.add_argument('--no-passages', action='store_true', help="Skip fingerprint passage matching")
+        parser.add_argument('--json', action='store_true', help="Print raw results as JSON")
+
+    def handle(self, *args, **options):
+        seed_texts = SEED_TEXTS
+        if options['seed_file']:
+            with open(options['seed_file'], encoding='utf-8') as f:
+                seed_texts = [p.strip() for p in f.read().split("\n\n") if p.strip()]
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmark(
+                sizes=options['sizes'],
+                embedder=ModelEmbedder() if options['embedder'] == 'model' else HashingEmbedder(),
+                thresholds=options['thresholds'],
+                copy_rate=options['copy_rate'],
+                paraphrase_rate=options['paraphrase_rate'],
+                seed=options['seed'],
+                seed_texts=seed_texts,
+                passages=not options['no_passages'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, default=float))
+            return
+
+        for result in results:
+            latency = result['latency_ms']
+            self.stdout.write(self.style.MIGRATE_HEADING(f"N = {result['n']}"))
+            self.stdout.write(
+                f"  throughput: {result['throughput']:.1f} submissions/s ({result['seconds']:.2f}s total)\n"
+                f"  latency per submission: mean {latency['mean']:.2f}ms, p50 {latency['p50']:.2f}ms, "
+                f"p95 {latency['p95']:.2f}ms, max {latency['max']:.2f}ms\n"
+                f"  true plagiarised pairs: {result['positive_pairs']}, pairs with shared passages: {result['passage_pairs']}"
+            )
+            self.stdout.write("  threshold  precision  recall")
+            for row in result['calibration']:
+                self.stdout.write(f"  {row['threshold']:>9.2f}  {row['precision']:>9.3f}  {row['recall']:>6.3f}")
@@ -0,0 +1,55 @@
+import csv
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from Teacher.models import Assignment
+from Student.services.batch_grading import BATCH_SIZE, DEFAULT_PATTERN, REPORT_FIELDS, grade_sheets
+
+
+class Command(BaseCommand):
+    help = "Grade a directory or ZIP of scanned answer sheets for an assignment and write a CSV report"
+
+    def add_arguments(self, parser):
+        parser.add_argument('assignment_id', type=int)
+        parser.add_argument('source', help="Directory or ZIP file of answer sheets (PDF or images)")
+        parser.add_argument('--pattern', default=DEFAULT_PATTERN, help="Regex matched against each file name; its 'student' group (or first group) identifies the student")
+        parser.add_argument('--match-by', choices=['username', 'email', 'id'], default='username', help="Student field the pattern's group is matched against")
+        parser.add_argument('--processes', type=int, help="Text extraction processes (default: one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Sheets saved and graded per commit")
+        parser.add_argument('--report', help="CSV report path (default: grade_batch_<assignment id>.csv)")
+
+    def handle(self, *args, **options):
+        assignment = Assignment.objects.filter(pk=options['assignment_id']).first()
+        if assignment is None:
+            raise CommandError(f"Assignment {options['assignment_id']} not found")
+        if not os.path.exists(options['source']):
+            raise CommandError(f"{options['source']} does not exist")
+
+        report_path = options['report'] or f"grade_batch_{assignment.pk}.csv"
+        counts = {}
+        with open(report_path, 'w', newline='') as report_file, tempfile.TemporaryDirectory() as workdir:
+            writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+
+            def report(rows):
+                writer.writerows(rows)
+                # Keep the report complete up to the last committed chunk
+                report_file.flush()
+                for row in rows:
+                    counts[row['status']] = counts.get(row['status'], 0) + 1
+
+            try:
+                grade_sheets(
+                    assignment, options['source'], workdir,
+                    pattern=options['pattern'],
+                    match_by=options['match_by'],
+                    processes=options['processes'],
+                    batch_size=options['batch_size'],
+                    report=report,
+                    progress=lambda done, total: self.stdout.write(f"Processed {done}/{total} sheets"),
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "no sheets found"
+        self.stdout.write(self.style.SUCCESS(f"{assignment.title}: {summary}. Report written to {report_path}"))
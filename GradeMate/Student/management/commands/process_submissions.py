@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from Student.models import StudentAssignment
+from Student.services.stages import StagedPipeline, format_stats
+
+
+class Command(BaseCommand):
+    help = "Evaluate submissions through the staged pipeline and report per-stage statistics"
+
+    def add_arguments(self, parser):
+        parser.add_argument('submission_ids', nargs='*', type=int, help="Submission ids to process")
+        parser.add_argument('--assignment', type=int, action='append', help="Process every submission of this assignment id (repeatable)")
+        parser.add_argument('--pending', action='store_true', help="Process every queued or failed submission")
+        parser.add_argument('--ocr-processes', type=int, help="Extraction processes")
+        parser.add_argument('--embed-batch-size', type=int, help="Answers per embedding call")
+        parser.add_argument('--score-workers', type=int, help="Plagiarism check and grading threads")
+        parser.add_argument('--queue-size', type=int, help="Bound of each stage's input queue")
+
+    def handle(self, *args, **options):
+        submissions = StudentAssignment.objects.none()
+        if options['submission_ids']:
+            submissions |= StudentAssignment.objects.filter(id__in=options['submission_ids'])
+        if options['assignment']:
+            submissions |= StudentAssignment.objects.filter(assignment_id__in=options['assignment'])
+        if options['pending']:
+            submissions |= StudentAssignment.objects.filter(status__in=[StudentAssignment.STATUS_QUEUED, StudentAssignment.STATUS_FAILED])
+        if not (options['submission_ids'] or options['assignment'] or options['pending']):
+            raise CommandError("Give submission ids, --assignment or --pending")
+
+        ids = list(submissions.order_by('submitted_at').values_list('id', flat=True))
+        staged = StagedPipeline(
+            ocr_processes=options['ocr_processes'],
+            embed_batch_size=options['embed_batch_size'],
+            score_workers=options['score_workers'],
+            queue_size=options['queue_size'],
+        )
+        stats = staged.run(ids)
+        for line in format_stats(stats, staged.elapsed):
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(ids)} submission(s)"))
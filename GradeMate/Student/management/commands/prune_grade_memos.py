@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from Student.services.memo import prune
+
+
+class Command(BaseCommand):
+    help = "Delete expired grade memos and trim the memo table to GRADE_MEMO['MAX_ENTRIES']"
+
+    def handle(self, *args, **options):
+        deleted = prune()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} grade memo(s)"))
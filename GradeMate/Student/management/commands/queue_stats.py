@@ -0,0 +1,26 @@
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from Student.services.jobs import queue_stats
+
+
+class Command(BaseCommand):
+    help = "Report job queue wait times per priority class"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=60, help="Window of started jobs to report on")
+        parser.add_argument('--json', action='store_true', help="Print the statistics as JSON")
+
+    def handle(self, *args, **options):
+        stats = queue_stats(since=timezone.now() - timedelta(minutes=options['minutes']))
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        self.stdout.write(f"{'class':<12} {'waiting':>8} {'oldest':>9} {'started':>8} {'mean':>8} {'p95':>8} {'max':>8}")
+        for row in stats:
+            self.stdout.write(
+                f"{row['label']:<12} {row['waiting']:>8} {row['oldest_wait']:>8.1f}s {row['started']:>8} "
+                f"{row['mean_wait']:>7.1f}s {row['p95_wait']:>7.1f}s {row['max_wait']:>7.1f}s"
+            )
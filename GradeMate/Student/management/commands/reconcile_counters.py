@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from USER.models import User
+from Student.services import teacher_stats
+from Student.services.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount every user's dashboard counters and every teacher's stats from the tables and repair any that drifted (run periodically)"
+
+    def handle(self, *args, **options):
+        repaired = reconcile(User.objects.order_by('pk').values_list('pk', flat=True))
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} user counter row(s)"))
+        repaired = teacher_stats.reconcile(User.objects.filter(role='teacher').order_by('pk').values_list('pk', flat=True))
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} teacher stats and assignment count row(s)"))
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from Teacher.models import Assignment
+from Student.services.regrade import REGRADE_BATCH_SIZE, regrade_assignment
+
+
+class Command(BaseCommand):
+    help = "Re-grade the submissions of assignments against their current answer key"
+
+    def add_arguments(self, parser):
+        parser.add_argument('assignment', type=int, nargs='+', help="Assignment id(s) to re-grade")
+        parser.add_argument('--batch-size', type=int, default=REGRADE_BATCH_SIZE, help="Submissions encoded and written per batch")
+
+    def handle(self, *args, **options):
+        assignments = Assignment.objects.in_bulk(options['assignment'])
+        missing = set(options['assignment']) - set(assignments)
+        if missing:
+            raise CommandError(f"Assignment(s) not found: {', '.join(map(str, sorted(missing)))}")
+
+        for assignment in assignments.values():
+            started = time.perf_counter()
+            count = regrade_assignment(
+                assignment,
+                batch_size=options['batch_size'],
+                progress=lambda done, total: self.stdout.write(f"  {done}/{total}"),
+            )
+            self.stdout.write(f"{assignment.title} (#{assignment.pk}): {count} submission(s) re-graded in {time.perf_counter() - started:.1f}s")
+        self.stdout.write(self.style.SUCCESS("Re-grade complete"))
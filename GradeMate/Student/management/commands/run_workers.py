@@ -0,0 +1,36 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from Student.services import tasks  # noqa: F401 - registers the task handlers
+from Student.services.jobs import work, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run background job workers against the database job queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help="Number of worker threads")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is ready instead of polling")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping workers after their current job...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        workers = [
+            threading.Thread(target=work, args=(worker_name(i), stop, options['once']), name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, options['concurrency']))
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {len(workers)} worker(s)"))
+
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=0.5)
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
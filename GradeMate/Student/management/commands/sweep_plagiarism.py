@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+from Teacher.models import Assignment
+from Student.services.plagiarism import sweep_assignment
+
+
+class Command(BaseCommand):
+    help = "Re-check every pair of submissions for assignments whose deadline has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assignment', type=int, action='append', help="Sweep only this assignment id (repeatable)")
+        parser.add_argument('--all', action='store_true', help="Also sweep assignments that were already swept after their deadline")
+
+    def handle(self, *args, **options):
+        if options['assignment']:
+            assignments = Assignment.objects.filter(id__in=options['assignment'])
+        else:
+            assignments = Assignment.objects.filter(due_date__lte=timezone.now())
+            if not options['all']:
+                # Not swept yet, or last swept before the deadline passed
+                assignments = assignments.filter(
+                    Q(plagiarism_swept_at__isnull=True) | Q(plagiarism_swept_at__lt=F('due_date'))
+                )
+
+        for assignment in assignments:
+            matches = sweep_assignment(assignment)
+            self.stdout.write(f"{assignment.title} (#{assignment.pk}): {matches} matching pair(s)")
+        self.stdout.write(self.style.SUCCESS("Plagiarism sweep complete"))
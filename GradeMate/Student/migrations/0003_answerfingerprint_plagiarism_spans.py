@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0002_studentassignment'),
+        ('Teacher', '0002_classroom_subject_assignment_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='plagiarism_spans',
+            field=models.JSONField(blank=True, default=list, help_text='Passages overlapping other submissions, stored when the plagiarism check runs'),
+        ),
+        migrations.CreateModel(
+            name='AnswerFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.BigIntegerField()),
+                ('position', models.PositiveIntegerField(help_text='Index of the k-gram in the answer')),
+                ('start', models.PositiveIntegerField(help_text='Character offset where the k-gram starts')),
+                ('end', models.PositiveIntegerField(help_text='Character offset where the k-gram ends')),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_fingerprints', to='Teacher.assignment')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='Student.studentassignment')),
+            ],
+            options={
+                'verbose_name': 'Answer Fingerprint',
+                'verbose_name_plural': 'Answer Fingerprints',
+                'indexes': [models.Index(fields=['assignment', 'hash'], name='fingerprint_assignment_hash')],
+            },
+        ),
+    ]
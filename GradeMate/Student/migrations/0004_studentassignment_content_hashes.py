@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:51
+
+import hashlib
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_content_hashes(apps, schema_editor):
+    StudentAssignment = apps.get_model('Student', 'StudentAssignment')
+    for submission in StudentAssignment.objects.all().iterator():
+        normalized = " ".join((submission.answer_text or "").split()).casefold()
+        if normalized:
+            submission.text_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        if submission.file:
+            try:
+                path = submission.file.path
+                if os.path.exists(path):
+                    digest = hashlib.sha256()
+                    with open(path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(65536), b''):
+                            digest.update(chunk)
+                    submission.file_hash = digest.hexdigest()
+            except Exception:
+                pass
+        submission.save(update_fields=['text_hash', 'file_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0003_answerfingerprint_plagiarism_spans'),
+        ('Teacher', '0002_classroom_subject_assignment_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Earlier submission with identical text or file', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='Student.studentassignment'),
+        ),
+        migrations.AddField(
+            model_name='studentassignment',
+            name='file_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of the uploaded file', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='studentassignment',
+            name='text_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of the normalized answer text', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='studentassignment',
+            index=models.Index(fields=['assignment', 'text_hash'], name='submission_text_hash'),
+        ),
+        migrations.AddIndex(
+            model_name='studentassignment',
+            index=models.Index(fields=['assignment', 'file_hash'], name='submission_file_hash'),
+        ),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+    ]
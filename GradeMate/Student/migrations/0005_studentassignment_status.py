@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0004_studentassignment_content_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('extracting', 'Extracting text'), ('checking', 'Checking for plagiarism'), ('grading', 'Grading'), ('done', 'Done'), ('failed', 'Failed')], default='done', help_text='Background processing stage', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='studentassignment',
+            name='status_message',
+            field=models.CharField(blank=True, help_text='Explanation shown to the student for the current status', max_length=255),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0005_studentassignment_status'),
+        ('Teacher', '0003_assignment_plagiarism_swept_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='embedding',
+            field=models.BinaryField(blank=True, help_text='float32 embedding of the answer text', null=True),
+        ),
+        migrations.AddField(
+            model_name='studentassignment',
+            name='embedding_hash',
+            field=models.CharField(blank=True, editable=False, help_text='text_hash the stored embedding was computed from', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='PlagiarismPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similarity', models.FloatField(help_text='Cosine similarity of the stored answer embeddings')),
+                ('is_match', models.BooleanField(default=False, help_text='Similarity is above the plagiarism threshold')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plagiarism_pairs', to='Teacher.assignment')),
+                ('first', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Student.studentassignment')),
+                ('second', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Student.studentassignment')),
+            ],
+            options={
+                'verbose_name': 'Plagiarism Pair',
+                'verbose_name_plural': 'Plagiarism Pairs',
+                'indexes': [models.Index(fields=['assignment', 'is_match'], name='plagiarism_pair_match')],
+                'constraints': [models.UniqueConstraint(fields=('first', 'second'), name='unique_plagiarism_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0006_plagiarismpair_embeddings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Registered task name', max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Keyword arguments for the task')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('dead', 'Dead (retries exhausted)')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, help_text='Not claimed before this time (used for retry backoff)')),
+                ('locked_by', models.CharField(blank=True, help_text='Worker holding the lease', max_length=100)),
+                ('locked_until', models.DateTimeField(blank=True, help_text='Lease expiry; an expired running job can be reclaimed', null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ['run_after', 'id'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='job_ready'), models.Index(fields=['status', 'locked_until'], name='job_lease')],
+            },
+        ),
+    ]
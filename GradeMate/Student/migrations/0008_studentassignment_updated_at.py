@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0007_job'),
+        ('Teacher', '0003_assignment_plagiarism_swept_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Last change; the cursor for live progress streams'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='studentassignment',
+            index=models.Index(fields=['assignment', 'updated_at'], name='submission_updated'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0008_studentassignment_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_ready',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='fair_key',
+            field=models.CharField(blank=True, help_text='Fair-share group, e.g. classroom:12 or teacher:3', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Interactive'), (5, 'Normal'), (9, 'Background')], default=5),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='wait_seconds',
+            field=models.FloatField(default=0, help_text='Time spent ready but unclaimed, summed over attempts'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'priority', 'run_after'], name='job_ready'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['fair_key', 'started_at'], name='job_fair_share'),
+        ),
+    ]
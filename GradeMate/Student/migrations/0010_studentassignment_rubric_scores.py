@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0009_job_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='rubric_scores',
+            field=models.JSONField(blank=True, default=list, help_text='Points awarded per rubric criterion when graded with a rubric'),
+        ),
+    ]
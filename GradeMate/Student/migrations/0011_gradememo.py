@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0010_studentassignment_rubric_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeMemo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_hash', models.CharField(help_text='SHA-256 of the normalized key answer or rubric', max_length=64)),
+                ('answer_hash', models.CharField(help_text='SHA-256 of the normalized answer text', max_length=64)),
+                ('engine_version', models.CharField(max_length=150)),
+                ('similarity', models.FloatField(blank=True, help_text='Answer/key similarity (whole-answer grading)', null=True)),
+                ('point_similarities', models.JSONField(blank=True, default=list, help_text='Best sentence similarity per rubric point')),
+                ('feedback', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Grade Memo',
+                'verbose_name_plural': 'Grade Memos',
+                'indexes': [models.Index(fields=['last_used_at'], name='grade_memo_last_used')],
+                'constraints': [models.UniqueConstraint(fields=('key_hash', 'answer_hash', 'engine_version'), name='unique_grade_memo')],
+            },
+        ),
+    ]
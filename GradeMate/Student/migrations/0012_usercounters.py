@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0011_gradememo'),
+        ('USER', '0002_user_class_grade_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_notifications', models.IntegerField(default=0)),
+                ('pending_assignments', models.IntegerField(default=0, help_text='Visible assignments the student has not submitted')),
+                ('ungraded_submissions', models.IntegerField(default=0, help_text="Submissions to the teacher's assignments awaiting a grade")),
+                ('stale', models.BooleanField(default=False, help_text='Recount on the next read')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Counters',
+                'verbose_name_plural': 'User Counters',
+            },
+        ),
+    ]
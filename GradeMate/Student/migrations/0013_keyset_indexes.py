@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_teachers(apps, schema_editor):
+    StudentAssignment = apps.get_model('Student', 'StudentAssignment')
+    Assignment = apps.get_model('Teacher', 'Assignment')
+    StudentAssignment.objects.update(
+        teacher_id=Subquery(Assignment.objects.filter(pk=OuterRef('assignment_id')).values('teacher_id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0012_usercounters'),
+        ('Teacher', '0006_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentassignment',
+            name='teacher',
+            field=models.ForeignKey(editable=False, help_text="The assignment's teacher, copied so a teacher's submissions can be listed from one index", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_submissions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_teachers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='studentassignment',
+            index=models.Index(fields=['teacher', 'submitted_at', 'id'], name='submission_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='studentassignment',
+            index=models.Index(condition=models.Q(('is_graded', True)), fields=['student', 'evaluated_at', 'id'], name='result_keyset'),
+        ),
+    ]
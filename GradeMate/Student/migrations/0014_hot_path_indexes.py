@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0013_keyset_indexes'),
+        ('Teacher', '0007_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentassignment',
+            index=models.Index(condition=models.Q(('is_graded', False)), fields=['teacher', 'assignment'], name='submission_pending'),
+        ),
+    ]
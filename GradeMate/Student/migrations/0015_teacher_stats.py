@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0014_hot_path_indexes'),
+        ('USER', '0002_user_class_grade_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherStats',
+            fields=[
+                ('teacher', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='teacher_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('assignments', models.IntegerField(default=0)),
+                ('active_assignments', models.IntegerField(default=0)),
+                ('students', models.IntegerField(default=0, help_text="Students in the classrooms of the teacher's active assignments")),
+                ('graded_submissions', models.IntegerField(default=0)),
+                ('graded_score', models.DecimalField(decimal_places=2, default=0, help_text='Total score of the graded submissions', max_digits=14)),
+                ('graded_max_score', models.DecimalField(decimal_places=2, default=0, help_text='Total maximum score of the graded submissions', max_digits=14)),
+                ('stale', models.BooleanField(default=False, help_text='Recount on the next read')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Teacher Stats',
+                'verbose_name_plural': 'Teacher Stats',
+            },
+        ),
+    ]
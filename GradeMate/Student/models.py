@@ -1,7 +1,9 @@
 from django.db import models
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
 from USER.models import User
 from Teacher.models import Question, Assignment
+from .services.hashing import text_hash, file_hash
 
 # Create your models here.
 
@@ -28,8 +30,24 @@ class StudentAnswer(models.Model):
 
 class StudentAssignment(models.Model):
     """Student submission for assignments - supports file uploads"""
+    STATUS_QUEUED = 'queued'
+    STATUS_EXTRACTING = 'extracting'
+    STATUS_CHECKING = 'checking'
+    STATUS_GRADING = 'grading'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_EXTRACTING, 'Extracting text'),
+        (STATUS_CHECKING, 'Checking for plagiarism'),
+        (STATUS_GRADING, 'Grading'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    
     assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='submissions')
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assignment_submissions', limit_choices_to={'role': 'student'})
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, null=True, editable=False, related_name='received_submissions', help_text="The assignment's teacher, copied so a teacher's submissions can be listed from one index")
     file = models.FileField(
         upload_to='assignments/submissions/',
         blank=True,
@@ -40,16 +58,238 @@ class StudentAssignment(models.Model):
     answer_text = models.TextField(blank=True, help_text="Answer text (extracted from file or manually entered)")
     score = models.DecimalField(max_digits=5, decimal_places=2, default=0.0, help_text="Score received")
     feedback = models.TextField(blank=True, help_text="AI-generated feedback")
+    rubric_scores = models.JSONField(default=list, blank=True, help_text="Points awarded per rubric criterion when graded with a rubric")
     submitted_at = models.DateTimeField(auto_now_add=True)
     evaluated_at = models.DateTimeField(null=True, blank=True)
     is_graded = models.BooleanField(default=False)
     plagiarism = models.BooleanField(default=False, help_text="Plagiarism detected")
+    plagiarism_spans = models.JSONField(default=list, blank=True, help_text="Passages overlapping other submissions, stored when the plagiarism check runs")
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates', help_text="Earlier submission with identical text or file")
+    text_hash = models.CharField(max_length=64, blank=True, editable=False, help_text="SHA-256 of the normalized answer text")
+    embedding = models.BinaryField(null=True, blank=True, editable=False, help_text="float32 embedding of the answer text")
+    embedding_hash = models.CharField(max_length=64, blank=True, editable=False, help_text="text_hash the stored embedding was computed from")
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=STATUS_DONE, help_text="Background processing stage")
+    status_message = models.CharField(max_length=255, blank=True, help_text="Explanation shown to the student for the current status")
+    file_hash = models.CharField(max_length=64, blank=True, editable=False, help_text="SHA-256 of the uploaded file")
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last change; the cursor for live progress streams")
     
     class Meta:
         ordering = ['-submitted_at']
         verbose_name = "Student Assignment"
         verbose_name_plural = "Student Assignments"
         unique_together = ['assignment', 'student']
+        indexes = [
+            models.Index(fields=['assignment', 'text_hash'], name='submission_text_hash'),
+            models.Index(fields=['assignment', 'file_hash'], name='submission_file_hash'),
+            models.Index(fields=['assignment', 'updated_at'], name='submission_updated'),
+            # Keyset pagination (services/pagination.py) of submissions and results
+            models.Index(fields=['teacher', 'submitted_at', 'id'], name='submission_keyset'),
+            models.Index(fields=['student', 'evaluated_at', 'id'], condition=models.Q(is_graded=True), name='result_keyset'),
+            # Work awaiting a grade, per teacher and assignment. Boolean filters
+            # compile to a bare column that SQLite cannot seek on, so flags are
+            # index conditions rather than columns
+            models.Index(fields=['teacher', 'assignment'], condition=models.Q(is_graded=False), name='submission_pending'),
+        ]
     
     def __str__(self):
         return f"{self.student.name} - {self.assignment.title} - Score: {self.score}/{self.assignment.max_score}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Grading state as stored, so saves can tell the counters
+        # (services/counters.py) what changed
+        if 'is_graded' in field_names:
+            instance._stored_is_graded = instance.is_graded
+        if 'score' in field_names:
+            instance._stored_score = instance.score
+        return instance
+    
+    @property
+    def is_processing(self):
+        return self.status not in (self.STATUS_DONE, self.STATUS_FAILED)
+    
+    def save(self, *args, **kwargs):
+        if self.teacher_id is None and self.assignment_id is not None:
+            self.teacher_id = self.assignment.teacher_id
+        # Keep the content hashes in step with the text and file they describe
+        self.text_hash = text_hash(self.answer_text)
+        if not self.file:
+            self.file_hash = ""
+        elif not self.file._committed:
+            self.file_hash = file_hash(self.file)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'updated_at'}
+            if 'answer_text' in update_fields:
+                update_fields.add('text_hash')
+            if 'file' in update_fields:
+                update_fields.add('file_hash')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+
+class PlagiarismPair(models.Model):
+    """Similarity between two submissions to the same assignment; first always has the lower id"""
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='plagiarism_pairs')
+    first = models.ForeignKey(StudentAssignment, on_delete=models.CASCADE, related_name='+')
+    second = models.ForeignKey(StudentAssignment, on_delete=models.CASCADE, related_name='+')
+    similarity = models.FloatField(help_text="Cosine similarity of the stored answer embeddings")
+    is_match = models.BooleanField(default=False, help_text="Similarity is above the plagiarism threshold")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Plagiarism Pair"
+        verbose_name_plural = "Plagiarism Pairs"
+        constraints = [
+            models.UniqueConstraint(fields=['first', 'second'], name='unique_plagiarism_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['assignment', 'is_match'], name='plagiarism_pair_match'),
+        ]
+    
+    def __str__(self):
+        return f"Submissions {self.first_id} & {self.second_id}: {self.similarity:.2f}"
+
+
+class AnswerFingerprint(models.Model):
+    """Winnowed k-gram hash of a submission's answer text, indexed per assignment"""
+    submission = models.ForeignKey(StudentAssignment, on_delete=models.CASCADE, related_name='fingerprints')
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='answer_fingerprints')
+    hash = models.BigIntegerField()
+    position = models.PositiveIntegerField(help_text="Index of the k-gram in the answer")
+    start = models.PositiveIntegerField(help_text="Character offset where the k-gram starts")
+    end = models.PositiveIntegerField(help_text="Character offset where the k-gram ends")
+    
+    class Meta:
+        verbose_name = "Answer Fingerprint"
+        verbose_name_plural = "Answer Fingerprints"
+        indexes = [
+            models.Index(fields=['assignment', 'hash'], name='fingerprint_assignment_hash'),
+        ]
+    
+    def __str__(self):
+        return f"Submission {self.submission_id} @ {self.start}-{self.end}"
+
+
+class Job(models.Model):
+    """Background job stored in the database and run by manage.py run_workers"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_DEAD, 'Dead (retries exhausted)'),
+    )
+    # Lower runs first
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_BACKGROUND = 9
+    PRIORITY_CHOICES = (
+        (PRIORITY_INTERACTIVE, 'Interactive'),
+        (PRIORITY_NORMAL, 'Normal'),
+        (PRIORITY_BACKGROUND, 'Background'),
+    )
+    
+    name = models.CharField(max_length=100, help_text="Registered task name")
+    payload = models.JSONField(default=dict, blank=True, help_text="Keyword arguments for the task")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_NORMAL)
+    fair_key = models.CharField(max_length=50, blank=True, help_text="Fair-share group, e.g. classroom:12 or teacher:3")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not claimed before this time (used for retry backoff)")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker holding the lease")
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Lease expiry; an expired running job can be reclaimed")
+    last_error = models.TextField(blank=True)
+    wait_seconds = models.FloatField(default=0, help_text="Time spent ready but unclaimed, summed over attempts")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run_after', 'id']
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_after'], name='job_ready'),
+            models.Index(fields=['status', 'locked_until'], name='job_lease'),
+            models.Index(fields=['fair_key', 'started_at'], name='job_fair_share'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class GradeMemo(models.Model):
+    """Grading result memoized by (normalized key hash, normalized answer hash, scoring engine version)"""
+    key_hash = models.CharField(max_length=64, help_text="SHA-256 of the normalized key answer or rubric")
+    answer_hash = models.CharField(max_length=64, help_text="SHA-256 of the normalized answer text")
+    engine_version = models.CharField(max_length=150)
+    similarity = models.FloatField(null=True, blank=True, help_text="Answer/key similarity (whole-answer grading)")
+    point_similarities = models.JSONField(default=list, blank=True, help_text="Best sentence similarity per rubric point")
+    feedback = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = "Grade Memo"
+        verbose_name_plural = "Grade Memos"
+        constraints = [
+            models.UniqueConstraint(fields=['key_hash', 'answer_hash', 'engine_version'], name='unique_grade_memo'),
+        ]
+        indexes = [
+            models.Index(fields=['last_used_at'], name='grade_memo_last_used'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key_hash[:8]}/{self.answer_hash[:8]} ({self.engine_version})"
+
+
+class UserCounters(models.Model):
+    """Dashboard counts of one user, kept current by services/counters.py instead of counted on every page load"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    unread_notifications = models.IntegerField(default=0)
+    pending_assignments = models.IntegerField(default=0, help_text="Visible assignments the student has not submitted")
+    ungraded_submissions = models.IntegerField(default=0, help_text="Submissions to the teacher's assignments awaiting a grade")
+    stale = models.BooleanField(default=False, help_text="Recount on the next read")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "User Counters"
+        verbose_name_plural = "User Counters"
+    
+    def __str__(self):
+        return f"Counters of user {self.user_id}"
+
+
+
+class TeacherStats(models.Model):
+    """Dashboard statistics of one teacher, kept as running totals by services/teacher_stats.py"""
+    teacher = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='teacher_stats')
+    assignments = models.IntegerField(default=0)
+    active_assignments = models.IntegerField(default=0)
+    students = models.IntegerField(default=0, help_text="Students in the classrooms of the teacher's active assignments")
+    graded_submissions = models.IntegerField(default=0)
+    graded_score = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Total score of the graded submissions")
+    graded_max_score = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Total maximum score of the graded submissions")
+    stale = models.BooleanField(default=False, help_text="Recount on the next read")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Teacher Stats"
+        verbose_name_plural = "Teacher Stats"
+    
+    def __str__(self):
+        return f"Stats of teacher {self.teacher_id}"
+    
+    @property
+    def average_percentage(self):
+        """Average grade as total score over total maximum score, or None before anything is graded"""
+        if not self.graded_max_score:
+            return None
+        return round(float(self.graded_score) / float(self.graded_max_score) * 100, 1)
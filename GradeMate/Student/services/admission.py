@@ -0,0 +1,185 @@
+"""
+Admission control for model inference.
+
+OCR and the embedding model are CPU-heavy and multi-threaded, so running
+many calls at once only oversubscribes the CPU and memory until everyone
+times out. Each resource ('ocr', 'embedding') gets a limiter: at most
+CONCURRENCY calls run at once, at most QUEUE_SIZE more wait for a slot, for
+up to QUEUE_TIMEOUT seconds. A web request that finds the queue full (or
+waits too long) gets Overloaded, which AdmissionControlMixin turns into a
+fast 503 with a Retry-After header.
+
+Background jobs take slots like everyone else but wait as long as needed
+instead of being rejected; their number is already bounded by the worker
+count.
+
+Admissions, rejections, concurrency and queue wait are counted per resource
+and endpoint (the view or job that made the call); see admission_stats().
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.http import HttpResponse
+
+_DEFAULTS = {
+    'OCR_CONCURRENCY': 1,
+    'OCR_QUEUE_SIZE': 4,
+    'EMBEDDING_CONCURRENCY': 2,
+    'EMBEDDING_QUEUE_SIZE': 16,
+    'QUEUE_TIMEOUT': 10,
+    'RETRY_AFTER': 5,
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_local = threading.local()
+
+
+def admission_setting(name):
+    return getattr(settings, 'ADMISSION_CONTROL', {}).get(name, _DEFAULTS[name])
+
+
+class Overloaded(Exception):
+    """Raised when a resource's wait queue is full or the wait timed out."""
+
+    def __init__(self, resource, retry_after):
+        super().__init__(f"The {resource} service is busy. Please try again in {retry_after} seconds.")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """At most concurrency callers at once, at most queue_size more waiting."""
+
+    def __init__(self, name, concurrency, queue_size, timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+        self._metrics = {}
+
+    def _endpoint_metrics(self, endpoint):
+        if endpoint not in self._metrics:
+            self._metrics[endpoint] = {
+                "admitted": 0, "rejected": 0, "active": 0, "peak_active": 0,
+                "waiting": 0, "total_wait": 0.0, "max_wait": 0.0,
+            }
+        return self._metrics[endpoint]
+
+    @contextmanager
+    def admit(self, endpoint, background=False):
+        started = time.monotonic()
+        with self._condition:
+            metrics = self._endpoint_metrics(endpoint)
+            if self.active >= self.concurrency:
+                if not background and self.waiting >= self.queue_size:
+                    metrics["rejected"] += 1
+                    raise Overloaded(self.name, admission_setting('RETRY_AFTER'))
+                self.waiting += 1
+                metrics["waiting"] += 1
+                try:
+                    deadline = None if background else started + self.timeout
+                    while self.active >= self.concurrency:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            metrics["rejected"] += 1
+                            raise Overloaded(self.name, admission_setting('RETRY_AFTER'))
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    metrics["waiting"] -= 1
+            wait = time.monotonic() - started
+            self.active += 1
+            metrics["admitted"] += 1
+            metrics["active"] += 1
+            metrics["peak_active"] = max(metrics["peak_active"], metrics["active"])
+            metrics["total_wait"] += wait
+            metrics["max_wait"] = max(metrics["max_wait"], wait)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.active -= 1
+                metrics["active"] -= 1
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "resource": self.name,
+                "concurrency": self.concurrency,
+                "queue_size": self.queue_size,
+                "active": self.active,
+                "waiting": self.waiting,
+                "endpoints": {
+                    endpoint: dict(metrics, mean_wait=metrics["total_wait"] / metrics["admitted"] if metrics["admitted"] else 0.0)
+                    for endpoint, metrics in self._metrics.items()
+                },
+            }
+
+
+def get_limiter(resource):
+    with _limiters_lock:
+        if resource not in _limiters:
+            prefix = resource.upper()
+            _limiters[resource] = Limiter(
+                resource,
+                admission_setting(f'{prefix}_CONCURRENCY'),
+                admission_setting(f'{prefix}_QUEUE_SIZE'),
+                admission_setting('QUEUE_TIMEOUT'),
+            )
+        return _limiters[resource]
+
+
+@contextmanager
+def endpoint(name, background=False):
+    """Attribute inference calls made inside the block to the named endpoint."""
+    previous = getattr(_local, 'endpoint', None)
+    _local.endpoint = (name, background)
+    try:
+        yield
+    finally:
+        _local.endpoint = previous
+
+
+def limited(resource):
+    """Decorator running the function under the resource's limiter."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            name, background = getattr(_local, 'endpoint', None) or ('other', False)
+            with get_limiter(resource).admit(name, background):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def admission_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def overloaded_response(exc):
+    response = HttpResponse(str(exc), status=503, content_type='text/plain')
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+class AdmissionControlMixin:
+    """
+    View mixin: inference calls made while handling the request are counted
+    under the view's name, and a busy model answers 503 with Retry-After.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with endpoint(type(self).__name__):
+            try:
+                return super().dispatch(request, *args, **kwargs)
+            except Overloaded as exc:
+                return overloaded_response(exc)
@@ -1,3 +1,4 @@
+from .admission import Overloaded
 from .ocr import get_embedding, cosine_similarity
 
 def evaluate_answer(model_answer, student_answer):
@@ -24,6 +25,9 @@ def evaluate_answer(model_answer, student_answer):
         try:
             emb_student = get_embedding(student_answer)
             emb_model = get_embedding(model_answer)
+        except Overloaded:
+            # Callers answer busy models with a retry, not a zero score
+            raise
         except Exception as e:
             print(f"❌ Error getting embeddings: {e}")
             return {
@@ -33,27 +37,10 @@ def evaluate_answer(model_answer, student_answer):
         
         # Calculate cosine similarity (returns value between 0 and 1)
         similarity = cosine_similarity(emb_student, emb_model)
+        return evaluate_similarity(similarity)
         
-        # Convert similarity (0-1) to score (0-10)
-        score = similarity * 10
-        
-        # Round to 1 decimal place
-        score = round(score, 1)
-        
-        # Ensure score is within bounds
-        if score < 0:
-            score = 0.0
-        elif score > 10:
-            score = 10.0
-        
-        # Generate feedback based on score
-        feedback = generate_feedback(score, similarity)
-        
-        return {
-            "score": score,
-            "feedback": feedback
-        }
-        
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"❌ Error during evaluation: {e}")
         return {
@@ -62,6 +49,26 @@ def evaluate_answer(model_answer, student_answer):
         }
 
 
+def evaluate_similarity(similarity):
+    """
+    Turn a student/model answer similarity into the 'score' (0-10) and
+    'feedback' dictionary returned by evaluate_answer.
+    """
+    # Convert similarity (0-1) to score (0-10), rounded to 1 decimal place
+    score = round(similarity * 10, 1)
+    
+    # Ensure score is within bounds
+    if score < 0:
+        score = 0.0
+    elif score > 10:
+        score = 10.0
+    
+    return {
+        "score": score,
+        "feedback": generate_feedback(score, similarity)
+    }
+
+
 def generate_feedback(score, similarity):
     """
     Generate constructive feedback based on the score and similarity.
@@ -76,3 +83,25 @@ def generate_feedback(score, similarity):
         return f"Your answer needs improvement (similarity: {similarity:.1%}). It only partially addresses the question. Please review the material and provide a more complete response."
     else:
         return f"Your answer doesn't align well with the expected response (similarity: {similarity:.1%}). Please review the topic thoroughly and provide a more accurate and complete answer."
+
+
+def rubric_feedback(breakdown):
+    """
+    Generate feedback listing the rubric points that were fully covered,
+    partially covered and missed.
+    """
+    def describe(points):
+        return "; ".join(point["point"] if len(point["point"]) <= 80 else point["point"][:77] + "..." for point in points)
+    
+    covered = [point for point in breakdown if point["awarded"] >= point["weight"]]
+    partial = [point for point in breakdown if 0 < point["awarded"] < point["weight"]]
+    missing = [point for point in breakdown if point["awarded"] <= 0]
+    
+    if not partial and not missing:
+        return f"Excellent work! Your answer covers all {len(breakdown)} rubric points."
+    feedback = f"Your answer fully covers {len(covered)} of {len(breakdown)} rubric points."
+    if partial:
+        feedback += f" Develop these points further: {describe(partial)}."
+    if missing:
+        feedback += f" Your answer does not address: {describe(missing)}."
+    return feedback
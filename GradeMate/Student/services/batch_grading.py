@@ -0,0 +1,312 @@
+"""
+Offline grading of scanned answer sheets (manage.py grade_batch).
+
+A directory or ZIP of answer files is mapped to students by a filename
+pattern, text is extracted in a pool of processes, and each chunk of sheets
+is saved and graded together: new submissions with bulk_create, existing
+ones with bulk_update, and all answers of the chunk embedded in one batch.
+Every answer then gets the same plagiarism checks as an online submission
+(exact duplicates, passage fingerprints, similarity pairs, which also
+clear what a re-imported sheet's old answer left behind), and the answers
+that pass are scored together (regrade.grade_submissions).
+
+Every chunk commits on its own, so an interrupted run can simply be started
+again: a sheet whose file hash matches a submission that is already graded
+is reported as unchanged and not extracted or graded twice.
+"""
+import multiprocessing
+import os
+import re
+import shutil
+import zipfile
+import django
+import numpy as np
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from Student.models import StudentAssignment
+from USER.models import User
+from .counters import record_grading, record_new_submissions
+from .grading import get_grading_context
+from .hashing import file_hash, text_hash
+from .ocr import extract_text_from_file, get_embeddings
+from .plagiarism import find_exact_duplicate, record_passage_matches, refresh_plagiarism_flags, update_plagiarism_pairs
+from .regrade import grade_submissions
+
+# "jdoe.pdf", "jdoe_page1.png", "jdoe - exam.jpg" all belong to jdoe
+DEFAULT_PATTERN = r"^(?P<student>[^_.\s]+)"
+SHEET_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.webp')
+BATCH_SIZE = 50
+
+REPORT_FIELDS = ['file', 'student', 'status', 'score', 'max_score', 'message']
+
+PLAGIARISED_MESSAGE = 'Submission rejected because it matches another student\'s submission. Please submit your own work.'
+
+
+def collect_sheets(source, workdir):
+    """
+    Return the answer files in a directory (recursively) or ZIP as sorted
+    (name, path) pairs. ZIP members are extracted under workdir.
+    """
+    sheets = []
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for index, member in enumerate(archive.infolist()):
+                name = os.path.basename(member.filename)
+                if member.is_dir() or name.startswith('.') or '__MACOSX' in member.filename:
+                    continue
+                if not name.lower().endswith(SHEET_EXTENSIONS):
+                    continue
+                # Only the base name is kept, so members cannot escape workdir
+                path = os.path.join(workdir, f"{index}-{name}")
+                with archive.open(member) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                sheets.append((name, path))
+    elif os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in files:
+                if not name.startswith('.') and name.lower().endswith(SHEET_EXTENSIONS):
+                    sheets.append((name, os.path.join(root, name)))
+    else:
+        raise ValueError(f"{source} is neither a directory nor a ZIP file")
+    return sorted(sheets)
+
+
+def match_students(sheets, pattern=DEFAULT_PATTERN, match_by='username'):
+    """
+    Map each sheet to a student through the pattern's "student" group (or
+    its first group), looked up by username, email or id in one query.
+    Returns (matched [(name, path, student)], unmatched [(name, reason)]).
+    """
+    regex = re.compile(pattern)
+    keys = {}
+    unmatched = []
+    for name, path in sheets:
+        match = regex.search(name)
+        key = None
+        if match:
+            key = match.groupdict().get('student') or (match.group(1) if regex.groups else match.group(0))
+        if not key:
+            unmatched.append((name, 'File name does not match the pattern'))
+            continue
+        key = key.strip()
+        if match_by == 'id' and key.isdigit():
+            # 007_sheet.pdf is student 7
+            key = str(int(key))
+        keys[(name, path)] = key
+
+    lookup = keys.values()
+    if match_by == 'id':
+        lookup = [int(key) for key in lookup if key.isdigit()]
+    students = User.objects.filter(role='student', **{f'{match_by}__in': lookup})
+    by_key = {str(getattr(student, match_by)): student for student in students}
+
+    matched = []
+    seen = set()
+    for (name, path), key in keys.items():
+        student = by_key.get(key)
+        if student is None:
+            unmatched.append((name, f'No student with {match_by} "{key}"'))
+        elif student.pk in seen:
+            unmatched.append((name, f'Another file already belongs to {key}'))
+        else:
+            seen.add(student.pk)
+            matched.append((name, path, student))
+    return matched, unmatched
+
+
+def sheet_hash(path):
+    with open(path, 'rb') as sheet:
+        return file_hash(File(sheet))
+
+
+def _extract_sheet(path):
+    """Pool task: (text, error) for one sheet, so one bad file cannot stop the pool."""
+    try:
+        return extract_text_from_file(path), ''
+    except Exception as e:
+        return '', str(e)
+
+
+def _report_row(name, student, status, score=None, max_score=None, message=''):
+    return {
+        'file': name,
+        'student': student.username if student else '',
+        'status': status,
+        'score': '' if score is None else score,
+        'max_score': '' if max_score is None else max_score,
+        'message': message,
+    }
+
+
+def _store_sheet(path, name):
+    with open(path, 'rb') as sheet:
+        return default_storage.save(f"assignments/submissions/{name}", File(sheet))
+
+
+def _check_plagiarism(submissions):
+    """
+    Run the online plagiarism checks on freshly saved submissions: exact
+    duplicates first, then passage fingerprints and similarity pairs from
+    one batched embedding. Flagged submissions get plagiarism set and the
+    rejection message.
+    """
+    with_text = [submission for submission in submissions if submission.text_hash]
+    stale = [submission for submission in with_text if submission.embedding is None or submission.embedding_hash != submission.text_hash]
+    if stale:
+        for submission, vector in zip(stale, get_embeddings([submission.answer_text for submission in stale])):
+            submission.embedding = np.asarray(vector, dtype=np.float32).tobytes()
+            submission.embedding_hash = submission.text_hash
+        StudentAssignment.objects.bulk_update(stale, ['embedding', 'embedding_hash'])
+
+    unchecked = {submission.pk for submission in submissions}
+    for submission in submissions:
+        unchecked.discard(submission.pk)
+        # An empty answer still drops the fingerprints and pairs of the old one
+        record_passage_matches(submission)
+        duplicate_id = find_exact_duplicate(submission)
+        if duplicate_id in unchecked:
+            # Within a chunk the later sheet is the copy, as if submitted in turn
+            duplicate_id = None
+        if duplicate_id:
+            submission.duplicate_of_id = duplicate_id
+            submission.save(update_fields=['duplicate_of'])
+        if update_plagiarism_pairs(submission) or duplicate_id:
+            submission.plagiarism = True
+            submission.status_message = PLAGIARISED_MESSAGE
+            submission.save(update_fields=['plagiarism', 'status_message'])
+
+
+def _save_chunk(assignment, context, chunk, existing):
+    """
+    Create or update the chunk's submissions, check them for plagiarism and
+    grade the ones with text that passed. chunk holds (name, path, student,
+    digest, text, error). Returns report rows.
+    """
+    now = timezone.now()
+    created, updated, stored_files, replaced_files = [], [], [], []
+    previous_duplicates = set()
+    rows = {}
+    try:
+        for name, path, student, digest, text, error in chunk:
+            submission = existing.get(student.pk) or StudentAssignment(assignment=assignment, student=student, teacher_id=assignment.teacher_id)
+            if submission.file:
+                replaced_files.append(submission.file.name)
+            if submission.duplicate_of_id:
+                previous_duplicates.add(submission.duplicate_of_id)
+            submission.file = _store_sheet(path, name)
+            stored_files.append(submission.file.name)
+            submission.file_hash = digest
+            submission.answer_text = text.strip()
+            submission.text_hash = text_hash(submission.answer_text)
+            submission.score = 0
+            submission.feedback = ''
+            submission.rubric_scores = []
+            submission.is_graded = False
+            submission.evaluated_at = None
+            submission.plagiarism = False
+            submission.duplicate_of = None
+            submission.status = StudentAssignment.STATUS_DONE
+            submission.updated_at = now
+            if error:
+                submission.status = StudentAssignment.STATUS_FAILED
+                submission.status_message = f'Could not extract text from file: {error}. Please enter text manually.'
+            elif not submission.answer_text:
+                submission.status_message = 'Automatic grading requires text content. Please ensure your file contains text or enter text manually.'
+            elif not context.has_key:
+                submission.status_message = 'Automatic grading is not available as no answer key is provided.'
+            else:
+                submission.status_message = ''
+            (updated if submission.pk else created).append(submission)
+            rows[student.pk] = name
+
+        with transaction.atomic():
+            StudentAssignment.objects.bulk_create(created)
+            StudentAssignment.objects.bulk_update(updated, [
+                'file', 'file_hash', 'answer_text', 'text_hash', 'score', 'feedback', 'rubric_scores', 'is_graded',
+                'evaluated_at', 'plagiarism', 'duplicate_of', 'status', 'status_message', 'updated_at',
+            ])
+            # bulk writes send no signals, so the counters are told here
+            record_new_submissions(assignment.pk, created)
+            record_grading(assignment.pk, updated)
+            # The submissions an old answer copied are no longer matched by it
+            refresh_plagiarism_flags(previous_duplicates)
+            _check_plagiarism(created + updated)
+            # Answers with no message left are the ones with text, a key and no match
+            gradable = [submission for submission in created + updated if not submission.status_message]
+            if gradable:
+                grade_submissions(context, gradable)
+    except Exception:
+        # Sheets stored for this chunk have no row pointing at them any more
+        for file_name in stored_files:
+            default_storage.delete(file_name)
+        raise
+    for file_name in replaced_files:
+        default_storage.delete(file_name)
+
+    report = []
+    for submission in created + updated:
+        if submission.plagiarism:
+            status = 'plagiarised'
+        elif submission.is_graded:
+            status = 'graded'
+        else:
+            status = 'failed' if submission.status == StudentAssignment.STATUS_FAILED else 'not graded'
+        report.append(_report_row(
+            rows[submission.student_id], submission.student, status,
+            submission.score if submission.is_graded else None, context.max_score,
+            submission.feedback if submission.is_graded else submission.status_message,
+        ))
+    return report
+
+
+def grade_sheets(assignment, source, workdir, pattern=DEFAULT_PATTERN, match_by='username', processes=None,
+                 batch_size=BATCH_SIZE, report=None, progress=None):
+    """
+    Grade every answer sheet in source for assignment. report(rows) is called
+    with the report rows of each chunk as soon as it is committed and
+    progress(done, total) after each chunk. Returns the number of sheets
+    processed in this run.
+    """
+    matched, unmatched = match_students(collect_sheets(source, workdir), pattern, match_by)
+    max_score = float(assignment.max_score)
+    rows = [_report_row(name, None, 'unmatched', message=reason) for name, reason in unmatched]
+
+    existing = {
+        submission.student_id: submission
+        for submission in StudentAssignment.objects.select_related('student').filter(
+            assignment=assignment, student__in=[student for _, _, student in matched]
+        )
+    }
+    pending = []
+    for name, path, student in matched:
+        digest = sheet_hash(path)
+        submission = existing.get(student.pk)
+        # A sheet flagged as plagiarised is as settled as a graded one
+        if submission is not None and submission.file_hash == digest and (submission.is_graded or submission.plagiarism):
+            message = 'Already graded from this file' if submission.is_graded else 'Already flagged as plagiarised from this file'
+            score = submission.score if submission.is_graded else None
+            rows.append(_report_row(name, student, 'unchanged', score, max_score, message))
+        else:
+            pending.append((name, path, student, digest))
+    if report and rows:
+        report(rows)
+    if not pending:
+        return 0
+
+    context = get_grading_context(assignment)
+    done = 0
+    # spawn rather than fork keeps the pool clear of this process's threads
+    # and database connections; each process sets Django up for itself
+    with multiprocessing.get_context('spawn').Pool(processes, initializer=django.setup) as pool:
+        texts = pool.imap(_extract_sheet, [path for _, path, _, _ in pending])
+        for start in range(0, len(pending), batch_size):
+            chunk = [sheet + next(texts) for sheet in pending[start:start + batch_size]]
+            chunk_rows = _save_chunk(assignment, context, chunk, existing)
+            done += len(chunk)
+            if report:
+                report(chunk_rows)
+            if progress:
+                progress(done, len(pending))
+    return done
@@ -0,0 +1,273 @@
+"""
+Synthetic-corpus benchmark and threshold calibration for the plagiarism engine.
+
+A class of answers is generated from seed texts: independent answers (the
+student's own wording of the same topic), exact copies of an earlier answer
+(whitespace/case changes only) and paraphrases of an earlier answer. The
+submissions are fed through the plagiarism engine (services/plagiarism.py)
+in arrival order against the database, timing each one, and every pair
+similarity is scored against the known ground truth to give
+precision/recall per threshold. The rows a run writes are rolled back.
+
+Everything runs offline by default: HashingEmbedder stands in for the
+sentence-transformer so results are reproducible without network access.
+"""
+import random
+import re
+import time
+import uuid
+import zlib
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from Student.models import PlagiarismPair, StudentAssignment
+from Teacher.models import Assignment, Classroom, Subject
+from USER.models import User
+from .hashing import text_hash
+from .plagiarism import find_exact_duplicate, record_passage_matches, update_plagiarism_pairs
+
+DEFAULT_SIZES = (50, 500, 5000)
+DEFAULT_THRESHOLDS = (0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+SEED_TEXTS = [
+    "Photosynthesis is the process by which green plants use sunlight to make food. "
+    "Chlorophyll in the leaves absorbs light energy. The plant takes in carbon dioxide "
+    "from the air and water from the soil. Glucose is produced and oxygen is released "
+    "as a by-product. The glucose is used for energy and growth.",
+    "The water cycle describes how water moves around the earth. Heat from the sun "
+    "causes water to evaporate from oceans and lakes. The vapour rises, cools and "
+    "condenses into clouds. Water falls back as rain or snow, which is called "
+    "precipitation. It then collects in rivers and seas and the cycle repeats.",
+    "Newton's first law states that an object stays at rest or keeps moving at a "
+    "constant speed unless a force acts on it. This property is called inertia. "
+    "Heavier objects have more inertia and need a larger force to change their motion. "
+    "Seat belts protect passengers because of this law.",
+    "The French Revolution began in 1789 because of economic hardship and inequality. "
+    "The common people paid heavy taxes while the nobles and clergy paid little. "
+    "The storming of the Bastille became a symbol of the revolt. The monarchy was "
+    "abolished and France became a republic.",
+    "A cell is the basic unit of life. Plant cells have a cell wall, chloroplasts and "
+    "a large vacuole, while animal cells do not. The nucleus controls the activities "
+    "of the cell and contains genetic material. Mitochondria release energy through "
+    "respiration.",
+]
+
+_SYNONYMS = {
+    "process": ["method", "mechanism"], "use": ["utilise", "employ"], "make": ["produce", "create"],
+    "food": ["nutrients", "sugar"], "absorbs": ["captures", "takes up"], "energy": ["power"],
+    "produced": ["made", "formed"], "released": ["given off", "emitted"], "describes": ["explains", "shows"],
+    "moves": ["travels", "circulates"], "causes": ["makes", "leads"], "rises": ["goes up", "ascends"],
+    "falls": ["drops", "comes down"], "collects": ["gathers", "accumulates"], "object": ["body", "thing"],
+    "stays": ["remains", "continues"], "force": ["push", "pull"], "heavier": ["bigger", "more massive"],
+    "protect": ["save", "shield"], "began": ["started", "commenced"], "heavy": ["high", "large"],
+    "symbol": ["sign", "emblem"], "basic": ["fundamental", "smallest"], "controls": ["directs", "manages"],
+    "contains": ["holds", "carries"], "large": ["big", "huge"], "because": ["since", "as"],
+    "important": ["key", "essential"], "called": ["known as", "named"], "then": ["afterwards", "next"],
+}
+
+_FILLER = [
+    "This is an important idea in the topic.",
+    "I learned this in class last week.",
+    "In my opinion this explains it well.",
+    "There are many examples of this in everyday life.",
+    "Our teacher showed us a diagram of this.",
+    "It is easy to forget but very useful.",
+]
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic offline stand-in for the sentence-transformer: hashed bag of
+    word unigrams and bigrams, L2-normalised, in the same 384 dimensions.
+    """
+    name = "hashing"
+    dimensions = 384
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD_RE.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                h = zlib.crc32(feature.encode('utf-8'))
+                vectors[row, h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm > 0:
+                vectors[row] /= norm
+        return vectors
+
+
+class ModelEmbedder:
+    """The production sentence-transformer (needs the model to be available)."""
+    name = "model"
+
+    def encode(self, texts):
+        from .ocr import get_embeddings
+        return get_embeddings(texts)
+
+
+def _substitute(words, rng, rate):
+    result = []
+    for word in words:
+        options = _SYNONYMS.get(word.lower())
+        if options and rng.random() < rate:
+            result.append(rng.choice(options))
+        else:
+            result.append(word)
+    return result
+
+
+def _rewrite(text, rng, substitution_rate, shuffle, drop_rate, filler_rate, word_drop_rate=0.0):
+    sentences = [s for s in _SENTENCE_RE.split(text) if s]
+    if shuffle:
+        rng.shuffle(sentences)
+    rewritten = []
+    for sentence in sentences:
+        if rng.random() < drop_rate and len(sentences) > 2:
+            continue
+        words = [word for word in sentence.split() if rng.random() >= word_drop_rate]
+        rewritten.append(" ".join(_substitute(words, rng, substitution_rate)))
+        if rng.random() < filler_rate:
+            rewritten.append(rng.choice(_FILLER))
+    return " ".join(rewritten)
+
+
+def generate_corpus(n, seed_texts=SEED_TEXTS, copy_rate=0.05, paraphrase_rate=0.1, seed=0):
+    """
+    Generate n synthetic answers in arrival order.
+    Returns (texts, origins): origins[i] is the index of the independent answer
+    that texts[i] was copied or paraphrased from (itself for independent ones),
+    so two answers are a true positive pair exactly when their origins match.
+    """
+    rng = random.Random(seed)
+    topic = rng.choice(seed_texts)
+    texts = []
+    origins = []
+    for i in range(n):
+        roll = rng.random()
+        if i and roll < copy_rate:
+            source = rng.randrange(i)
+            words = texts[source].split()
+            # Re-typed copy: same words, different case and spacing
+            text = "  ".join(word.upper() if rng.random() < 0.1 else word for word in words)
+            origins.append(origins[source])
+        elif i and roll < copy_rate + paraphrase_rate:
+            source = rng.randrange(i)
+            text = _rewrite(texts[source], rng, substitution_rate=0.3, shuffle=rng.random() < 0.5, drop_rate=0.05, filler_rate=0.05)
+            origins.append(origins[source])
+        else:
+            # The student's own answer to the same question: shared topic, own wording
+            text = _rewrite(topic, rng, substitution_rate=0.7, shuffle=True, drop_rate=0.35, filler_rate=0.5, word_drop_rate=0.2)
+            origins.append(i)
+        texts.append(text)
+    return texts, origins
+
+
+def run_engine(texts, origins, embedder, thresholds=DEFAULT_THRESHOLDS, passages=True):
+    """
+    Feed the answers through the plagiarism engine one at a time, as the
+    submission pipeline does: each is stored as a submission to a scratch
+    assignment, then find_exact_duplicate, record_passage_matches and
+    update_plagiarism_pairs run on it against the database. Everything is
+    rolled back at the end. Returns latency and precision/recall statistics.
+    """
+    n = len(texts)
+    thresholds = sorted(thresholds)
+    index_of = {}
+    origins_array = np.asarray(origins)
+    true_positive = np.zeros(len(thresholds), dtype=np.int64)
+    false_positive = np.zeros(len(thresholds), dtype=np.int64)
+    positives = 0
+    passage_pairs = 0
+    latencies = []
+
+    with transaction.atomic():
+        assignment, students = _scratch_assignment(n)
+        started = time.perf_counter()
+        for i, text in enumerate(texts):
+            t0 = time.perf_counter()
+            # The embedder stands in for the model: the vector is stored with
+            # the submission, so the engine finds it current and uses it
+            vector = np.asarray(embedder.encode([text])[0], dtype=np.float32)
+            submission = StudentAssignment.objects.create(
+                assignment=assignment, student=students[i], answer_text=text,
+                embedding=vector.tobytes(), embedding_hash=text_hash(text),
+            )
+            index_of[submission.pk] = i
+            exact = find_exact_duplicate(submission)
+            if passages:
+                passage_pairs += len(record_passage_matches(submission))
+            # Pairs down to the lowest threshold are stored, so each
+            # threshold can be scored from their similarities
+            update_plagiarism_pairs(submission, threshold=thresholds[0])
+            latencies.append(time.perf_counter() - t0)
+
+            # Earlier submissions have lower ids, so they are always first
+            similarities = np.zeros(i, dtype=np.float32)
+            for first_id, similarity in PlagiarismPair.objects.filter(second=submission).values_list('first_id', 'similarity'):
+                similarities[index_of[first_id]] = similarity
+            if exact is not None:
+                similarities[index_of[exact]] = 1.0
+
+            # Score every earlier pair against the ground truth
+            is_positive = origins_array[:i] == origins[i]
+            positives += int(is_positive.sum())
+            for k, threshold in enumerate(thresholds):
+                predicted = similarities > threshold
+                true_positive[k] += int((predicted & is_positive).sum())
+                false_positive[k] += int((predicted & ~is_positive).sum())
+        elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+
+    latencies_ms = np.asarray(latencies) * 1000
+    calibration = []
+    for k, threshold in enumerate(thresholds):
+        predicted = true_positive[k] + false_positive[k]
+        calibration.append({
+            "threshold": threshold,
+            "precision": true_positive[k] / predicted if predicted else 1.0,
+            "recall": true_positive[k] / positives if positives else 1.0,
+        })
+    return {
+        "n": n,
+        "seconds": elapsed,
+        "throughput": n / elapsed if elapsed else float('inf'),
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p95": float(np.percentile(latencies_ms, 95)),
+            "max": float(latencies_ms.max()),
+        },
+        "positive_pairs": positives,
+        "passage_pairs": passage_pairs,
+        "calibration": calibration,
+    }
+
+
+def _scratch_assignment(n):
+    """An assignment and n students for one run, named so they cannot clash with real rows."""
+    token = uuid.uuid4().hex[:8]
+    teacher = User.objects.create(username=f"benchmark-{token}", name="Benchmark", role='teacher')
+    assignment = Assignment.objects.create(
+        title="Plagiarism benchmark", teacher=teacher,
+        subject=Subject.objects.create(name=f"Benchmark {token}", code=token),
+        classroom=Classroom.objects.create(name=f"Benchmark {token}", grade='0'),
+        due_date=timezone.now(),
+    )
+    students = User.objects.bulk_create([
+        User(username=f"benchmark-{token}-{i}", name=f"Student {i}", role='student') for i in range(n)
+    ])
+    return assignment, students
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, embedder=None, thresholds=DEFAULT_THRESHOLDS,
+                  copy_rate=0.05, paraphrase_rate=0.1, seed=0, seed_texts=SEED_TEXTS, passages=True):
+    """Generate a class per size and run the engine over it. Returns one result per size."""
+    embedder = embedder or HashingEmbedder()
+    results = []
+    for n in sizes:
+        texts, origins = generate_corpus(n, seed_texts, copy_rate, paraphrase_rate, seed)
+        results.append(run_engine(texts, origins, embedder, thresholds, passages))
+    return results
@@ -0,0 +1,183 @@
+"""
+Denormalized dashboard counters (UserCounters), so dashboards read one row
+instead of counting notifications and submissions on every load.
+
+- unread_notifications (students): +1 when a notification is created or
+  rewritten unread, -1 when one is read or deleted unread
+- ungraded_submissions (teachers): follows every submission's is_graded
+  (StudentAssignment remembers the value it was loaded with); the same
+  hooks keep the per-assignment counts and teacher stats of
+  services/teacher_stats.py
+- pending_assignments (students): depends on which assignments a student
+  can see, which changes with memberships, notifications and assignments,
+  so those events only mark the row stale and it is recounted on the next
+  read
+
+Deltas are single UPDATE ... SET n = n + delta statements, so concurrent
+changes do not overwrite each other. A user without a row simply gets one
+counted on first read. reconcile() recounts from the tables; run
+`manage.py reconcile_counters` periodically to repair any drift.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Q, Subquery
+from Student.models import StudentAssignment, UserCounters
+from Teacher.models import Assignment, ClassroomMembership, Notification
+from . import teacher_stats
+
+COUNTER_FIELDS = ['unread_notifications', 'pending_assignments', 'ungraded_submissions']
+RECONCILE_CHUNK_SIZE = 500
+_SCORE_FIELD = StudentAssignment._meta.get_field('score')
+
+
+def adjust(users, **deltas):
+    """Add deltas (field=delta) to the counters of users (ids or a subquery)."""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        UserCounters.objects.filter(user_id__in=users).update(**changes)
+
+
+def adjust_teacher(assignment_id, **deltas):
+    """adjust the counters of the teacher of an assignment, without loading it."""
+    adjust(Subquery(Assignment.objects.filter(pk=assignment_id).values('teacher_id')), **deltas)
+
+
+def mark_stale(users):
+    """Have the counters of users (ids or a subquery) recounted on their next read."""
+    UserCounters.objects.filter(user_id__in=users, stale=False).update(stale=True)
+
+
+def mark_audience_stale(assignment_id, classroom_ids):
+    """mark_stale for everyone who may see an assignment: the classrooms' students and notified students."""
+    members = ClassroomMembership.objects.filter(classroom_id__in=classroom_ids).values('student_id')
+    notified = Notification.objects.filter(assignment_id=assignment_id).values('student_id')
+    UserCounters.objects.filter(Q(user_id__in=members) | Q(user_id__in=notified), stale=False).update(stale=True)
+
+
+def _points(score):
+    """A score (graders may return floats) as the score column stores it."""
+    return _SCORE_FIELD.to_python(score).quantize(Decimal('0.01'))
+
+
+def grading_changes(submissions):
+    """
+    (Net change in ungraded submissions, change in the total score of the
+    graded ones) since the submissions were loaded, and remember their
+    current state. Submissions loaded without is_graded are skipped; count
+    new ones with record_new_submissions. The score change is None when a
+    submission was loaded without its score.
+    """
+    ungraded, score = 0, Decimal(0)
+    for submission in submissions:
+        stored = getattr(submission, '_stored_is_graded', None)
+        if stored is not None:
+            if stored != submission.is_graded:
+                ungraded += 1 if stored else -1
+            if stored and not hasattr(submission, '_stored_score'):
+                score = None
+            elif score is not None:
+                score += (_points(submission.score) if submission.is_graded else 0) - (_points(submission._stored_score) if stored else 0)
+        submission._stored_is_graded = submission.is_graded
+        if submission.is_graded:
+            submission._stored_score = submission.score
+    return ungraded, score
+
+
+def record_grading(assignment_id, submissions):
+    """Apply grading_changes of submissions to one assignment to its counts and its teacher's counter and stats."""
+    ungraded, score = grading_changes(submissions)
+    adjust_teacher(assignment_id, ungraded_submissions=ungraded)
+    teacher_stats.record_submissions(assignment_id, ungraded=ungraded, graded=-ungraded, score=score)
+
+
+def record_new_submissions(assignment_id, submissions):
+    """Count newly created submissions to one assignment."""
+    graded = [submission for submission in submissions if submission.is_graded]
+    for submission in submissions:
+        submission._stored_is_graded = submission.is_graded
+        submission._stored_score = submission.score
+    adjust_teacher(assignment_id, ungraded_submissions=len(submissions) - len(graded))
+    teacher_stats.record_submissions(
+        assignment_id, submissions=len(submissions), ungraded=len(submissions) - len(graded), graded=len(graded),
+        score=sum((_points(submission.score) for submission in graded), Decimal(0)),
+    )
+    transaction.on_commit(lambda: mark_stale([submission.student_id for submission in submissions]))
+
+
+def record_deleted_submission(submission):
+    """Uncount a deleted submission."""
+    if submission.is_graded:
+        teacher_stats.record_submissions(submission.assignment_id, submissions=-1, graded=-1, score=-_points(submission.score))
+    else:
+        adjust_teacher(submission.assignment_id, ungraded_submissions=-1)
+        teacher_stats.record_submissions(submission.assignment_id, submissions=-1, ungraded=-1)
+
+
+def mark_notification_read(notification):
+    """Mark a notification read; the counter only moves if it was unread in the database."""
+    with transaction.atomic():
+        if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+            adjust([notification.student_id], unread_notifications=-1)
+    notification.is_read = True
+
+
+def _count(user_ids):
+    """Exact counters of user_ids, counted from the tables."""
+    counts = {user_id: dict.fromkeys(COUNTER_FIELDS, 0) for user_id in user_ids}
+    for row in Notification.objects.filter(student_id__in=user_ids, is_read=False).order_by().values('student_id').annotate(n=Count('id')):
+        counts[row['student_id']]['unread_notifications'] = row['n']
+    for row in StudentAssignment.objects.filter(teacher_id__in=user_ids, is_graded=False).order_by().values('teacher_id').annotate(n=Count('id')):
+        counts[row['teacher_id']]['ungraded_submissions'] = row['n']
+
+    # Visible (notified or classroom) active assignments without a submission
+    visible = defaultdict(set)
+    notified = Notification.objects.filter(student_id__in=user_ids, assignment__is_active=True).order_by().values_list('student_id', 'assignment_id')
+    assigned = ClassroomMembership.objects.filter(
+        student_id__in=user_ids, classroom__assignments__is_active=True
+    ).order_by().values_list('student_id', 'classroom__assignments')
+    for student_id, assignment_id in notified.union(assigned):
+        visible[student_id].add(assignment_id)
+    submitted = StudentAssignment.objects.filter(student_id__in=user_ids).order_by().values_list('student_id', 'assignment_id')
+    for student_id, assignment_id in submitted:
+        visible[student_id].discard(assignment_id)
+    for student_id, assignment_ids in visible.items():
+        counts[student_id]['pending_assignments'] = len(assignment_ids)
+    return counts
+
+
+def reconcile(user_ids):
+    """
+    Recount the counters of user_ids and store them. Returns the number of
+    rows that were missing or had drifted.
+    """
+    user_ids = list(user_ids)
+    repaired = 0
+    for start in range(0, len(user_ids), RECONCILE_CHUNK_SIZE):
+        chunk = user_ids[start:start + RECONCILE_CHUNK_SIZE]
+        counts = _count(chunk)
+        with transaction.atomic():
+            existing = {row.user_id: row for row in UserCounters.objects.select_for_update().filter(user_id__in=chunk)}
+            created, changed = [], []
+            for user_id, values in counts.items():
+                row = existing.get(user_id)
+                if row is None:
+                    created.append(UserCounters(user_id=user_id, **values))
+                elif row.stale or any(getattr(row, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(row, field, value)
+                    row.stale = False
+                    changed.append(row)
+            UserCounters.objects.bulk_create(created, ignore_conflicts=True)
+            UserCounters.objects.bulk_update(changed, COUNTER_FIELDS + ['stale'])
+        repaired += len(created) + len(changed)
+    return repaired
+
+
+def get_counters(user):
+    """The user's counters: one read, plus a recount when the row is missing or stale."""
+    counters = UserCounters.objects.filter(user=user).first()
+    if counters is None or counters.stale:
+        reconcile([user.pk])
+        counters = UserCounters.objects.get(user=user)
+    return counters
@@ -0,0 +1,124 @@
+"""
+Server-sent events for submission progress.
+
+Streams poll StudentAssignment with a cursor on updated_at (indexed with
+assignment), so each poll is one small range query that returns only rows
+changed since the last one. Every status, plagiarism and score change bumps
+updated_at. Rows are re-read for CURSOR_LAG behind the cursor so a
+transaction that commits with a slightly older timestamp is not missed;
+already-sent versions are skipped. The generators are async and use the
+async ORM, so under ASGI an open stream does not hold a worker thread.
+"""
+import asyncio
+import json
+import time
+from datetime import timedelta
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from Student.models import StudentAssignment
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_SECONDS = 15
+# Streams end after this long; EventSource reconnects and resumes from Last-Event-ID
+STREAM_SECONDS = 300
+RECONNECT_MS = 3000
+CURSOR_LAG = timedelta(seconds=2)
+
+
+def event_rows():
+    return StudentAssignment.objects.select_related('assignment').only(
+        'id', 'status', 'status_message', 'is_graded', 'plagiarism', 'score', 'updated_at', 'assignment__max_score'
+    )
+
+
+def submission_payload(submission):
+    return {
+        'id': submission.pk,
+        'status': submission.status,
+        'status_display': submission.get_status_display(),
+        'message': submission.status_message,
+        'processing': submission.is_processing,
+        'is_graded': submission.is_graded,
+        'plagiarism': submission.plagiarism,
+        'score': float(submission.score) if submission.is_graded else None,
+        'max_score': float(submission.assignment.max_score),
+    }
+
+
+def format_event(data, event='status', event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_cursor(value):
+    """Cursor from a Last-Event-ID header, or None."""
+    cursor = parse_datetime(value) if value else None
+    if cursor is not None and timezone.is_naive(cursor):
+        cursor = timezone.make_aware(cursor, timezone.utc)
+    return cursor
+
+
+async def submission_events(submission_id):
+    """
+    Stream one submission: its current state straight away, then every change
+    until it finishes processing.
+    """
+    yield f"retry: {RECONNECT_MS}\n\n"
+    queryset = event_rows().filter(id=submission_id)
+    last_version = None
+    last_sent = started = time.monotonic()
+    while time.monotonic() - started < STREAM_SECONDS:
+        submission = await queryset.afirst()
+        if submission is None:
+            yield format_event({'id': submission_id}, event='deleted')
+            return
+        if submission.updated_at != last_version:
+            last_version = submission.updated_at
+            last_sent = time.monotonic()
+            yield format_event(submission_payload(submission), event_id=last_version.isoformat())
+            if not submission.is_processing:
+                return
+        elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def submission_change_events(filters, since=None):
+    """
+    Stream every change made after since (default: now) to the submissions
+    matching the Q filters, e.g. all submissions of one assignment.
+    """
+    yield f"retry: {RECONNECT_MS}\n\n"
+    cursor = since or timezone.now()
+    sent = {}
+    last_sent = started = time.monotonic()
+    while time.monotonic() - started < STREAM_SECONDS:
+        rows = event_rows().filter(filters, updated_at__gte=cursor - CURSOR_LAG).order_by('updated_at', 'id')
+        async for submission in rows:
+            cursor = max(cursor, submission.updated_at)
+            if sent.get(submission.pk) == submission.updated_at:
+                continue
+            sent[submission.pk] = submission.updated_at
+            last_sent = time.monotonic()
+            yield format_event(submission_payload(submission), event_id=cursor.isoformat())
+        # Versions older than the re-read window can no longer come back
+        horizon = cursor - CURSOR_LAG
+        sent = {pk: version for pk, version in sent.items() if version >= horizon}
+        if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+def event_stream(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
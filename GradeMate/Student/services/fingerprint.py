@@ -0,0 +1,150 @@
+"""
+Winnowing fingerprints for passage-level plagiarism evidence.
+
+Answer text is split into word tokens, every run of KGRAM_SIZE consecutive
+tokens is hashed with a Karp-Rabin rolling hash, and winnowing keeps the
+rightmost minimum hash of every WINDOW_SIZE consecutive k-grams. Any copied
+passage of at least KGRAM_SIZE + WINDOW_SIZE - 1 words is guaranteed to share
+a fingerprint with its source, so aligned spans can be recovered from the
+shared fingerprints alone without re-reading both texts.
+"""
+import re
+import zlib
+from collections import Counter, defaultdict, namedtuple
+
+KGRAM_SIZE = 5  # words per k-gram
+WINDOW_SIZE = 4  # k-grams per winnowing window
+# A hash seen more often than this in either text (a repeated line, boilerplate)
+# is left out of alignment: pairing every occurrence is quadratic in the repeats
+MAX_HASH_OCCURRENCES = 8
+
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1  # fits a signed 64-bit BigIntegerField
+_TOKEN_RE = re.compile(r"\w+")
+
+# position is the k-gram index, start/end are character offsets in the text
+Fingerprint = namedtuple('Fingerprint', ['hash', 'position', 'start', 'end'])
+
+
+def tokenize(text):
+    """Return (lowercased word, start, end) tuples for the words in text."""
+    return [(m.group(0).lower(), m.start(), m.end()) for m in _TOKEN_RE.finditer(text or "")]
+
+
+def kgram_hashes(tokens, k=KGRAM_SIZE):
+    """Rolling hash of every k consecutive tokens, in order."""
+    if len(tokens) < k:
+        return []
+    # crc32 is stable across processes, unlike the builtin hash()
+    token_hashes = [zlib.crc32(token.encode('utf-8')) for token, _, _ in tokens]
+    highest = pow(_HASH_BASE, k - 1, _HASH_MOD)
+    hashes = []
+    h = 0
+    for i, th in enumerate(token_hashes):
+        if i >= k:
+            h = (h - token_hashes[i - k] * highest) % _HASH_MOD
+        h = (h * _HASH_BASE + th) % _HASH_MOD
+        if i >= k - 1:
+            hashes.append(h)
+    return hashes
+
+
+def winnow(hashes, w=WINDOW_SIZE):
+    """
+    Select the rightmost minimum hash of every window of w hashes.
+    Returns (hash, index) pairs, each selected position reported once.
+    """
+    if not hashes:
+        return []
+    if len(hashes) <= w:
+        minimum = min(hashes)
+        index = len(hashes) - 1 - hashes[::-1].index(minimum)
+        return [(minimum, index)]
+
+    selected = []
+    last_index = -1
+    for window_start in range(len(hashes) - w + 1):
+        min_index = window_start
+        for i in range(window_start + 1, window_start + w):
+            if hashes[i] <= hashes[min_index]:
+                min_index = i
+        if min_index != last_index:
+            selected.append((hashes[min_index], min_index))
+            last_index = min_index
+    return selected
+
+
+def fingerprint(text, k=KGRAM_SIZE, w=WINDOW_SIZE):
+    """Return the winnowed Fingerprints of text."""
+    tokens = tokenize(text)
+    return [
+        Fingerprint(h, position, tokens[position][1], tokens[position + k - 1][2])
+        for h, position in winnow(kgram_hashes(tokens, k), w)
+    ]
+
+
+def align_matches(fingerprints, other_fingerprints, max_gap=WINDOW_SIZE):
+    """
+    Turn the fingerprints two texts share into aligned matching spans.
+
+    Shared fingerprints that lie on the same diagonal (same offset between the
+    two texts) and are at most max_gap k-grams apart are merged into one span.
+    Hashes that occur more than MAX_HASH_OCCURRENCES times in either text are
+    skipped, so each fingerprint is paired with at most that many others.
+    Returns [start, end, other_start, other_end] character spans sorted by start.
+    """
+    by_hash = defaultdict(list)
+    for fp in other_fingerprints:
+        by_hash[fp.hash].append(fp)
+    occurrences = Counter(fp.hash for fp in fingerprints)
+
+    diagonals = defaultdict(list)
+    for fp in fingerprints:
+        others = by_hash.get(fp.hash, ())
+        if len(others) > MAX_HASH_OCCURRENCES or occurrences[fp.hash] > MAX_HASH_OCCURRENCES:
+            continue
+        for other in others:
+            diagonals[other.position - fp.position].append((fp, other))
+
+    spans = []
+    for pairs in diagonals.values():
+        pairs.sort(key=lambda pair: pair[0].position)
+        current = None
+        last_position = None
+        for fp, other in pairs:
+            if current is not None and fp.position - last_position <= max_gap:
+                current[1] = max(current[1], fp.end)
+                current[3] = max(current[3], other.end)
+            else:
+                if current is not None:
+                    spans.append(current)
+                current = [fp.start, fp.end, other.start, other.end]
+            last_position = fp.position
+        if current is not None:
+            spans.append(current)
+
+    spans.sort()
+    return spans
+
+
+def highlight_segments(text, spans):
+    """
+    Split text into (segment, is_match) pairs using the first two offsets of
+    each stored span, merging overlapping spans.
+    """
+    text = text or ""
+    ranges = sorted((span[0], span[1]) for span in spans if span[0] < span[1])
+    segments = []
+    cursor = 0
+    for start, end in ranges:
+        start = max(start, cursor)
+        end = min(end, len(text))
+        if start >= end:
+            continue
+        if start > cursor:
+            segments.append((text[cursor:start], False))
+        segments.append((text[start:end], True))
+        cursor = end
+    if cursor < len(text):
+        segments.append((text[cursor:], False))
+    return segments
@@ -1,6 +1,290 @@
-from .ocr import get_embedding, cosine_similarity
+"""
+Answer-key grading.
+
+A GradingContext holds everything needed to grade submissions to one
+assignment: the key text, its embedding and the score scale. Contexts are
+built once per assignment and kept in a small per-process cache, so a worker
+grading a whole class extracts and embeds the key once. A cached context is
+discarded when Assignment.updated_at (bumped whenever the teacher edits the
+assignment) or the embedding model changes.
+
+Rubric grading splits each answer into sentences and scores every rubric
+point by its best-matching sentence: one batched encode of the sentences and
+one sentences x points matrix product against the cached point vectors.
+
+Every result is also written to the grade memo (services/memo.py), so an
+answer already graded against the same key is scored without the model.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from Teacher.models import Assignment
+from . import memo
+from .admission import Overloaded
+from .ai_evaluator import evaluate_answer, evaluate_similarity, rubric_feedback
+from .hashing import text_hash
+from .ocr import EMBEDDING_MODEL_NAME, extract_text_from_file, get_embedding, get_embeddings, cosine_similarity
+from .plagiarism import similarity_row
+
+_CACHE_SIZE = 64
+
+# A rubric point earns nothing when its best sentence is at or below
+# RUBRIC_NO_CREDIT similarity, full credit at or above RUBRIC_FULL_CREDIT,
+# and partial credit linearly in between
+RUBRIC_NO_CREDIT = 0.35
+RUBRIC_FULL_CREDIT = 0.75
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_WEIGHTED_POINT_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*\|\s*(.+)$")
+
+_contexts = OrderedDict()
+_lock = threading.Lock()
+
 
 def auto_grade(student_text, key_text):
     emb_student = get_embedding(student_text)
     emb_key = get_embedding(key_text)
     return round(cosine_similarity(emb_student, emb_key) * 100, 2)
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text or "") if sentence and sentence.strip()]
+
+
+def parse_rubric(rubric, key_text=""):
+    """
+    Return (statement, weight) rubric points: one per line of rubric, with an
+    optional "weight | " prefix, or one per key answer paragraph when the
+    rubric is empty.
+    """
+    points = []
+    for line in (rubric or "").splitlines():
+        line = line.strip().lstrip("-*").strip()
+        if not line:
+            continue
+        match = _WEIGHTED_POINT_RE.match(line)
+        if match:
+            points.append((match.group(2).strip(), float(match.group(1))))
+        else:
+            points.append((line, 1.0))
+    if not points:
+        points = [(paragraph.strip(), 1.0) for paragraph in _PARAGRAPH_RE.split(key_text or "") if paragraph.strip()]
+    return [(statement, weight) for statement, weight in points if weight > 0]
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class GradingContext:
+    """Key answer, key vector, rubric point vectors and score scale of one assignment."""
+
+    def __init__(self, assignment_id, updated_at, key_text, key_vector, max_score,
+                 rubric=(), rubric_matrix=None, model_version=EMBEDDING_MODEL_NAME):
+        self.assignment_id = assignment_id
+        self.updated_at = updated_at
+        self.key_text = key_text
+        self.key_vector = key_vector
+        self.max_score = max_score
+        # (statement, weight) points and their normalised vectors, one row each
+        self.rubric = list(rubric)
+        self.rubric_matrix = rubric_matrix
+        self.model_version = model_version
+        # Grade memo key: what the answers are compared against
+        if self.uses_rubric:
+            self.memo_key = text_hash("rubric\n" + "\n".join(f"{weight:g} | {statement}" for statement, weight in self.rubric))
+        else:
+            self.memo_key = text_hash(key_text)
+
+    @property
+    def uses_rubric(self):
+        return self.rubric_matrix is not None and len(self.rubric) > 0
+
+    @property
+    def has_key(self):
+        return self.key_vector is not None or self.uses_rubric
+
+    def is_current(self, assignment):
+        return self.updated_at == assignment.updated_at and self.model_version == EMBEDDING_MODEL_NAME
+
+    def similarities(self, matrix):
+        """Similarity of every answer vector (row of matrix) to the key."""
+        return similarity_row(self.key_vector, np.asarray(matrix, dtype=np.float32))
+
+    def evaluate(self, similarity):
+        """Score (scaled to max_score) and feedback for one answer similarity."""
+        result = evaluate_similarity(float(similarity))
+        result['score'] = round((result['score'] / 10.0) * self.max_score, 2)
+        return result
+
+    def grade(self, texts, vectors=None, answer_hashes=None):
+        """
+        Grade several answers at once. vectors are the answers' embeddings
+        (only used without a rubric; encoded here when not given) and
+        answer_hashes their text hashes (computed when not given).
+        Answers already in the grade memo skip the model entirely.
+        Returns one {'score', 'feedback', 'rubric'} dictionary per answer.
+        """
+        if answer_hashes is None:
+            answer_hashes = [text_hash(text) for text in texts]
+        memos = memo.lookup(self.memo_key, answer_hashes)
+        results = [None] * len(texts)
+        for i, answer_hash in enumerate(answer_hashes):
+            hit = memos.get(answer_hash)
+            if hit is not None:
+                raw = hit.point_similarities if self.uses_rubric else hit.similarity
+                results[i] = self._result(raw, hit.feedback)
+
+        todo = [i for i, result in enumerate(results) if result is None]
+        if todo:
+            todo_texts = [texts[i] for i in todo]
+            if self.uses_rubric:
+                computed = self._point_similarities(todo_texts)
+            else:
+                todo_vectors = get_embeddings(todo_texts) if vectors is None else np.asarray(vectors, dtype=np.float32)[todo]
+                computed = self.similarities(todo_vectors)
+            entries = {}
+            for i, raw in zip(todo, computed):
+                results[i] = self._result(raw)
+                if self.uses_rubric:
+                    entries[answer_hashes[i]] = (None, raw, results[i]['feedback'])
+                else:
+                    entries[answer_hashes[i]] = (raw, [], results[i]['feedback'])
+            memo.store(self.memo_key, entries)
+        return results
+
+    def _point_similarities(self, texts):
+        """Best sentence similarity per rubric point for each answer."""
+        sentences = [split_sentences(text) for text in texts]
+        flat = [sentence for answer in sentences for sentence in answer]
+        matrix = _normalize_rows(get_embeddings(flat)) @ self.rubric_matrix.T if flat else None
+        best = []
+        offset = 0
+        for answer in sentences:
+            if answer:
+                best.append(matrix[offset:offset + len(answer)].max(axis=0).tolist())
+            else:
+                best.append([0.0] * len(self.rubric))
+            offset += len(answer)
+        return best
+
+    def _result(self, raw, feedback=None):
+        """Score and feedback from a raw similarity (or per-point similarities with a rubric)."""
+        if not self.uses_rubric:
+            result = dict(self.evaluate(raw), rubric=[])
+            if feedback:
+                result['feedback'] = feedback
+            return result
+
+        best = np.asarray(raw, dtype=np.float32)
+        weights = np.asarray([weight for _, weight in self.rubric], dtype=np.float32)
+        credit = np.clip((best - RUBRIC_NO_CREDIT) / (RUBRIC_FULL_CREDIT - RUBRIC_NO_CREDIT), 0.0, 1.0)
+        breakdown = [
+            {"point": statement, "weight": weight, "similarity": round(float(similarity), 3), "awarded": round(weight * float(c), 2)}
+            for (statement, weight), similarity, c in zip(self.rubric, best, credit)
+        ]
+        fraction = float(weights @ credit) / float(weights.sum())
+        return {
+            "score": round(fraction * self.max_score, 2),
+            "feedback": feedback or rubric_feedback(breakdown),
+            "rubric": breakdown,
+        }
+
+
+def evaluate_answer_memoized(model_answer, student_answer):
+    """
+    evaluate_answer, answered from the grade memo when the same model answer
+    and student answer have been graded before.
+    """
+    key_hash, answer_hash = text_hash(model_answer), text_hash(student_answer)
+    if not key_hash or not answer_hash:
+        # Empty answers get evaluate_answer's own messages
+        return evaluate_answer(model_answer, student_answer)
+
+    hit = memo.lookup(key_hash, [answer_hash]).get(answer_hash)
+    if hit is not None and hit.similarity is not None:
+        return {"score": evaluate_similarity(hit.similarity)["score"], "feedback": hit.feedback}
+    try:
+        similarity = cosine_similarity(get_embedding(student_answer), get_embedding(model_answer))
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"❌ Error getting embeddings: {e}")
+        return {
+            "score": 0.0,
+            "feedback": "Evaluation error: Could not process answers. Please try again."
+        }
+    result = evaluate_similarity(similarity)
+    memo.store(key_hash, {answer_hash: (similarity, [], result["feedback"])})
+    return result
+
+
+def key_answer_text(assignment):
+    """Key answer text, extracted from the key file (and saved) if needed."""
+    key_text = assignment.key_answer_text
+    if not key_text and assignment.key_answer_file:
+        try:
+            key_file_path = assignment.key_answer_file.path
+            if os.path.exists(key_file_path):
+                key_text = extract_text_from_file(key_file_path)
+            if key_text and key_text.strip():
+                # Save extracted text to assignment for future use; update()
+                # leaves updated_at alone so cached contexts stay valid
+                Assignment.objects.filter(pk=assignment.pk).update(key_answer_text=key_text)
+                assignment.key_answer_text = key_text
+        except Exception as e:
+            print(f"⚠️ Could not extract text from key answer file: {e}")
+    return key_text
+
+
+def build_grading_context(assignment):
+    key_text = key_answer_text(assignment)
+    has_key_text = bool(key_text and key_text.strip())
+    rubric = []
+    if assignment.grading_mode == Assignment.GRADING_RUBRIC:
+        rubric = parse_rubric(assignment.rubric, key_text)
+
+    # Key and rubric points are encoded together in one batch
+    texts = ([key_text] if has_key_text else []) + [statement for statement, _ in rubric]
+    vectors = get_embeddings(texts) if texts else None
+    key_vector = vectors[0] if has_key_text else None
+    rubric_matrix = _normalize_rows(vectors[1 if has_key_text else 0:]) if rubric else None
+    return GradingContext(assignment.pk, assignment.updated_at, key_text, key_vector, float(assignment.max_score), rubric, rubric_matrix)
+
+
+def get_grading_context(assignment):
+    """
+    Return the grading context for assignment, building it only when there is
+    no cached one for its current updated_at.
+    """
+    with _lock:
+        context = _contexts.get(assignment.pk)
+        if context is not None and context.is_current(assignment):
+            _contexts.move_to_end(assignment.pk)
+            return context
+
+    context = build_grading_context(assignment)
+    # Without a key there is nothing worth keeping; a key file that could not
+    # be read this time is retried on the next submission
+    if context.has_key:
+        with _lock:
+            _contexts[assignment.pk] = context
+            _contexts.move_to_end(assignment.pk)
+            while len(_contexts) > _CACHE_SIZE:
+                _contexts.popitem(last=False)
+    return context
+
+
+def invalidate_grading_context(assignment_id=None):
+    """Drop the cached context of one assignment, or of all assignments."""
+    with _lock:
+        if assignment_id is None:
+            _contexts.clear()
+        else:
+            _contexts.pop(assignment_id, None)
@@ -0,0 +1,27 @@
+"""
+Content hashes used to spot exact resubmissions with a single indexed lookup.
+"""
+import hashlib
+
+
+def normalize_text(text):
+    """Case-fold and collapse all whitespace so trivially re-typed copies compare equal."""
+    return " ".join((text or "").split()).casefold()
+
+
+def text_hash(text):
+    """SHA-256 of the normalized text, or '' when there is no text."""
+    normalized = normalize_text(text)
+    if not normalized:
+        return ""
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def file_hash(file):
+    """SHA-256 of a file's bytes, read in chunks. Accepts any Django File."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
@@ -0,0 +1,298 @@
+"""
+Database-backed job queue.
+
+Jobs are rows in Student.Job, so the queue needs no broker and survives
+restarts. Workers (manage.py run_workers) claim one job at a time under a
+lease: on PostgreSQL/MySQL with SELECT ... FOR UPDATE SKIP LOCKED, on SQLite
+with a conditional UPDATE that only one worker can win. While a job runs its
+worker renews the lease every third of LEASE_SECONDS, so a long OCR or
+embedding job is not reclaimed; a worker that dies mid-job stops renewing,
+its lease expires and the job is claimed again. Failed
+jobs are retried with exponential backoff and dead-lettered once their
+attempts run out.
+
+Scheduling: the lowest ready priority class runs first (interactive
+submissions before normal work before background re-grades and sweeps);
+a job that has waited longer than PRIORITY_AGING is treated as top priority
+so background work cannot starve forever. Within a class, jobs are grouped
+by fair_key (classroom or teacher) and the group that started the fewest
+jobs in the last FAIR_SHARE_WINDOW seconds goes next, so one large batch
+cannot hold every worker while another class waits.
+"""
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from Student.models import Job
+from .admission import endpoint
+
+_DEFAULTS = {
+    'LEASE_SECONDS': 600,
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 10,
+    'RETRY_BACKOFF_MAX': 3600,
+    'EAGER': False,
+    'PRIORITY_AGING': 600,
+    'FAIR_SHARE_WINDOW': 60,
+}
+
+_TASKS = {}
+
+
+def queue_setting(name):
+    return getattr(settings, 'JOB_QUEUE', {}).get(name, _DEFAULTS[name])
+
+
+def task(name, bind=False, max_attempts=None, priority=Job.PRIORITY_NORMAL):
+    """
+    Register a function as a job handler under name. With bind=True the
+    claimed Job is passed as the first argument. The function gets an
+    enqueue(delay=0, fair_key='', **payload) attribute.
+    """
+    def decorator(fn):
+        _TASKS[name] = (fn, bind, max_attempts, priority)
+        fn.task_name = name
+        fn.enqueue = lambda delay=0, fair_key='', **payload: enqueue(name, payload, delay=delay, fair_key=fair_key)
+        return fn
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None, priority=None, fair_key=''):
+    """
+    Store a job for the named task. priority defaults to the task's class and
+    fair_key names the group it shares workers fairly with. The row becomes
+    visible to workers when the surrounding transaction commits. In EAGER mode
+    the job runs inline after commit instead.
+    """
+    if name not in _TASKS:
+        raise ValueError(f"Unknown task: {name}")
+    _, _, task_max_attempts, task_priority = _TASKS[name]
+    job = Job.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=task_priority if priority is None else priority,
+        fair_key=fair_key,
+        max_attempts=max_attempts or task_max_attempts or queue_setting('MAX_ATTEMPTS'),
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if queue_setting('EAGER'):
+        transaction.on_commit(lambda: _run_eagerly(job.pk))
+    return job
+
+
+def _run_eagerly(job_id):
+    job = claim(worker_id='eager', job_id=job_id)
+    if job is not None:
+        run_job(job)
+
+
+def _ready(now):
+    # Queued jobs that are due, plus running jobs whose lease has expired
+    return Q(status=Job.STATUS_QUEUED, run_after__lte=now) | Q(status=Job.STATUS_RUNNING, locked_until__lt=now)
+
+
+def _next_ready(ready, now):
+    """
+    Narrow the ready jobs to the ones to claim next: the top priority class
+    (plus anything that has aged into it) and, within it, the fair-share
+    group that has started the fewest jobs recently.
+    """
+    top = ready.order_by('priority').values_list('priority', flat=True).first()
+    if top is None:
+        return ready.none()
+    aged = now - timedelta(seconds=queue_setting('PRIORITY_AGING'))
+    pool = ready.filter(Q(priority=top) | Q(run_after__lte=aged))
+
+    oldest = dict(pool.order_by().values('fair_key').annotate(oldest=Min('run_after')).values_list('fair_key', 'oldest'))
+    if len(oldest) > 1:
+        window = now - timedelta(seconds=queue_setting('FAIR_SHARE_WINDOW'))
+        recent = dict(Job.objects.filter(
+            fair_key__in=oldest, started_at__gte=window
+        ).order_by().values('fair_key').annotate(started=Count('id')).values_list('fair_key', 'started'))
+        fair_key = min(oldest, key=lambda key: (recent.get(key, 0), oldest[key]))
+        pool = pool.filter(fair_key=fair_key)
+    return pool.order_by('run_after', 'id')
+
+
+def claim(worker_id, job_id=None):
+    """Lease the next ready job to worker_id. Returns the Job or None."""
+    now = timezone.now()
+    lease = now + timedelta(seconds=queue_setting('LEASE_SECONDS'))
+    ready = Job.objects.filter(_ready(now))
+    if job_id is not None:
+        ready = ready.filter(id=job_id)
+    else:
+        ready = _next_ready(ready, now)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = ready.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.wait_seconds += max(0.0, (now - job.run_after).total_seconds())
+            job.status = Job.STATUS_RUNNING
+            job.locked_by = worker_id
+            job.locked_until = lease
+            job.attempts += 1
+            job.started_at = now
+            job.save(update_fields=['status', 'locked_by', 'locked_until', 'attempts', 'started_at', 'wait_seconds'])
+            return job
+
+    # SQLite has no row locks: re-check the ready condition inside the UPDATE
+    # so only one worker's claim of a given row can match it
+    for candidate_id, run_after in ready.values_list('id', 'run_after')[:10]:
+        claimed = Job.objects.filter(_ready(now), id=candidate_id).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_until=lease,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            wait_seconds=F('wait_seconds') + max(0.0, (now - run_after).total_seconds()),
+        )
+        if claimed:
+            return Job.objects.get(id=candidate_id)
+    return None
+
+
+def renew_lease(job):
+    """Extend a running job's lease by LEASE_SECONDS. Returns False when the lease is no longer job's worker's."""
+    lease = timezone.now() + timedelta(seconds=queue_setting('LEASE_SECONDS'))
+    renewed = Job.objects.filter(id=job.id, locked_by=job.locked_by, status=Job.STATUS_RUNNING).update(locked_until=lease)
+    if renewed:
+        job.locked_until = lease
+    return bool(renewed)
+
+
+@contextmanager
+def _heartbeat(job):
+    """Renew job's lease from a background thread while the block runs."""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(queue_setting('LEASE_SECONDS') / 3):
+                try:
+                    if not renew_lease(job):
+                        print(f"⚠️ Job {job.name} #{job.id} lost its lease to another worker")
+                        return
+                except Exception as e:
+                    print(f"⚠️ Could not renew the lease of job {job.name} #{job.id}: {e}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"lease-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _backoff(attempts):
+    delay = queue_setting('RETRY_BACKOFF') * (2 ** (attempts - 1))
+    delay = min(delay, queue_setting('RETRY_BACKOFF_MAX'))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(job):
+    """
+    Run a claimed job, renewing its lease while it runs, and record the
+    outcome. Updates are conditional on the lease still being ours, so a
+    worker that lost its lease (e.g. stalled past it) cannot overwrite the
+    state written by the worker that reclaimed the job.
+    """
+    mine = Job.objects.filter(id=job.id, locked_by=job.locked_by, status=Job.STATUS_RUNNING)
+    try:
+        if job.name not in _TASKS:
+            raise LookupError(f"No task registered as {job.name!r}")
+        fn, bind, _, _ = _TASKS[job.name]
+        with endpoint(f"job:{job.name}", background=True), _heartbeat(job):
+            if bind:
+                fn(job, **job.payload)
+            else:
+                fn(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        print(f"❌ Job {job.name} #{job.id} failed (attempt {job.attempts}/{job.max_attempts}):\n{error}")
+        if job.attempts >= job.max_attempts:
+            mine.update(status=Job.STATUS_DEAD, last_error=error, locked_by='', locked_until=None, finished_at=timezone.now())
+        else:
+            mine.update(
+                status=Job.STATUS_QUEUED,
+                last_error=error,
+                locked_by='',
+                locked_until=None,
+                run_after=timezone.now() + timedelta(seconds=_backoff(job.attempts)),
+            )
+        return False
+    mine.update(status=Job.STATUS_DONE, locked_by='', locked_until=None, finished_at=timezone.now())
+    return True
+
+
+def worker_name(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def work(worker_id, stop_event, once=False):
+    """
+    Claim and run jobs until stop_event is set. With once=True, return as
+    soon as no job is ready instead of polling.
+    """
+    poll_interval = queue_setting('POLL_INTERVAL')
+    while not stop_event.is_set():
+        close_old_connections()
+        job = claim(worker_id)
+        if job is None:
+            if once:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        run_job(job)
+    close_old_connections()
+
+
+def requeue(jobs):
+    """Put dead or stuck jobs back on the queue with a fresh set of attempts."""
+    return jobs.update(
+        status=Job.STATUS_QUEUED,
+        attempts=0,
+        run_after=timezone.now(),
+        locked_by='',
+        locked_until=None,
+        finished_at=None,
+    )
+
+
+def queue_stats(since=None):
+    """
+    Queue wait time per priority class: jobs still waiting now, and the wait
+    of jobs started since (default: the last hour).
+    Returns [{"priority", "label", "waiting", "oldest_wait", "started", "mean_wait", "p95_wait", "max_wait"}].
+    """
+    now = timezone.now()
+    since = since or now - timedelta(hours=1)
+    stats = []
+    for priority, label in Job.PRIORITY_CHOICES:
+        waiting = Job.objects.filter(status=Job.STATUS_QUEUED, priority=priority, run_after__lte=now)
+        oldest = waiting.aggregate(oldest=Min('run_after'))['oldest']
+        waits = sorted(Job.objects.filter(priority=priority, started_at__gte=since).values_list('wait_seconds', flat=True))
+        stats.append({
+            "priority": priority,
+            "label": label,
+            "waiting": waiting.count(),
+            "oldest_wait": (now - oldest).total_seconds() if oldest else 0.0,
+            "started": len(waits),
+            "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "max_wait": waits[-1] if waits else 0.0,
+        })
+    return stats
@@ -0,0 +1,97 @@
+"""
+Grade memo: deterministic grading results keyed by the normalized key (or
+rubric) hash, the normalized answer hash and the scoring engine version.
+
+Identical resubmissions, retried jobs and re-grades against an unchanged key
+are answered with one indexed lookup instead of a model call. The memo holds
+raw similarities and feedback, so a changed max_score still rescales the
+score. Entries expire TTL_DAYS after their last use and the table is trimmed
+to MAX_ENTRIES, least recently used first.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from Student.models import GradeMemo
+from .ocr import EMBEDDING_MODEL_NAME
+
+# Bump the suffix whenever scoring or feedback rules change
+ENGINE_VERSION = f"{EMBEDDING_MODEL_NAME}/scoring-1"
+
+_DEFAULTS = {
+    'ENABLED': True,
+    'TTL_DAYS': 30,
+    'MAX_ENTRIES': 100_000,
+    'PRUNE_EVERY': 500,
+}
+# last_used_at is refreshed at most this often, so most hits stay read-only
+_TOUCH_INTERVAL = timedelta(days=1)
+_LOOKUP_CHUNK_SIZE = 500
+
+_stores_since_prune = 0
+
+
+def memo_setting(name):
+    return getattr(settings, 'GRADE_MEMO', {}).get(name, _DEFAULTS[name])
+
+
+def lookup(key_hash, answer_hashes):
+    """Return {answer_hash: GradeMemo} for the unexpired memos of these answers."""
+    answer_hashes = list({h for h in answer_hashes if h})
+    if not key_hash or not answer_hashes or not memo_setting('ENABLED'):
+        return {}
+    now = timezone.now()
+    memos = {}
+    for i in range(0, len(answer_hashes), _LOOKUP_CHUNK_SIZE):
+        for memo in GradeMemo.objects.filter(
+            key_hash=key_hash,
+            engine_version=ENGINE_VERSION,
+            answer_hash__in=answer_hashes[i:i + _LOOKUP_CHUNK_SIZE],
+            last_used_at__gte=now - timedelta(days=memo_setting('TTL_DAYS')),
+        ):
+            memos[memo.answer_hash] = memo
+    stale = [memo.pk for memo in memos.values() if memo.last_used_at < now - _TOUCH_INTERVAL]
+    if stale:
+        GradeMemo.objects.filter(pk__in=stale).update(last_used_at=now)
+    return memos
+
+
+def store(key_hash, entries):
+    """
+    Save results as {answer_hash: (similarity, point_similarities, feedback)}.
+    Existing memos are left as they are.
+    """
+    global _stores_since_prune
+    entries = {h: entry for h, entry in entries.items() if h}
+    if not key_hash or not entries or not memo_setting('ENABLED'):
+        return
+    GradeMemo.objects.bulk_create([
+        GradeMemo(
+            key_hash=key_hash,
+            answer_hash=answer_hash,
+            engine_version=ENGINE_VERSION,
+            similarity=None if similarity is None else float(similarity),
+            point_similarities=[round(float(value), 6) for value in point_similarities],
+            feedback=feedback,
+        )
+        for answer_hash, (similarity, point_similarities, feedback) in entries.items()
+    ], batch_size=_LOOKUP_CHUNK_SIZE, ignore_conflicts=True)
+
+    _stores_since_prune += len(entries)
+    if _stores_since_prune >= memo_setting('PRUNE_EVERY'):
+        _stores_since_prune = 0
+        prune()
+
+
+def prune():
+    """Delete expired memos and trim the table to MAX_ENTRIES. Returns the number deleted."""
+    deleted, _ = GradeMemo.objects.filter(
+        last_used_at__lt=timezone.now() - timedelta(days=memo_setting('TTL_DAYS'))
+    ).delete()
+    max_entries = memo_setting('MAX_ENTRIES')
+    # The first memo past the limit, newest first; it and everything older go
+    cutoff = list(GradeMemo.objects.order_by('-last_used_at', '-id').values_list('last_used_at', 'id')[max_entries:max_entries + 1])
+    if cutoff:
+        last_used_at, memo_id = cutoff[0]
+        trimmed, _ = GradeMemo.objects.filter(last_used_at__lte=last_used_at).exclude(last_used_at=last_used_at, id__gt=memo_id).delete()
+        deleted += trimmed
+    return deleted
@@ -0,0 +1,110 @@
+"""
+Assignment notifications for a classroom's students.
+
+The roster is compared with the notifications that already exist, and only
+the difference is written: missing notifications are created with one
+bulk_create per batch, and with refresh (an edited assignment) the ones
+whose message changed are rewritten and marked unread with one UPDATE per
+batch. Notifications already saying the same thing are left untouched, so
+an unchanged save costs two reads. Rows another fan-out wrote first are
+skipped, and each batch is read back so that created and the students'
+unread counters (services/counters.py) move by the rows actually written.
+
+Rosters larger than INLINE_LIMIT are notified from a background job instead
+of inside the request.
+"""
+from django.conf import settings
+from django.db import transaction
+from Teacher.models import Assignment, Notification
+from Teacher.utils import find_students_for_classroom
+from .counters import adjust, mark_stale
+from .visibility import invalidate_students
+
+_DEFAULTS = {
+    'INLINE_LIMIT': 200,
+    'BATCH_SIZE': 500,
+}
+
+
+def notification_setting(name):
+    return getattr(settings, 'ASSIGNMENT_NOTIFICATIONS', {}).get(name, _DEFAULTS[name])
+
+
+def new_assignment_message(assignment):
+    return f"New assignment: {assignment.title} in {assignment.subject.name}. Due: {assignment.due_date.strftime('%Y-%m-%d %H:%M')}"
+
+
+def updated_assignment_message(assignment):
+    return f"Assignment updated: {assignment.title} in {assignment.subject.name}. Due: {assignment.due_date.strftime('%Y-%m-%d %H:%M')}"
+
+
+def _difference(assignment, student_ids, message, refresh):
+    """The students without a notification, those whose message changed (with refresh) and what each was told."""
+    notified = {
+        student_id: (old_message, is_read)
+        for student_id, old_message, is_read in Notification.objects.filter(assignment=assignment).order_by().values_list('student_id', 'message', 'is_read')
+    }
+    missing = sorted(student_ids - notified.keys())
+    stale = sorted(student_id for student_id in student_ids & notified.keys() if notified[student_id][0] != message) if refresh else []
+    return missing, stale, notified
+
+
+def fan_out(assignment, message, refresh=False):
+    """
+    Give every student of the assignment's classroom a notification with
+    message; with refresh, also rewrite (and mark unread) existing ones with
+    a different message. Returns (created, updated).
+    """
+    batch_size = notification_setting('BATCH_SIZE')
+    student_ids = set(find_students_for_classroom(assignment.classroom).values_list('id', flat=True))
+    missing, stale, notified = _difference(assignment, student_ids, message, refresh)
+    if not missing and not stale:
+        return 0, 0
+
+    created = updated = 0
+    with transaction.atomic():
+        # On databases with row locks (not SQLite) concurrent fan-outs for the
+        # assignment queue here, and the difference is read again
+        list(Assignment.objects.select_for_update().filter(pk=assignment.pk).values_list('pk', flat=True))
+        missing, stale, notified = _difference(assignment, student_ids, message, refresh)
+        for start in range(0, len(missing), batch_size):
+            batch = [Notification(assignment=assignment, student_id=student_id, message=message) for student_id in missing[start:start + batch_size]]
+            Notification.objects.bulk_create(batch, ignore_conflicts=True)
+            # A row that conflicted was written by another fan-out, with its
+            # own created_at; only rows with the created_at bulk_create gave
+            # ours are counted
+            stamped = {notification.student_id: notification.created_at for notification in batch}
+            inserted = [
+                student_id
+                for student_id, created_at in Notification.objects.filter(
+                    assignment=assignment, student_id__in=stamped
+                ).order_by().values_list('student_id', 'created_at')
+                if stamped[student_id] == created_at
+            ]
+            created += len(inserted)
+            adjust(inserted, unread_notifications=1)
+        for start in range(0, len(stale), batch_size):
+            updated += Notification.objects.filter(
+                assignment=assignment, student_id__in=stale[start:start + batch_size]
+            ).update(message=message, is_read=False)
+        # Rewritten notifications that had been read are unread again
+        adjust([student_id for student_id in stale if notified[student_id][1]], unread_notifications=1)
+        # bulk_create sends no post_save, so drop the cached visibility here
+        if missing:
+            transaction.on_commit(lambda: invalidate_students(missing))
+            transaction.on_commit(lambda: mark_stale(missing))
+    return created, updated
+
+
+def notify_classroom(assignment, message, refresh=False):
+    """
+    fan_out now, or from a background job when the classroom is large.
+    Returns {'students', 'created', 'updated', 'queued'}.
+    """
+    students = find_students_for_classroom(assignment.classroom).count()
+    if students > notification_setting('INLINE_LIMIT'):
+        from .tasks import notify_students, teacher_key
+        notify_students.enqueue(assignment_id=assignment.pk, message=message, refresh=refresh, fair_key=teacher_key(assignment))
+        return {'students': students, 'created': 0, 'updated': 0, 'queued': True}
+    created, updated = fan_out(assignment, message, refresh)
+    return {'students': students, 'created': created, 'updated': updated, 'queued': False}
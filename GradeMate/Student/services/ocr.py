@@ -9,10 +9,13 @@ try:
 except ImportError:
     PDF_AVAILABLE = False
     print("⚠️ PyPDF2 not available. PDF text extraction will not work.")
+from .admission import limited
 
 # Try to get HF token from environment, fallback to None
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
 # Initialize models with lazy loading
 processor = None
 ocr_model = None
@@ -38,7 +41,7 @@ def _load_embedding_model():
     _embedding_model_loading = True
     try:
         print("🔄 Loading embedding model (this may take a moment on first use)...")
-        model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        model_name = EMBEDDING_MODEL_NAME
         
         # Try loading with retry
         max_retries = 2
@@ -103,6 +106,7 @@ def _load_ocr_models():
         ocr_model = None
         raise Exception(f"Failed to load OCR models: {str(e)}")
 
+@limited('ocr')
 def extract_text_from_file(path):
     """
     Extract text from a file using OCR or PDF extraction.
@@ -147,6 +151,17 @@ def extract_text_from_file(path):
         print(f"❌ OCR error for file {path}: {e}")
         raise Exception(f"Failed to extract text from file: {str(e)}")
 
+def extract_text_in_subprocess(path):
+    """
+    extract_text_from_file for process pools. Each pool process runs one
+    extraction at a time, so it waits for the OCR limiter instead of being
+    rejected like a web request.
+    """
+    from .admission import endpoint
+    with endpoint('ocr-process', background=True):
+        return extract_text_from_file(path)
+
+@limited('embedding')
 def get_embedding(text):
     """
     Get embedding vector for text using sentence transformer.
@@ -173,6 +188,20 @@ def get_embedding(text):
         # Return zero vector as fallback
         return [0.0] * 384
 
+@limited('embedding')
+def get_embeddings(texts):
+    """
+    Get embedding vectors for several texts with one batched encode call.
+    Returns a float32 array with one row per text; empty texts get zero rows.
+    """
+    model = _load_embedding_model()
+    vectors = np.zeros((len(texts), 384), dtype=np.float32)
+    indexes = [i for i, text in enumerate(texts) if text and text.strip()]
+    if indexes:
+        encoded = model.encode([texts[i] for i in indexes], convert_to_numpy=True)
+        vectors[indexes] = encoded
+    return vectors
+
 def cosine_similarity(vec1, vec2):
     """
     Calculate cosine similarity between two vectors.
@@ -0,0 +1,172 @@
+"""
+Keyset (cursor) pagination for the long newest-first lists: a teacher's
+submissions, a student's results and notifications.
+
+Offset pagination counts the whole list (COUNT(*)) for the page numbers and
+skips OFFSET rows on every page, so deep pages get slower as the table
+grows. Here a page is "the next per_page rows after this (timestamp, id)":
+one range query on a composite index that costs the same on page 1 and page
+10,000, with no count. Links carry an opaque cursor (?after= / ?before=);
+the id breaks ties between rows with the same timestamp. The condition is
+written as `key <= v AND (key < v OR id < pk)` rather than the plain OR so
+the database seeks straight to v instead of walking the index from the top.
+
+?page=N links keep working for the first COMPAT_PAGES pages (served with a
+small OFFSET and no count), so existing bookmarks and the first-page links of
+other pages do not break. Deeper page numbers are a 404, as an out-of-range
+page already was.
+"""
+import base64
+import statistics
+import time
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+_DEFAULTS = {
+    'COMPAT_PAGES': 5,
+}
+
+
+def pagination_setting(name):
+    return getattr(settings, 'KEYSET_PAGINATION', {}).get(name, _DEFAULTS[name])
+
+
+def encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(f"{value.isoformat()}|{pk}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(timestamp, id) from a cursor, or raise InvalidPage."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        value, pk = parse_datetime(value), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        value = None
+    if value is None:
+        raise InvalidPage("Invalid cursor")
+    return value, pk
+
+
+class KeysetPage:
+    """One page of a keyset-paginated list; quacks like the parts of Django's Page the templates use."""
+
+    def __init__(self, object_list, key, has_next, has_previous, number=None):
+        self.object_list = object_list
+        self.key = key
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.number = number
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            last = self.object_list[-1]
+            return encode_cursor(getattr(last, self.key), last.pk)
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            first = self.object_list[0]
+            return encode_cursor(getattr(first, self.key), first.pk)
+
+
+def keyset_page(queryset, key, per_page, after=None, before=None, page=None):
+    """
+    The page of queryset, newest key first, that follows the cursor after,
+    precedes the cursor before, or has the given (compatibility) number;
+    the first page when none is given. Raises InvalidPage.
+    """
+    newest_first = queryset.order_by(f'-{key}', '-pk')
+    if before:
+        value, pk = decode_cursor(before)
+        rows = list(queryset.filter(
+            Q(**{f'{key}__gt': value}) | Q(pk__gt=pk), **{f'{key}__gte': value}
+        ).order_by(key, 'pk')[:per_page + 1])
+        has_previous = len(rows) > per_page
+        return KeysetPage(rows[:per_page][::-1], key, has_next=True, has_previous=has_previous)
+    if after:
+        value, pk = decode_cursor(after)
+        rows = list(newest_first.filter(Q(**{f'{key}__lt': value}) | Q(pk__lt=pk), **{f'{key}__lte': value})[:per_page + 1])
+        return KeysetPage(rows[:per_page], key, has_next=len(rows) > per_page, has_previous=True)
+
+    number = 1
+    if page is not None:
+        try:
+            number = int(page)
+        except (TypeError, ValueError):
+            raise InvalidPage("Page is not a number")
+        if not 1 <= number <= pagination_setting('COMPAT_PAGES'):
+            raise InvalidPage("Use the next/previous links for deeper pages")
+    offset = (number - 1) * per_page
+    rows = list(newest_first[offset:offset + per_page + 1])
+    if number > 1 and not rows:
+        raise InvalidPage("That page contains no results")
+    return KeysetPage(rows[:per_page], key, has_next=len(rows) > per_page, has_previous=number > 1, number=number)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView pagination by keyset_field (a timestamp) and id instead of page
+    numbers. The template gets page_obj.next_cursor / previous_cursor for
+    ?after= / ?before= links; paginator is None (there is no count).
+    """
+    keyset_field = None
+
+    def paginate_queryset(self, queryset, page_size):
+        params = self.request.GET
+        try:
+            page = keyset_page(
+                queryset, self.keyset_field, page_size,
+                after=params.get('after'), before=params.get('before'), page=params.get(self.page_kwarg),
+            )
+        except InvalidPage as e:
+            raise Http404(f"Invalid page: {e}")
+        return (None, page, page.object_list, page.has_other_pages())
+
+
+def benchmark(queryset, key, per_page, depths, repeat=5):
+    """
+    Median milliseconds to load page `depth` of queryset for each depth: by
+    page number with Django's Paginator (COUNT plus OFFSET) and by cursor.
+    The cursor of each depth is looked up once, outside the timing.
+    """
+    def timed(load):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            load()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    newest_first = queryset.order_by(f'-{key}', '-pk')
+    paginator = Paginator(newest_first, per_page)
+    results = []
+    for depth in depths:
+        boundary = newest_first.values_list(key, 'pk')[(depth - 1) * per_page - 1] if depth > 1 else None
+        cursor = encode_cursor(*boundary) if boundary else None
+        results.append({
+            'page': depth,
+            # A fresh Paginator per load, as every request builds one and counts again
+            'offset_ms': timed(lambda: list(Paginator(newest_first, per_page).page(depth).object_list)),
+            'keyset_ms': timed(lambda: list(keyset_page(queryset, key, per_page, after=cursor).object_list)),
+        })
+    return {'rows': paginator.count, 'per_page': per_page, 'pages': results}
@@ -0,0 +1,170 @@
+"""
+Submission evaluation pipeline run by the background job queue.
+
+Each stage advances StudentAssignment.status so the result pages can show
+progress: queued -> extracting -> checking -> grading -> done (or failed).
+Single submissions run the stages in turn; batches run them concurrently in
+the staged pipeline of services/stages.py.
+"""
+import os
+from django.utils import timezone
+from Student.models import StudentAssignment
+from .grading import get_grading_context
+from .ocr import extract_text_from_file
+from .plagiarism import embed_submission, find_exact_duplicate, record_passage_matches, refresh_plagiarism_flags, update_plagiarism_pairs
+
+
+def _advance(submission, status, message=''):
+    submission.status = status
+    submission.status_message = message
+    submission.save(update_fields=['status', 'status_message'])
+
+
+def _flag_plagiarised(submission, message):
+    submission.plagiarism = True
+    submission.is_graded = False
+    submission.score = 0
+    submission.feedback = ''
+    submission.evaluated_at = None
+    submission.status = StudentAssignment.STATUS_DONE
+    submission.status_message = message
+    submission.save(update_fields=['plagiarism', 'duplicate_of', 'is_graded', 'score', 'feedback', 'evaluated_at', 'status', 'status_message'])
+
+
+def extract_stage(submission, extract=extract_text_from_file):
+    """
+    Make sure the submission has answer text, running extract(path) on its
+    uploaded file when needed. Returns False when the submission is finished
+    already (no file, no text, or extraction failed).
+    """
+    _advance(submission, StudentAssignment.STATUS_EXTRACTING)
+    if submission.file and not submission.answer_text:
+        file_path = submission.file.path
+        if not os.path.exists(file_path):
+            _advance(submission, StudentAssignment.STATUS_FAILED, 'Uploaded file not found. Please try uploading again.')
+            return False
+        try:
+            extracted_text = extract(file_path)
+        except Exception as e:
+            _advance(submission, StudentAssignment.STATUS_FAILED, f'Could not extract text from file: {str(e)}. Please enter text manually.')
+            return False
+        if extracted_text and extracted_text.strip():
+            submission.answer_text = extracted_text
+            submission.save(update_fields=['answer_text'])
+
+    if not submission.answer_text or not submission.answer_text.strip():
+        _advance(submission, StudentAssignment.STATUS_DONE, 'Automatic grading requires text content. Please ensure your file contains text or enter text manually.')
+        return False
+    return True
+
+
+def check_and_grade_stage(submission, context=None):
+    """
+    Plagiarism-check the submission and grade it against the assignment's
+    key. context is the assignment's GradingContext when the caller already
+    has one.
+    """
+    assignment = submission.assignment
+
+    # Check for duplicate/plagiarized submissions before grading
+    _advance(submission, StudentAssignment.STATUS_CHECKING)
+    try:
+        record_passage_matches(submission)
+    except Exception as e:
+        print(f"⚠️ Error recording passage matches for submission {submission.pk}: {e}")
+
+    # Extracted text may be an exact copy even when the uploaded file was not
+    duplicate_id = find_exact_duplicate(submission)
+    if duplicate_id:
+        submission.duplicate_of_id = duplicate_id
+        _flag_plagiarised(submission, 'Submission rejected because it matches another student\'s submission. Please submit your own work.')
+        refresh_plagiarism_flags([duplicate_id])
+        return
+
+    # Only the pairs involving this submission are recomputed; earlier
+    # submissions it matches are flagged as well
+    try:
+        if update_plagiarism_pairs(submission):
+            _flag_plagiarised(submission, 'Submission rejected because it matches another student\'s submission. Please submit your own work.')
+            return
+    except Exception as e:
+        print(f"⚠️ Error during plagiarism check for submission {submission.pk}: {e}")
+
+    # Evaluate using AI if we have the key answer
+    _advance(submission, StudentAssignment.STATUS_GRADING)
+    if context is None or not context.is_current(assignment):
+        context = get_grading_context(assignment)
+    if not context.has_key:
+        _advance(submission, StudentAssignment.STATUS_DONE, 'Automatic grading is not available as no answer key is provided.')
+        return
+
+    # The answer vector stored by the plagiarism check is reused here
+    print(f"🤖 Starting AI evaluation for submission {submission.pk}")
+    vectors = None if context.uses_rubric else [embed_submission(submission)]
+    evaluation_result = context.grade([submission.answer_text], vectors, [submission.text_hash])[0]
+
+    submission.score = evaluation_result['score']
+    submission.feedback = evaluation_result['feedback']
+    submission.rubric_scores = evaluation_result['rubric']
+    submission.is_graded = True
+    submission.evaluated_at = timezone.now()
+    submission.status = StudentAssignment.STATUS_DONE
+    submission.status_message = ''
+    # Only the grading fields: the plagiarism state on this row is written by
+    # other score threads and checks while this one grades
+    submission.save(update_fields=['score', 'feedback', 'rubric_scores', 'is_graded', 'evaluated_at', 'status', 'status_message', 'updated_at'])
+    print(f"✅ Evaluation complete: Score {submission.score}/{context.max_score}")
+
+
+def handle_failure(submission, error, final_attempt=True):
+    """
+    Mark the submission failed after an unexpected error or, when the job
+    will be retried (final_attempt=False), put it back to queued.
+    """
+    import traceback
+    print(f"❌ Error processing submission {submission.pk}: {error}")
+    print(f"Error details: {traceback.format_exc()}")
+    submission.is_graded = False
+    if not final_attempt:
+        submission.status = StudentAssignment.STATUS_QUEUED
+        submission.status_message = 'Evaluation hit a temporary error and will be retried shortly.'
+    else:
+        submission.status = StudentAssignment.STATUS_FAILED
+        submission.status_message = f'Error during evaluation: {str(error)}. Please contact your teacher.'
+    submission.save(update_fields=['is_graded', 'status', 'status_message'])
+
+
+def process_submission(submission_id, final_attempt=True, context=None):
+    """
+    Extract, plagiarism-check and grade one submission, recording progress on
+    its status field. context is the assignment's GradingContext when the
+    caller already has one. On an unexpected error the submission is marked
+    failed, or, when the job will be retried (final_attempt=False), put back
+    to queued and the error re-raised.
+    """
+    try:
+        submission = StudentAssignment.objects.select_related('assignment').get(id=submission_id)
+    except StudentAssignment.DoesNotExist:
+        print(f"❌ Submission {submission_id} not found")
+        return
+
+    try:
+        if extract_stage(submission):
+            check_and_grade_stage(submission, context)
+    except Exception as e:
+        handle_failure(submission, e, final_attempt)
+        if not final_attempt:
+            raise
+
+
+def process_batch(submission_ids):
+    """
+    Process several submissions through the staged pipeline (see
+    services/stages.py), oldest first, and log its stage statistics.
+    """
+    from .stages import StagedPipeline, format_stats
+    ordered = list(StudentAssignment.objects.filter(id__in=submission_ids).order_by('submitted_at').values_list('id', flat=True))
+    staged = StagedPipeline()
+    stats = staged.run(ordered)
+    print("\n".join(format_stats(stats, staged.elapsed)))
+    return stats
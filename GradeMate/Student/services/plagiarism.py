@@ -1,10 +1,280 @@
-from .ocr import get_embedding, cosine_similarity
-
-def check_plagiarism(student_text, others, threshold=0.9):
-    emb_student = get_embedding(student_text)
-    for text in others:
-        if text:
-            emb_other = get_embedding(text)
-            if cosine_similarity(emb_student, emb_other) > threshold:
-                return True
-    return False
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from Student.models import AnswerFingerprint, PlagiarismPair, StudentAssignment
+from Teacher.models import Assignment
+from .fingerprint import Fingerprint, fingerprint, align_matches
+from .ocr import get_embedding, get_embeddings
+
+PLAGIARISM_THRESHOLD = 0.9
+# Pairs at or above this similarity are kept so near misses stay visible;
+# anything lower is not stored, which keeps the pair table sparse
+PAIR_RECORD_THRESHOLD = 0.75
+
+# Keep hash__in lists well under SQLite's bound-parameter limit
+_LOOKUP_CHUNK_SIZE = 500
+_SWEEP_BLOCK_SIZE = 512
+
+
+def find_exact_duplicate(submission):
+    """
+    Return the id of the earliest other submission to the same assignment with
+    identical normalized text or identical file bytes, or None.
+    Uses the (assignment, text_hash) and (assignment, file_hash) indexes, so it
+    is safe to run before any text extraction or embedding.
+    """
+    match = Q()
+    if submission.text_hash:
+        match |= Q(text_hash=submission.text_hash)
+    if submission.file_hash:
+        match |= Q(file_hash=submission.file_hash)
+    if not match:
+        return None
+    return StudentAssignment.objects.filter(
+        match,
+        assignment_id=submission.assignment_id
+    ).exclude(id=submission.id).order_by('submitted_at').values_list('id', flat=True).first()
+
+
+def index_fingerprints(submission):
+    """
+    Replace the stored fingerprints of a submission with those of its current
+    answer text. Returns the new fingerprints.
+    """
+    fingerprints = fingerprint(submission.answer_text)
+    AnswerFingerprint.objects.filter(submission=submission).delete()
+    AnswerFingerprint.objects.bulk_create([
+        AnswerFingerprint(
+            submission=submission,
+            assignment_id=submission.assignment_id,
+            hash=fp.hash,
+            position=fp.position,
+            start=fp.start,
+            end=fp.end,
+        )
+        for fp in fingerprints
+    ])
+    return fingerprints
+
+
+def find_passage_matches(submission, fingerprints):
+    """
+    Look up the fingerprints in the assignment's index and align them with
+    every other submission that shares any of them.
+    Returns [{"submission": id, "spans": [[start, end, other_start, other_end], ...]}]
+    ordered by the amount of matched text, largest first.
+    """
+    hashes = list({fp.hash for fp in fingerprints})
+    others = {}
+    for i in range(0, len(hashes), _LOOKUP_CHUNK_SIZE):
+        rows = AnswerFingerprint.objects.filter(
+            assignment_id=submission.assignment_id,
+            hash__in=hashes[i:i + _LOOKUP_CHUNK_SIZE]
+        ).exclude(submission_id=submission.id).values_list('submission_id', 'hash', 'position', 'start', 'end')
+        for submission_id, h, position, start, end in rows:
+            others.setdefault(submission_id, []).append(Fingerprint(h, position, start, end))
+
+    matches = []
+    for other_id, other_fingerprints in others.items():
+        spans = align_matches(fingerprints, other_fingerprints)
+        if spans:
+            matches.append({"submission": other_id, "spans": spans})
+    _sort_matches(matches)
+    return matches
+
+
+def _sort_matches(matches):
+    matches.sort(key=lambda match: -sum(span[1] - span[0] for span in match["spans"]))
+
+
+def record_passage_matches(submission):
+    """
+    Fingerprint the submission's answer text and store the passages it shares
+    with other submissions of the same assignment on plagiarism_spans.
+    The other side of every old or new match gets the mirrored spans, so the
+    earlier submission of a copied pair shows the evidence too.
+    """
+    previous_ids = {match["submission"] for match in submission.plagiarism_spans}
+    fingerprints = index_fingerprints(submission)
+    matches = find_passage_matches(submission, fingerprints) if fingerprints else []
+    submission.plagiarism_spans = matches
+    submission.save(update_fields=['plagiarism_spans'])
+
+    by_id = {match["submission"]: match for match in matches}
+    others = list(StudentAssignment.objects.filter(id__in=previous_ids | set(by_id)).only('id', 'plagiarism_spans'))
+    for other in others:
+        other_matches = [match for match in other.plagiarism_spans if match["submission"] != submission.id]
+        if other.id in by_id:
+            other_matches.append({
+                "submission": submission.id,
+                "spans": sorted([span[2], span[3], span[0], span[1]] for span in by_id[other.id]["spans"]),
+            })
+            _sort_matches(other_matches)
+        other.plagiarism_spans = other_matches
+    StudentAssignment.objects.bulk_update(others, ['plagiarism_spans'])
+    return matches
+
+
+def embed_submission(submission):
+    """
+    Return the submission's answer embedding, computing and storing it only
+    when the stored one was made from different text.
+    """
+    if submission.embedding is not None and submission.embedding_hash == submission.text_hash:
+        return np.frombuffer(submission.embedding, dtype=np.float32)
+    vector = np.asarray(get_embedding(submission.answer_text), dtype=np.float32)
+    submission.embedding = vector.tobytes()
+    submission.embedding_hash = submission.text_hash
+    submission.save(update_fields=['embedding', 'embedding_hash'])
+    return vector
+
+
+def similarity_row(vector, matrix):
+    """Cosine similarity of one vector against every row of matrix."""
+    if len(matrix) == 0:
+        return np.zeros(0, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    similarities = np.zeros(len(matrix), dtype=np.float32)
+    nonzero = norms > 0
+    similarities[nonzero] = (matrix[nonzero] @ vector) / norms[nonzero]
+    return similarities
+
+
+def _make_pair(assignment_id, id_a, id_b, similarity, threshold):
+    first_id, second_id = sorted((id_a, id_b))
+    return PlagiarismPair(
+        assignment_id=assignment_id,
+        first_id=first_id,
+        second_id=second_id,
+        similarity=float(similarity),
+        is_match=bool(similarity > threshold),
+    )
+
+
+def _current_vectors(assignment_id, exclude_id=None):
+    """Ids and stacked embeddings of the submissions whose stored vector matches their text."""
+    rows = StudentAssignment.objects.filter(
+        assignment_id=assignment_id,
+        embedding__isnull=False,
+        embedding_hash=F('text_hash')
+    ).exclude(text_hash='')
+    if exclude_id is not None:
+        rows = rows.exclude(id=exclude_id)
+    ids = []
+    vectors = []
+    for submission_id, embedding in rows.values_list('id', 'embedding'):
+        ids.append(submission_id)
+        vectors.append(np.frombuffer(embedding, dtype=np.float32))
+    return ids, np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+def refresh_plagiarism_flags(submission_ids):
+    """
+    Set plagiarism on each given submission from its stored evidence: a
+    matching pair on either side, or an exact duplicate in either direction.
+    """
+    submission_ids = set(submission_ids)
+    if not submission_ids:
+        return
+    flagged = set()
+    for first_id, second_id in PlagiarismPair.objects.filter(
+        Q(first_id__in=submission_ids) | Q(second_id__in=submission_ids),
+        is_match=True
+    ).values_list('first_id', 'second_id'):
+        flagged.update((first_id, second_id))
+    flagged.update(StudentAssignment.objects.filter(
+        id__in=submission_ids, duplicate_of__isnull=False
+    ).values_list('id', flat=True))
+    flagged.update(StudentAssignment.objects.filter(
+        duplicate_of_id__in=submission_ids
+    ).values_list('duplicate_of_id', flat=True))
+    flagged &= submission_ids
+
+    now = timezone.now()
+    StudentAssignment.objects.filter(id__in=flagged, plagiarism=False).update(plagiarism=True, updated_at=now)
+    StudentAssignment.objects.filter(id__in=submission_ids - flagged, plagiarism=True).update(plagiarism=False, updated_at=now)
+
+
+def update_plagiarism_pairs(submission, threshold=PLAGIARISM_THRESHOLD):
+    """
+    Recompute only the pairs involving this submission from stored embeddings
+    and refresh the flags of every submission whose match state may change:
+    its matching partners and exact duplicates in either direction.
+    Returns True when the submission matches any other submission.
+    """
+    involving = Q(first=submission) | Q(second=submission)
+    affected = {submission.id}
+    for first_id, second_id in PlagiarismPair.objects.filter(involving, is_match=True).values_list('first_id', 'second_id'):
+        affected.update((first_id, second_id))
+    if submission.duplicate_of_id:
+        affected.add(submission.duplicate_of_id)
+    affected.update(StudentAssignment.objects.filter(duplicate_of=submission).values_list('id', flat=True))
+
+    if not submission.text_hash:
+        PlagiarismPair.objects.filter(involving).delete()
+        refresh_plagiarism_flags(affected)
+        return False
+
+    vector = embed_submission(submission)
+    ids, matrix = _current_vectors(submission.assignment_id, exclude_id=submission.id)
+    similarities = similarity_row(vector, matrix)
+    floor = min(PAIR_RECORD_THRESHOLD, threshold)
+    kept = {}
+    for other_id, similarity in zip(ids, similarities):
+        if similarity >= floor:
+            kept[other_id] = _make_pair(submission.assignment_id, submission.id, other_id, similarity, threshold)
+    pairs = list(kept.values())
+    matched = {other_id for other_id, pair in kept.items() if pair.is_match}
+
+    with transaction.atomic():
+        PlagiarismPair.objects.filter(involving).exclude(
+            Q(first_id__in=kept) | Q(second_id__in=kept)
+        ).delete()
+        PlagiarismPair.objects.bulk_create(
+            pairs,
+            batch_size=_LOOKUP_CHUNK_SIZE,
+            update_conflicts=True,
+            unique_fields=['first', 'second'],
+            update_fields=['similarity', 'is_match', 'updated_at'],
+        )
+        refresh_plagiarism_flags(affected | matched)
+    return bool(matched)
+
+
+def sweep_assignment(assignment, threshold=PLAGIARISM_THRESHOLD):
+    """
+    Post-deadline consistency pass over one assignment: embed any submission
+    whose stored vector is missing or stale, rebuild every pair from one blocked
+    matrix product, and refresh all flags. Returns the number of matching pairs.
+    """
+    stale = list(StudentAssignment.objects.filter(assignment=assignment).exclude(
+        text_hash=''
+    ).exclude(embedding_hash=F('text_hash')).only('id', 'answer_text', 'text_hash'))
+    if stale:
+        vectors = get_embeddings([submission.answer_text for submission in stale])
+        for submission, vector in zip(stale, vectors):
+            submission.embedding = np.asarray(vector, dtype=np.float32).tobytes()
+            submission.embedding_hash = submission.text_hash
+        StudentAssignment.objects.bulk_update(stale, ['embedding', 'embedding_hash'], batch_size=200)
+
+    ids, matrix = _current_vectors(assignment.id)
+    pairs = []
+    if len(ids) > 1:
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.0
+        normalized = matrix / norms[:, None]
+        for start in range(0, len(ids), _SWEEP_BLOCK_SIZE):
+            block = normalized[start:start + _SWEEP_BLOCK_SIZE] @ normalized.T
+            rows, columns = np.nonzero(block >= min(PAIR_RECORD_THRESHOLD, threshold))
+            for row, column in zip(rows, columns):
+                i = start + row
+                if i < column:
+                    pairs.append(_make_pair(assignment.id, ids[i], ids[column], block[row, column], threshold))
+
+    with transaction.atomic():
+        PlagiarismPair.objects.filter(assignment=assignment).delete()
+        PlagiarismPair.objects.bulk_create(pairs, batch_size=_LOOKUP_CHUNK_SIZE)
+        refresh_plagiarism_flags(StudentAssignment.objects.filter(assignment=assignment).values_list('id', flat=True))
+        Assignment.objects.filter(pk=assignment.pk).update(plagiarism_swept_at=timezone.now())
+    return sum(1 for pair in pairs if pair.is_match)
@@ -0,0 +1,91 @@
+"""
+Bulk re-grade of an assignment against its current answer key.
+
+Submissions are streamed in batches: answers without a current stored
+embedding are encoded together, every answer in the batch is scored with one
+matrix product against the key vector (or, with a rubric, one product of all
+the batch's sentences against the rubric points), and the results are
+written back with bulk_update. Plagiarised submissions and ones still being processed are left
+alone.
+"""
+import numpy as np
+from django.utils import timezone
+from Student.models import StudentAssignment
+from .counters import record_grading
+from .grading import get_grading_context
+from .ocr import get_embeddings
+
+REGRADE_BATCH_SIZE = 500
+
+# bulk_update builds one CASE per field; smaller write batches keep those cheap
+_WRITE_BATCH_SIZE = 100
+_REGRADE_FIELDS = ['score', 'feedback', 'rubric_scores', 'is_graded', 'evaluated_at', 'status_message', 'updated_at']
+
+
+def regradable_submissions(assignment):
+    return StudentAssignment.objects.filter(
+        assignment=assignment,
+        plagiarism=False,
+        status=StudentAssignment.STATUS_DONE,
+    ).exclude(text_hash='')
+
+
+def grade_submissions(context, batch):
+    """
+    Score a batch of submissions that have answer text against context and
+    write the results (and any missing embeddings) back in bulk.
+    """
+    vectors = None
+    if not context.uses_rubric:
+        stale = [submission for submission in batch if submission.embedding is None or submission.embedding_hash != submission.text_hash]
+        if stale:
+            for submission, vector in zip(stale, get_embeddings([submission.answer_text for submission in stale])):
+                submission.embedding = np.asarray(vector, dtype=np.float32).tobytes()
+                submission.embedding_hash = submission.text_hash
+            StudentAssignment.objects.bulk_update(stale, ['embedding', 'embedding_hash'], batch_size=_WRITE_BATCH_SIZE)
+        vectors = np.vstack([np.frombuffer(submission.embedding, dtype=np.float32) for submission in batch])
+
+    now = timezone.now()
+    for submission, result in zip(batch, context.grade(
+        [submission.answer_text for submission in batch], vectors, [submission.text_hash for submission in batch]
+    )):
+        submission.score = result['score']
+        submission.feedback = result['feedback']
+        submission.rubric_scores = result['rubric']
+        submission.is_graded = True
+        submission.evaluated_at = now
+        submission.status_message = ''
+        submission.updated_at = now
+    StudentAssignment.objects.bulk_update(batch, _REGRADE_FIELDS, batch_size=_WRITE_BATCH_SIZE)
+    record_grading(context.assignment_id, batch)
+
+
+def regrade_assignment(assignment, batch_size=REGRADE_BATCH_SIZE, progress=None):
+    """
+    Re-score every finished, non-plagiarised submission of assignment against
+    its current key. progress(done, total) is called after each batch.
+    Returns the number of submissions re-graded.
+    """
+    context = get_grading_context(assignment)
+    if not context.has_key:
+        print(f"⚠️ Assignment {assignment.pk} has no answer key; nothing to re-grade")
+        return 0
+
+    submissions = regradable_submissions(assignment)
+    total = submissions.count()
+    done = 0
+    batch = []
+    for submission in submissions.only('id', 'answer_text', 'text_hash', 'embedding', 'embedding_hash', 'is_graded', 'score').order_by('id').iterator(chunk_size=batch_size):
+        batch.append(submission)
+        if len(batch) >= batch_size:
+            grade_submissions(context, batch)
+            done += len(batch)
+            batch = []
+            if progress:
+                progress(done, total)
+    if batch:
+        grade_submissions(context, batch)
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    return done
@@ -0,0 +1,256 @@
+"""
+Staged evaluation pipeline for batches of submissions.
+
+Extraction, embedding and scoring have very different resource profiles, so
+a batch flows through three stages connected by bounded queues, each with
+its own pool:
+
+- extract: OCR_PROCESSES threads, each handing uploaded files to a process
+  pool so PIL/PyPDF2/TrOCR work runs outside this process
+- embed: one thread that encodes up to EMBED_BATCH_SIZE answers per
+  get_embeddings call, waiting at most EMBED_MAX_WAIT seconds for a batch
+  to fill
+- score: SCORE_WORKERS threads running the plagiarism check and grading
+  against the stored vectors
+
+A full queue blocks the stage feeding it, so a slow stage throttles the
+ones before it instead of piling work up in memory. Every stage reports its
+throughput, queue depth and utilization (busy time over worker time), which
+shows where the bottleneck is.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from Student.models import StudentAssignment
+from . import pipeline
+from .admission import endpoint
+from .grading import get_grading_context
+from .ocr import extract_text_in_subprocess, get_embeddings
+
+_DEFAULTS = {
+    'OCR_PROCESSES': 2,
+    'EMBED_BATCH_SIZE': 32,
+    'EMBED_MAX_WAIT': 0.05,
+    'SCORE_WORKERS': 4,
+    'QUEUE_SIZE': 64,
+}
+
+# Tells a stage worker that no more items will come
+_DONE = object()
+
+
+def pipeline_setting(name):
+    return getattr(settings, 'EVALUATION_PIPELINE', {}).get(name, _DEFAULTS[name])
+
+
+class Stage:
+    """A bounded input queue, the number of workers reading it and their statistics."""
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        """Queue item, blocking while the queue is full."""
+        self.queue.put(item)
+        if item is not _DONE:
+            depth = self.queue.qsize()
+            with self._lock:
+                self.max_depth = max(self.max_depth, depth)
+                self._depth_total += depth
+                self._depth_samples += 1
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def record(self, seconds, processed=1, failed=0):
+        with self._lock:
+            self.busy_seconds += seconds
+            self.processed += processed
+            self.failed += failed
+
+    def stats(self, elapsed):
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "throughput": self.processed / elapsed if elapsed else 0.0,
+            "busy_seconds": self.busy_seconds,
+            "utilization": self.busy_seconds / (elapsed * self.workers) if elapsed else 0.0,
+            "max_depth": self.max_depth,
+            "mean_depth": self._depth_total / self._depth_samples if self._depth_samples else 0.0,
+        }
+
+
+class StagedPipeline:
+    """Runs submissions through the extract, embed and score stages concurrently."""
+
+    def __init__(self, ocr_processes=None, embed_batch_size=None, embed_max_wait=None, score_workers=None, queue_size=None):
+        queue_size = queue_size or pipeline_setting('QUEUE_SIZE')
+        self.embed_batch_size = embed_batch_size or pipeline_setting('EMBED_BATCH_SIZE')
+        self.embed_max_wait = pipeline_setting('EMBED_MAX_WAIT') if embed_max_wait is None else embed_max_wait
+        self.extract = Stage('extract', ocr_processes or pipeline_setting('OCR_PROCESSES'), queue_size)
+        self.embed = Stage('embed', 1, queue_size)
+        self.score = Stage('score', score_workers or pipeline_setting('SCORE_WORKERS'), queue_size)
+        self.elapsed = 0.0
+        self._ocr_pool = None
+        self._ocr_pool_lock = threading.Lock()
+        self._context_lock = threading.Lock()
+
+    @property
+    def stages(self):
+        return [self.extract, self.embed, self.score]
+
+    def run(self, submission_ids):
+        """Process the submissions and return the stage statistics."""
+        started = time.monotonic()
+        extractors = self._start(self.extract, self._extract_worker)
+        embedders = self._start(self.embed, self._embed_worker)
+        scorers = self._start(self.score, self._score_worker)
+        try:
+            for submission_id in submission_ids:
+                self.extract.put(submission_id)
+            # Each stage is told to stop once the one before it has drained
+            for stage, workers in [(self.extract, extractors), (self.embed, embedders), (self.score, scorers)]:
+                for _ in workers:
+                    stage.put(_DONE)
+                for worker in workers:
+                    worker.join()
+        finally:
+            if self._ocr_pool is not None:
+                self._ocr_pool.shutdown()
+                self._ocr_pool = None
+        self.elapsed = time.monotonic() - started
+        return self.stats()
+
+    def stats(self):
+        return [stage.stats(self.elapsed) for stage in self.stages]
+
+    def _start(self, stage, target):
+        threads = [
+            threading.Thread(target=self._run_worker, args=(stage, target), name=f"pipeline-{stage.name}-{i}", daemon=True)
+            for i in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _run_worker(self, stage, target):
+        # Worker threads queue for the model like background jobs, and close
+        # their own database connection when done
+        try:
+            with endpoint(f"pipeline:{stage.name}", background=True):
+                target()
+        finally:
+            connection.close()
+
+    def _extract_text(self, path):
+        with self._ocr_pool_lock:
+            if self._ocr_pool is None:
+                # spawn rather than fork: this process is already running threads
+                self._ocr_pool = ProcessPoolExecutor(max_workers=self.extract.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._ocr_pool.submit(extract_text_in_subprocess, path).result()
+
+    def _extract_worker(self):
+        while True:
+            submission_id = self.extract.get()
+            if submission_id is _DONE:
+                return
+            began = time.monotonic()
+            submission = StudentAssignment.objects.select_related('assignment').filter(id=submission_id).first()
+            if submission is None:
+                print(f"❌ Submission {submission_id} not found")
+                self.extract.record(time.monotonic() - began, processed=0, failed=1)
+                continue
+            failed = 0
+            try:
+                ready = pipeline.extract_stage(submission, extract=self._extract_text)
+            except Exception as e:
+                pipeline.handle_failure(submission, e)
+                ready = False
+                failed = 1
+            self.extract.record(time.monotonic() - began, processed=1 - failed, failed=failed)
+            if ready:
+                self.embed.put(submission)
+
+    def _embed_worker(self):
+        done = False
+        while not done:
+            item = self.embed.get()
+            if item is _DONE:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.embed_max_wait
+            while len(batch) < self.embed_batch_size:
+                try:
+                    item = self.embed.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            began = time.monotonic()
+            try:
+                self._embed_batch(batch)
+                failed = 0
+            except Exception as e:
+                # The score stage embeds these one by one instead
+                print(f"⚠️ Batch embedding of {len(batch)} submissions failed: {e}")
+                failed = len(batch)
+            self.embed.record(time.monotonic() - began, processed=len(batch) - failed, failed=failed)
+            for submission in batch:
+                self.score.put(submission)
+
+    def _embed_batch(self, batch):
+        stale = [submission for submission in batch if submission.embedding is None or submission.embedding_hash != submission.text_hash]
+        if not stale:
+            return
+        for submission, vector in zip(stale, get_embeddings([submission.answer_text for submission in stale])):
+            submission.embedding = np.asarray(vector, dtype=np.float32).tobytes()
+            submission.embedding_hash = submission.text_hash
+        StudentAssignment.objects.bulk_update(stale, ['embedding', 'embedding_hash'])
+
+    def _score_worker(self):
+        while True:
+            submission = self.score.get()
+            if submission is _DONE:
+                return
+            began = time.monotonic()
+            try:
+                # One score worker builds a missing context while the others wait
+                with self._context_lock:
+                    context = get_grading_context(submission.assignment)
+                pipeline.check_and_grade_stage(submission, context)
+                failed = 0
+            except Exception as e:
+                pipeline.handle_failure(submission, e)
+                failed = 1
+            self.score.record(time.monotonic() - began, processed=1 - failed, failed=failed)
+
+
+def format_stats(stats, elapsed):
+    """One line per stage, for logs and management commands."""
+    lines = [f"Pipeline finished in {elapsed:.2f}s"]
+    for stage in stats:
+        lines.append(
+            f"  {stage['stage']:<8} workers={stage['workers']:<3} processed={stage['processed']:<6} failed={stage['failed']:<4} "
+            f"throughput={stage['throughput']:.1f}/s utilization={stage['utilization']:.0%} "
+            f"queue max={stage['max_depth']} mean={stage['mean_depth']:.1f}"
+        )
+    return lines
@@ -0,0 +1,59 @@
+"""
+Grade statistics for the student dashboard and the assignment detail page.
+The teacher dashboard reads running totals instead (services/teacher_stats.py).
+
+Every figure is computed by the database: each function is a single
+aggregate query however many submissions there are, instead of loading the
+graded rows (and each row's assignment) to add them up in Python.
+
+Average percentages are total score over total maximum score of the graded
+submissions, so a 10-point and a 100-point assignment weigh accordingly.
+"""
+from django.db.models import Count, Q, Sum
+from Student.models import StudentAssignment
+
+_GRADED = Q(is_graded=True)
+
+
+def _percentage(total_score, total_max):
+    if not total_max:
+        return 0
+    return round(float(total_score or 0) / float(total_max) * 100, 1)
+
+
+def submission_stats(submissions):
+    """
+    Count and grade a StudentAssignment queryset in one query: submitted,
+    graded and ungraded counts and the average percentage of the graded
+    ones (None when nothing is graded yet).
+    """
+    totals = submissions.order_by().aggregate(
+        submitted=Count('id'),
+        graded=Count('id', filter=_GRADED),
+        total_score=Sum('score', filter=_GRADED),
+        total_max=Sum('assignment__max_score', filter=_GRADED),
+    )
+    return {
+        'submitted': totals['submitted'],
+        'graded': totals['graded'],
+        'ungraded': totals['submitted'] - totals['graded'],
+        'average_percentage': _percentage(totals['total_score'], totals['total_max']) if totals['graded'] else None,
+    }
+
+
+def student_stats(student, visible_assignment_ids):
+    """
+    Dashboard figures of one student: visible and completed assignments and
+    the average percentage. Pending assignments are a stored counter
+    (services/counters.py).
+    """
+    totals = StudentAssignment.objects.filter(student=student).order_by().aggregate(
+        graded=Count('id', filter=_GRADED),
+        total_score=Sum('score', filter=_GRADED),
+        total_max=Sum('assignment__max_score', filter=_GRADED),
+    )
+    return {
+        'total_assignments': len(visible_assignment_ids),
+        'completed_assignments': totals['graded'],
+        'average_percentage': _percentage(totals['total_score'], totals['total_max']),
+    }
@@ -1,86 +1,128 @@
-from celery import shared_task
-from Student.models import StudentAssignment
-from services.ocr import extract_text_from_file
-from services.grading import auto_grade
-from services.plagiarism import check_plagiarism
+"""
+Background tasks, run by `manage.py run_workers` from the database job queue
+(see services/jobs.py).
+
+Student submissions are interactive and run first; key text extraction is
+normal priority; batch processing, re-grades and sweeps are background
+work. Each assignment's plagiarism sweep is queued to run at its deadline. Submissions share workers fairly per classroom, teacher-initiated
+work per teacher.
+"""
 import os
+from django.utils import timezone
+from Teacher.models import Assignment
+from . import pipeline
+from Student.models import Job
+from .jobs import task
+from .notifications import fan_out
+from .ocr import extract_text_from_file
+from .plagiarism import sweep_assignment
+from .regrade import regrade_assignment as regrade
+
 
-@shared_task
-def process_submission(submission_id):
+@task('process_submission', bind=True, priority=Job.PRIORITY_INTERACTIVE)
+def process_submission(job, submission_id):
     """
     Process a student submission:
     1. Extract text from uploaded file if needed
-    2. Auto-grade if answer key exists
-    3. Check for plagiarism
+    2. Check for plagiarism
+    3. Auto-grade against the assignment's key answer
+    """
+    pipeline.process_submission(submission_id, final_attempt=job.attempts >= job.max_attempts)
+
+
+@task('process_submissions', priority=Job.PRIORITY_BACKGROUND)
+def process_submissions(submission_ids):
+    """Process a batch of submissions, sharing each assignment's grading context."""
+    pipeline.process_batch(submission_ids)
+
+
+@task('sweep_plagiarism', priority=Job.PRIORITY_BACKGROUND)
+def sweep_plagiarism(assignment_id):
+    """Rebuild every plagiarism pair of an assignment after its deadline."""
+    assignment = Assignment.objects.filter(pk=assignment_id).first()
+    if assignment is None:
+        print(f"❌ Assignment {assignment_id} not found")
+        return
+    if assignment.due_date > timezone.now():
+        # The deadline moved; schedule_sweep queued a job for the new one
+        print(f"⚠️ Assignment {assignment_id} is not due yet, sweep skipped")
+        return
+    matches = sweep_assignment(assignment)
+    print(f"✅ Plagiarism sweep of assignment {assignment_id} complete: {matches} matching pairs")
+
+
+@task('regrade_assignment', priority=Job.PRIORITY_BACKGROUND)
+def regrade_assignment(assignment_id):
+    """Re-score an assignment's submissions against its current answer key."""
+    assignment = Assignment.objects.filter(pk=assignment_id).first()
+    if assignment is None:
+        print(f"❌ Assignment {assignment_id} not found")
+        return
+    count = regrade(assignment, progress=lambda done, total: print(f"🔄 Re-graded {done}/{total} submissions of assignment {assignment_id}"))
+    print(f"✅ Re-grade of assignment {assignment_id} complete: {count} submissions")
+
+
+@task('extract_key_text')
+def extract_key_text(assignment_id, regrade=False):
+    """
+    Extract the key answer text from the assignment's uploaded key file; with
+    regrade, re-grade the submissions against it afterwards.
+    """
+    assignment = Assignment.objects.filter(pk=assignment_id).first()
+    if assignment is None or not assignment.key_answer_file:
+        print(f"❌ Assignment {assignment_id} not found or has no key answer file")
+        return
+    file_path = assignment.key_answer_file.path
+    if not os.path.exists(file_path):
+        print(f"⚠️ Key answer file of assignment {assignment_id} is missing")
+        return
+    extracted_text = extract_text_from_file(file_path)
+    if extracted_text:
+        assignment.key_answer_text = extracted_text
+        assignment.save(update_fields=['key_answer_text', 'updated_at'])
+    if regrade:
+        enqueue_regrade(assignment)
+
+
+@task('notify_students')
+def notify_students(assignment_id, message, refresh=False):
+    """Notify a large classroom about a new or edited assignment."""
+    assignment = Assignment.objects.select_related('classroom').filter(pk=assignment_id).first()
+    if assignment is None:
+        print(f"❌ Assignment {assignment_id} not found")
+        return
+    created, updated = fan_out(assignment, message, refresh)
+    print(f"✅ Notified students of assignment {assignment_id}: {created} new, {updated} updated")
+
+
+def classroom_key(assignment):
+    return f"classroom:{assignment.classroom_id}"
+
+
+def teacher_key(assignment):
+    return f"teacher:{assignment.teacher_id}"
+
+
+def enqueue_submission(submission):
+    """Queue a submission for extraction, plagiarism checking and grading."""
+    return process_submission.enqueue(submission_id=submission.pk, fair_key=classroom_key(submission.assignment))
+
+
+def enqueue_regrade(assignment):
+    """
+    Queue a re-grade of the assignment unless one is already waiting to run;
+    a queued job reads the key when it starts, so one job covers every edit
+    made before then.
+    """
+    pending = Job.objects.filter(name='regrade_assignment', status=Job.STATUS_QUEUED, payload__assignment_id=assignment.pk).first()
+    return pending or regrade_assignment.enqueue(assignment_id=assignment.pk, fair_key=teacher_key(assignment))
+
+
+def schedule_sweep(assignment):
+    """
+    Queue the plagiarism sweep of the assignment for its deadline, replacing
+    one queued for an earlier deadline.
     """
-    try:
-        submission = StudentAssignment.objects.get(id=submission_id)
-        text = submission.answer_text
-
-        # Extract text from file if file exists and no text is present
-        if submission.file and (not text or not text.strip()):
-            try:
-                file_path = submission.file.path
-                if os.path.exists(file_path):
-                    print(f"📄 Extracting text from file: {file_path}")
-                    text = extract_text_from_file(file_path)
-                    if text and text.strip():
-                        submission.answer_text = text
-                        print(f"✅ Extracted text: {len(text)} characters")
-                    else:
-                        print(f"⚠️ No text extracted from file")
-                else:
-                    print(f"⚠️ File not found at path: {file_path}")
-            except Exception as e:
-                print(f"❌ Error extracting text from file: {e}")
-                # Continue processing even if OCR fails
-        
-        # Update text variable after extraction
-        text = submission.answer_text
-        
-        # Auto-grade if answer key exists and we have text
-        if submission.assignment.answer_key and text and text.strip():
-            try:
-                answer_key_path = submission.assignment.answer_key.path
-                if os.path.exists(answer_key_path):
-                    print(f"📝 Extracting text from answer key: {answer_key_path}")
-                    key_text = extract_text_from_file(answer_key_path)
-                    if key_text and key_text.strip():
-                        score = auto_grade(text, key_text)
-                        submission.score = int(round(score))
-                        submission.is_graded = True
-                        print(f"✅ Graded submission: {submission.score}/100")
-                    else:
-                        print(f"⚠️ Could not extract text from answer key")
-                else:
-                    print(f"⚠️ Answer key file not found at path: {answer_key_path}")
-            except Exception as e:
-                print(f"❌ Error during auto-grading: {e}")
-        
-        # Check for plagiarism if we have text
-        if text and text.strip():
-            try:
-                others = StudentAssignment.objects.filter(
-                    assignment=submission.assignment
-                ).exclude(id=submission.id).exclude(answer_text__isnull=True).exclude(answer_text='').values_list('answer_text', flat=True)
-                
-                if others:
-                    plagiarism_detected = check_plagiarism(text, list(others))
-                    submission.plagiarism = plagiarism_detected
-                    if plagiarism_detected:
-                        print(f"⚠️ Plagiarism detected for submission {submission.id}")
-                    else:
-                        print(f"✅ No plagiarism detected")
-                else:
-                    submission.plagiarism = False
-            except Exception as e:
-                print(f"❌ Error during plagiarism check: {e}")
-        
-        submission.save()
-        print(f"✅ Successfully processed submission {submission.id}")
-        
-    except StudentAssignment.DoesNotExist:
-        print(f"❌ Submission {submission_id} not found")
-    except Exception as e:
-        print(f"❌ Error processing submission {submission_id}: {e}")
-        raise
\ No newline at end of file
+    Job.objects.filter(name='sweep_plagiarism', status=Job.STATUS_QUEUED, payload__assignment_id=assignment.pk).delete()
+    delay = max(0.0, (assignment.due_date - timezone.now()).total_seconds())
+    return sweep_plagiarism.enqueue(delay=delay, assignment_id=assignment.pk, fair_key=teacher_key(assignment))
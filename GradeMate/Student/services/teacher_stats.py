@@ -0,0 +1,145 @@
+"""
+Teacher dashboard statistics kept as running totals, so the dashboard reads
+a few rows by primary key or short index range however long the teacher's
+history is.
+
+- TeacherStats (one row per teacher): assignment counts, the number and the
+  score/maximum sums of graded submissions (the average grade) and the
+  students in the classrooms of the teacher's active assignments
+- Assignment.submission_count / ungraded_count: per-assignment figures for
+  the dashboard and assignment lists
+
+Submission, grading and assignment creation events move the totals with
+UPDATE ... SET n = n + delta in the transaction that makes the change (via
+record_submissions from services/counters.py and Student.signals). Figures
+that follow memberships or an assignment's edited settings (students,
+active assignments, a changed max_score) mark the row stale instead, and
+it is recounted on the next read. reconcile() recounts from the tables;
+`manage.py reconcile_counters` runs it for every teacher.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Subquery, Sum, Value
+from Student.models import StudentAssignment, TeacherStats
+from Teacher.models import Assignment, ClassroomMembership
+
+STATS_FIELDS = ['assignments', 'active_assignments', 'students', 'graded_submissions', 'graded_score', 'graded_max_score']
+RECONCILE_CHUNK_SIZE = 500
+
+
+def _teacher_of(assignment_id):
+    return Subquery(Assignment.objects.filter(pk=assignment_id).values('teacher_id'))
+
+
+def adjust(teachers, **deltas):
+    """Add deltas (field=delta) to the stats of teachers (ids or a subquery)."""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        TeacherStats.objects.filter(teacher_id__in=teachers).update(**changes)
+
+
+def mark_stale(teachers):
+    """Have the stats of teachers (ids or a subquery) recounted on their next read."""
+    TeacherStats.objects.filter(teacher_id__in=teachers, stale=False).update(stale=True)
+
+
+def mark_classrooms_stale(classroom_ids):
+    """mark_stale for the teachers with an active assignment in any of classroom_ids (their students changed)."""
+    mark_stale(Assignment.objects.filter(classroom_id__in=classroom_ids, is_active=True).values('teacher_id'))
+
+
+def record_submissions(assignment_id, submissions=0, ungraded=0, graded=0, score=Decimal(0)):
+    """
+    Apply submission deltas of one assignment: its submission and ungraded
+    counts, and its teacher's graded count and score sums (the maximum grows
+    by the assignment's max_score per graded submission). A score of None
+    means the change is not known and the teacher's stats are recounted.
+    """
+    changes = {field: F(field) + delta for field, delta in (('submission_count', submissions), ('ungraded_count', ungraded)) if delta}
+    if changes:
+        Assignment.objects.filter(pk=assignment_id).update(**changes)
+    if score is None:
+        mark_stale(_teacher_of(assignment_id))
+    elif graded or score:
+        max_score = Subquery(Assignment.objects.filter(pk=assignment_id).values('max_score'))
+        TeacherStats.objects.filter(teacher_id__in=_teacher_of(assignment_id)).update(
+            graded_submissions=F('graded_submissions') + graded,
+            graded_score=F('graded_score') + Value(score, output_field=DecimalField()),
+            graded_max_score=F('graded_max_score') + max_score * Value(Decimal(graded), output_field=DecimalField()),
+        )
+
+
+def _count(teacher_ids):
+    """Exact stats of teacher_ids, counted from the tables."""
+    counts = {teacher_id: dict.fromkeys(STATS_FIELDS, 0) for teacher_id in teacher_ids}
+    assignments = Assignment.objects.filter(teacher_id__in=teacher_ids).order_by().values('teacher_id').annotate(
+        total=Count('id'), active=Count('id', filter=Q(is_active=True))
+    )
+    for row in assignments:
+        counts[row['teacher_id']].update(assignments=row['total'], active_assignments=row['active'])
+    graded = StudentAssignment.objects.filter(teacher_id__in=teacher_ids, is_graded=True).order_by().values('teacher_id').annotate(
+        n=Count('id'), score=Sum('score'), max_score=Sum('assignment__max_score')
+    )
+    for row in graded:
+        counts[row['teacher_id']].update(graded_submissions=row['n'], graded_score=row['score'] or 0, graded_max_score=row['max_score'] or 0)
+    students = ClassroomMembership.objects.filter(
+        classroom__assignments__teacher_id__in=teacher_ids, classroom__assignments__is_active=True
+    ).order_by().values('classroom__assignments__teacher_id').annotate(n=Count('student_id', distinct=True))
+    for row in students:
+        counts[row['classroom__assignments__teacher_id']]['students'] = row['n']
+    return counts
+
+
+def _reconcile_assignments(teacher_ids):
+    """Recount the submission and ungraded counts of the teachers' assignments; returns how many had drifted."""
+    actual = {
+        row['assignment_id']: (row['n'], row['ungraded'])
+        for row in StudentAssignment.objects.filter(assignment__teacher_id__in=teacher_ids).order_by().values('assignment_id').annotate(
+            n=Count('id'), ungraded=Count('id', filter=Q(is_graded=False))
+        )
+    }
+    changed = []
+    for assignment in Assignment.objects.select_for_update().filter(teacher_id__in=teacher_ids).only('id', *Assignment.COUNT_FIELDS):
+        submissions, ungraded = actual.get(assignment.pk, (0, 0))
+        if (assignment.submission_count, assignment.ungraded_count) != (submissions, ungraded):
+            assignment.submission_count, assignment.ungraded_count = submissions, ungraded
+            changed.append(assignment)
+    Assignment.objects.bulk_update(changed, list(Assignment.COUNT_FIELDS))
+    return len(changed)
+
+
+def reconcile(teacher_ids):
+    """
+    Recount the stats of teacher_ids and their assignments' counts and store
+    them. Returns the number of rows that were missing or had drifted.
+    """
+    teacher_ids = list(teacher_ids)
+    repaired = 0
+    for start in range(0, len(teacher_ids), RECONCILE_CHUNK_SIZE):
+        chunk = teacher_ids[start:start + RECONCILE_CHUNK_SIZE]
+        with transaction.atomic():
+            counts = _count(chunk)
+            existing = {row.teacher_id: row for row in TeacherStats.objects.select_for_update().filter(teacher_id__in=chunk)}
+            created, changed = [], []
+            for teacher_id, values in counts.items():
+                row = existing.get(teacher_id)
+                if row is None:
+                    created.append(TeacherStats(teacher_id=teacher_id, **values))
+                elif row.stale or any(getattr(row, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(row, field, value)
+                    row.stale = False
+                    changed.append(row)
+            TeacherStats.objects.bulk_create(created, ignore_conflicts=True)
+            TeacherStats.objects.bulk_update(changed, STATS_FIELDS + ['stale'])
+            repaired += len(created) + len(changed) + _reconcile_assignments(chunk)
+    return repaired
+
+
+def get_teacher_stats(teacher):
+    """The teacher's stats: one read, plus a recount when the row is missing or stale."""
+    stats = TeacherStats.objects.filter(teacher=teacher).first()
+    if stats is None or stats.stale:
+        reconcile([teacher.pk])
+        stats = TeacherStats.objects.get(teacher=teacher)
+    return stats
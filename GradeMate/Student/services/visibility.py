@@ -0,0 +1,87 @@
+"""
+Which assignments a student can see.
+
+A student sees every active assignment they were notified about or that was
+given to one of their classrooms (ClassroomMembership). visible_assignment_ids
+resolves that in one query and keeps the result in Django's cache per
+student, so the dashboard, assignment list, detail and submit views share it.
+The cache is the database backend set in CACHES, so a change made by a job
+worker or another web process invalidates the sets every process reads.
+
+Cached sets are dropped when the student's notifications or memberships
+change. Any assignment change (new, edited, deactivated, deleted) bumps a
+generation number stored with every set, which retires all cached sets at
+once; assignments change far less often than students load pages. A lookup
+reads the generation and the student's set together, in one cache read.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from Teacher.models import Assignment
+
+_DEFAULTS = {
+    'CACHE_TIMEOUT': 300,
+}
+
+_GENERATION_KEY = "visible-assignments:generation"
+
+
+def visibility_setting(name):
+    return getattr(settings, 'ASSIGNMENT_VISIBILITY', {}).get(name, _DEFAULTS[name])
+
+
+def _generation():
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        # Seeded from the clock, so a generation that was evicted from the
+        # cache is not restarted at a number whose keys may still be cached
+        cache.add(_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(_GENERATION_KEY)
+    return generation
+
+
+def _key(student_id):
+    return f"visible-assignments:{student_id}"
+
+
+def resolve_visible_assignment_ids(student):
+    """The ids of the active assignments student can see, straight from the database."""
+    notified = Assignment.objects.filter(notifications__student=student, is_active=True).order_by().values_list('id', flat=True)
+    assigned = Assignment.objects.filter(classroom__memberships__student=student, is_active=True).order_by().values_list('id', flat=True)
+    return frozenset(notified.union(assigned))
+
+
+def visible_assignment_ids(student):
+    """The ids of the active assignments student can see, cached per student."""
+    key = _key(student.pk)
+    cached = cache.get_many([_GENERATION_KEY, key])
+    generation = cached.get(_GENERATION_KEY) or _generation()
+    entry = cached.get(key)
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+    ids = resolve_visible_assignment_ids(student)
+    cache.set(key, (generation, ids), visibility_setting('CACHE_TIMEOUT'))
+    return ids
+
+
+def visible_assignments(student):
+    """QuerySet of the assignments student can see."""
+    return Assignment.objects.filter(id__in=visible_assignment_ids(student))
+
+
+def can_see_assignment(student, assignment):
+    return assignment.pk in visible_assignment_ids(student)
+
+
+def invalidate_students(student_ids):
+    """Drop the cached sets of these students (after notification or membership changes)."""
+    cache.delete_many([_key(student_id) for student_id in set(student_ids)])
+
+
+def invalidate_all():
+    """Retire every cached set (after any assignment change)."""
+    try:
+        cache.incr(_GENERATION_KEY)
+    except ValueError:
+        # No generation stored: the next reader seeds a new one
+        pass
@@ -0,0 +1,114 @@
+"""
+Keep derived data in step with the tables it comes from:
+
+- cached assignment visibility (services/visibility.py) is dropped when
+  assignments, notifications or memberships change
+- dashboard counters (services/counters.py) and teacher stats
+  (services/teacher_stats.py) follow notifications, submissions and
+  assignments, and are marked for a recount when what they depend on
+  changes in ways a delta cannot express
+- submissions keep a copy of their assignment's teacher
+
+Cache invalidation and recounts wait for the commit where a page load in
+between could otherwise read and keep the old state.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from Teacher.models import Assignment, Classroom, Notification, Subject
+from .models import StudentAssignment
+from .services import counters, teacher_stats
+from .services.visibility import invalidate_all, invalidate_students
+
+
+def _cascaded_from_assignment(origin):
+    """Whether a delete was started by an assignment (or a parent of one), which recounts its audience as a whole."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Assignment, Classroom, Subject)
+
+
+# Assignment settings the teacher stats depend on
+_STATS_FIELDS = ('classroom_id', 'teacher_id', 'is_active', 'max_score')
+
+
+@receiver(pre_save, sender=Assignment)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._previous = Assignment.objects.filter(pk=instance.pk).values(*_STATS_FIELDS).first()
+
+
+@receiver(post_save, sender=Assignment)
+def assignment_saved(sender, instance, created, raw=False, **kwargs):
+    transaction.on_commit(invalidate_all)
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None) or {}
+    classroom_ids = {instance.classroom_id, previous.get('classroom_id')} - {None}
+    transaction.on_commit(lambda: counters.mark_audience_stale(instance.pk, classroom_ids))
+    if created:
+        teacher_stats.adjust([instance.teacher_id], assignments=1, active_assignments=int(instance.is_active))
+        # A classroom new to the teacher's active assignments brings its students
+        if instance.is_active and not Assignment.objects.filter(
+            teacher_id=instance.teacher_id, classroom_id=instance.classroom_id, is_active=True
+        ).exclude(pk=instance.pk).exists():
+            transaction.on_commit(lambda: teacher_stats.mark_stale([instance.teacher_id]))
+    elif any(previous.get(field, getattr(instance, field)) != getattr(instance, field) for field in _STATS_FIELDS):
+        teachers = {instance.teacher_id, previous['teacher_id']}
+        transaction.on_commit(lambda: teacher_stats.mark_stale(teachers))
+        if previous['teacher_id'] != instance.teacher_id:
+            # Submissions carry their assignment's teacher
+            StudentAssignment.objects.filter(assignment=instance).update(teacher_id=instance.teacher_id)
+            transaction.on_commit(lambda: counters.mark_stale(teachers))
+
+
+@receiver(pre_delete, sender=Assignment)
+def assignment_deleting(sender, instance, **kwargs):
+    # The audience is read now, while the assignment's notifications exist
+    members = instance.classroom.memberships.values_list('student_id', flat=True)
+    notified = Notification.objects.filter(assignment=instance).values_list('student_id', flat=True)
+    users = set(members) | set(notified) | {instance.teacher_id}
+    transaction.on_commit(lambda: counters.mark_stale(users))
+    transaction.on_commit(lambda: teacher_stats.mark_stale([instance.teacher_id]))
+
+
+@receiver(post_delete, sender=Assignment)
+def assignment_deleted(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_all)
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, raw=False, **kwargs):
+    # A notification's student and assignment never change, so only new
+    # ones (not e.g. marking one read) can make an assignment visible
+    if created and not raw:
+        if not instance.is_read:
+            counters.adjust([instance.student_id], unread_notifications=1)
+        transaction.on_commit(lambda: invalidate_students([instance.student_id]))
+        transaction.on_commit(lambda: counters.mark_stale([instance.student_id]))
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, origin=None, **kwargs):
+    transaction.on_commit(lambda: invalidate_students([instance.student_id]))
+    if not _cascaded_from_assignment(origin):
+        if not instance.is_read:
+            counters.adjust([instance.student_id], unread_notifications=-1)
+        transaction.on_commit(lambda: counters.mark_stale([instance.student_id]))
+
+
+@receiver(post_save, sender=StudentAssignment)
+def submission_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.record_new_submissions(instance.assignment_id, [instance])
+    elif update_fields is None or 'is_graded' in update_fields:
+        counters.record_grading(instance.assignment_id, [instance])
+
+
+@receiver(post_delete, sender=StudentAssignment)
+def submission_deleted(sender, instance, origin=None, **kwargs):
+    if not _cascaded_from_assignment(origin):
+        counters.record_deleted_submission(instance)
+        transaction.on_commit(lambda: counters.mark_stale([instance.student_id]))
@@ -1,3 +1,1202 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from datetime import timedelta
+from io import StringIO
+from operator import attrgetter
+from unittest import mock, skipUnless
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from Teacher.models import Assignment, Classroom, Notification, Question, Subject
+from USER.models import User
+from .models import AnswerFingerprint, GradeMemo, Job, PlagiarismPair, StudentAssignment, TeacherStats, UserCounters
+from .services import admission, batch_grading, counters, events, grading, memo, pipeline, tasks
+from .services.admission import Limiter, Overloaded, admission_setting
+from .services.batch_grading import grade_sheets, match_students
+from .services.benchmark import HashingEmbedder, generate_corpus, run_engine
+from .services.fingerprint import KGRAM_SIZE, WINDOW_SIZE, align_matches, fingerprint, highlight_segments, tokenize
+from .services.grading import (
+    RUBRIC_FULL_CREDIT, RUBRIC_NO_CREDIT, GradingContext, get_grading_context, invalidate_grading_context, parse_rubric, split_sentences,
+)
+from .services.jobs import claim, enqueue, queue_setting, renew_lease, requeue, run_job, task
+from .services.pagination import keyset_page
+from .services.plagiarism import find_exact_duplicate, sweep_assignment, update_plagiarism_pairs
+from .services.regrade import regrade_assignment
+from .services.stages import StagedPipeline, format_stats
+from .services.teacher_stats import get_teacher_stats
+from .services.stats import student_stats, submission_stats
+from .services.visibility import resolve_visible_assignment_ids, visible_assignment_ids
+from .views import AssignmentView, NotificationListView, ResultList
 
-# Create your tests here.
+
+class QueryBudgetMixin:
+    """
+    Query-count regression checks for list pages: a page must cost the same
+    number of queries however many rows it shows or the table holds.
+    """
+    SIZES = (2, 12)
+
+    def assertFlatQueryCount(self, seed, fetch, sizes=SIZES):
+        """
+        seed(n) brings the data up to n rows; fetch(n) loads a page of up to
+        n rows. The seeded rows are rolled back afterwards, so every check
+        starts from the same data.
+        """
+        counts = {}
+        with transaction.atomic():
+            for size in sizes:
+                seed(size)
+                with CaptureQueriesContext(connection) as queries:
+                    fetch(size)
+                counts[size] = len(queries)
+            transaction.set_rollback(True)
+        self.assertEqual(len(set(counts.values())), 1, f"Query count grows with the rows: {counts}")
+
+    def page_rows(self, view_class, user, page_size, fields):
+        """
+        Run a ListView the way the template would and read the given
+        (dotted) fields of every row on the first page, like the template does.
+        """
+        request = RequestFactory().get('/')
+        request.user = user
+        view = view_class()
+        view.setup(request)
+        view.paginate_by = page_size
+        view.object_list = view.get_queryset()
+        rows = list(view.get_context_data()['object_list'])
+        for row in rows:
+            for field in fields:
+                attrgetter(field)(row)
+        return rows
+
+
+@skipUnless(connection.vendor == 'sqlite', "Reads SQLite's EXPLAIN QUERY PLAN output")
+class QueryPlanMixin:
+    """
+    Index regression checks for hot pages: EXPLAIN QUERY PLAN every query a
+    page issues and require the given indexes, and no full scan of the large
+    tables, so a changed filter or ordering cannot silently fall off its index.
+    """
+    LARGE_TABLES = ('Student_studentassignment', 'Teacher_notification', 'Teacher_assignment')
+
+    def query_plans(self, fetch):
+        """The plan steps of every SELECT fetch() runs."""
+        with CaptureQueriesContext(connection) as queries:
+            fetch()
+        steps = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    steps += [row[3] for row in cursor.fetchall()]
+        return steps
+
+    def assertUsesIndexes(self, fetch, *indexes):
+        steps = self.query_plans(fetch)
+        plan = "\n".join(steps)
+        for index in indexes:
+            self.assertTrue(any(f' INDEX {index} ' in f'{step} ' for step in steps), f"{index} is not used:\n{plan}")
+        for table in self.LARGE_TABLES:
+            self.assertNotIn(f'SCAN {table}', steps, f"Full scan of {table}:\n{plan}")
+
+
+def fake_embedding(text):
+    """Bag-of-words vector: equal texts are identical, texts sharing no words are (nearly) orthogonal."""
+    vector = np.zeros(64, dtype=np.float32)
+    for word, _, _ in tokenize(text):
+        vector[zlib.crc32(word.encode()) % 64] += 1
+    return vector
+
+
+def fake_embeddings(texts):
+    return np.vstack([fake_embedding(text) for text in texts]) if texts else np.zeros((0, 64), dtype=np.float32)
+
+
+class FakeEmbeddingMixin:
+    """Stands fake_embedding in for the sentence embedding model, which tests cannot download."""
+    EMBEDDING_FUNCTIONS = (
+        'ai_evaluator.get_embedding', 'batch_grading.get_embeddings', 'grading.get_embedding', 'grading.get_embeddings', 'plagiarism.get_embedding',
+        'plagiarism.get_embeddings', 'regrade.get_embeddings', 'stages.get_embeddings',
+    )
+
+    def setUp(self):
+        super().setUp()
+        for target in self.EMBEDDING_FUNCTIONS:
+            batch = target.endswith('get_embeddings')
+            self.enterContext(mock.patch(f'Student.services.{target}', side_effect=fake_embeddings if batch else fake_embedding))
+        invalidate_grading_context()
+        self.addCleanup(invalidate_grading_context)
+
+
+class SubmissionFixtureMixin:
+    """A teacher's assignment to a classroom of students, with uploads stored in a temporary MEDIA_ROOT."""
+    STUDENT_COUNT = 3
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.teacher = User.objects.create_user(username='teacher', password='pw', name='Teacher', role='teacher')
+        self.subject = Subject.objects.create(name='Science')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.students = [
+            User.objects.create_user(username=f'student{i}', password='pw', name=f'Student {i}', role='student', class_grade='10-A')
+            for i in range(self.STUDENT_COUNT)
+        ]
+        self.assignment = Assignment.objects.create(
+            title='Photosynthesis', teacher=self.teacher, subject=self.subject, classroom=self.classroom,
+            due_date=timezone.now() + timedelta(days=7), key_answer_text=KEY_ANSWER,
+        )
+
+    def submit(self, student, text='', **kwargs):
+        return StudentAssignment.objects.create(assignment=self.assignment, student=student, answer_text=text, **kwargs)
+
+
+KEY_ANSWER = (
+    "Plants capture sunlight with chlorophyll in their chloroplasts. The light energy splits water and releases oxygen. "
+    "Carbon dioxide is fixed into glucose in the Calvin cycle."
+)
+ORIGINAL_ANSWER = (
+    "Chlorophyll inside the chloroplasts absorbs sunlight, and that energy splits water molecules so oxygen is released. "
+    "The plant then fixes carbon dioxide into glucose during the Calvin cycle."
+)
+UNRELATED_ANSWER = "Volcanoes erupt when magma pressure beneath tectonic plates forces molten rock through vents in the crust."
+
+
+class VisibleAssignmentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        self.student = User.objects.create(username='student', name='Student', role='student', class_grade='10-A')
+        self.subject = Subject.objects.create(name='Science')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.other = Classroom.objects.create(name='Grade 9-B', grade='9', section='B')
+        self.assigned = self.create_assignment(self.classroom)
+        self.notified = self.create_assignment(self.other)
+        Notification.objects.create(assignment=self.notified, student=self.student, message='New assignment')
+        self.hidden = self.create_assignment(self.other)
+
+    def create_assignment(self, classroom, **kwargs):
+        return Assignment.objects.create(
+            title='Assignment', teacher=self.teacher, subject=self.subject, classroom=classroom,
+            due_date=timezone.now(), **kwargs
+        )
+
+    def test_classroom_and_notified_assignments(self):
+        ids = visible_assignment_ids(self.student)
+        self.assertEqual(ids, {self.assigned.pk, self.notified.pk})
+        # A hit is one read of the cache table, which returns the generation with the set
+        with self.assertNumQueries(1):
+            self.assertEqual(visible_assignment_ids(self.student), ids)
+
+    def test_cache_is_shared_between_processes(self):
+        # Job workers and other web processes invalidate through the same table
+        self.assertIsInstance(caches['default'], DatabaseCache)
+
+    def test_assignment_changes_invalidate(self):
+        visible_assignment_ids(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assigned.is_active = False
+            self.assigned.save()
+            added = self.create_assignment(self.classroom)
+        self.assertEqual(visible_assignment_ids(self.student), {self.notified.pk, added.pk})
+
+    def test_notification_invalidates(self):
+        visible_assignment_ids(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(assignment=self.hidden, student=self.student, message='New assignment')
+        self.assertIn(self.hidden.pk, visible_assignment_ids(self.student))
+
+    def test_membership_invalidates(self):
+        visible_assignment_ids(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.class_grade = '9-B'
+            self.student.save()
+        self.assertEqual(visible_assignment_ids(self.student), {self.notified.pk, self.hidden.pk})
+        self.assertEqual(visible_assignment_ids(self.student), resolve_visible_assignment_ids(self.student))
+
+
+class GradeStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        subject = Subject.objects.create(name='Science')
+        classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        cls.ten = Assignment.objects.create(
+            title='Quiz', teacher=cls.teacher, subject=subject, classroom=classroom, due_date=timezone.now(), max_score=10
+        )
+        cls.hundred = Assignment.objects.create(
+            title='Exam', teacher=cls.teacher, subject=subject, classroom=classroom, due_date=timezone.now(), max_score=100,
+            is_active=False,
+        )
+        cls.students = [
+            User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade='10-A')
+            for i in range(6)
+        ]
+        # Quiz: 8/10, 6/10 graded and two ungraded; exam: 70/100 graded
+        for student, score, graded in zip(cls.students, [8, 6, 0, 0], [True, True, False, False]):
+            StudentAssignment.objects.create(assignment=cls.ten, student=student, score=score, is_graded=graded)
+        StudentAssignment.objects.create(assignment=cls.hundred, student=cls.students[0], score=70, is_graded=True)
+
+    def test_submission_stats(self):
+        with self.assertNumQueries(1):
+            stats = submission_stats(StudentAssignment.objects.filter(assignment=self.ten))
+        self.assertEqual(stats, {'submitted': 4, 'graded': 2, 'ungraded': 2, 'average_percentage': 70.0})
+        self.assertIsNone(submission_stats(StudentAssignment.objects.filter(assignment=self.ten, is_graded=False))['average_percentage'])
+
+    def test_student_stats(self):
+        with self.assertNumQueries(1):
+            stats = student_stats(self.students[0], {self.ten.pk})
+        self.assertEqual(stats, {'total_assignments': 1, 'completed_assignments': 2, 'average_percentage': 70.9})
+        self.assertEqual(student_stats(self.students[5], {self.ten.pk})['completed_assignments'], 0)
+
+    def test_query_count_does_not_grow_with_submissions(self):
+        for student in self.students[4:]:
+            StudentAssignment.objects.create(assignment=self.ten, student=student, score=5, is_graded=True)
+        with self.assertNumQueries(1):
+            submission_stats(StudentAssignment.objects.filter(assignment=self.ten))
+
+
+class StudentListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        self.student = User.objects.create_user(username='student', password='pw', name='Student', role='student', class_grade='10-A')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.client.force_login(self.student)
+
+    def seed(self, size):
+        for i in range(Assignment.objects.count(), size):
+            subject = Subject.objects.create(name=f'Subject {i}', code=f'S{i}')
+            assignment = Assignment.objects.create(
+                title=f'Assignment {i}', teacher=self.teacher, subject=subject, classroom=self.classroom,
+                due_date=timezone.now(),
+            )
+            Notification.objects.create(assignment=assignment, student=self.student, message='New assignment')
+            StudentAssignment.objects.create(
+                assignment=assignment, student=self.student, score=5, is_graded=True, evaluated_at=timezone.now()
+            )
+        # Signals invalidate on commit, which never comes inside a test
+        cache.clear()
+        UserCounters.objects.update(stale=True)
+
+    def test_dashboard(self):
+        self.assertFlatQueryCount(self.seed, lambda size: self.client.get('/Student/dashboard/'))
+
+    def test_assignment_list(self):
+        self.assertFlatQueryCount(self.seed, lambda size: self.client.get('/Student/assignments/'))
+        self.assertFlatQueryCount(self.seed, lambda size: self.page_rows(
+            AssignmentView, self.student, size, ['subject.name', 'teacher.name']
+        ))
+
+    def test_result_list(self):
+        self.assertFlatQueryCount(self.seed, lambda size: self.page_rows(
+            ResultList, self.student, size, ['assignment.title', 'assignment.subject', 'assignment.max_score']
+        ))
+
+    def test_notification_list(self):
+        self.assertFlatQueryCount(self.seed, lambda size: self.page_rows(
+            NotificationListView, self.student, size, ['assignment.title']
+        ))
+
+
+class UserCountersTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        self.student = User.objects.create(username='student', name='Student', role='student', class_grade='10-A')
+        self.subject = Subject.objects.create(name='Science')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.assignment = Assignment.objects.create(
+            title='Quiz', teacher=self.teacher, subject=self.subject, classroom=self.classroom, due_date=timezone.now()
+        )
+
+    def read(self, user):
+        return counters.get_counters(user)
+
+    def test_first_read_counts(self):
+        Notification.objects.create(assignment=self.assignment, student=self.student, message='New assignment')
+        row = self.read(self.student)
+        self.assertEqual((row.unread_notifications, row.pending_assignments), (1, 1))
+        with self.assertNumQueries(1):
+            self.read(self.student)
+
+    def test_notifications_move_unread(self):
+        self.read(self.student)
+        notification = Notification.objects.create(assignment=self.assignment, student=self.student, message='New assignment')
+        self.assertEqual(self.read(self.student).unread_notifications, 1)
+        counters.mark_notification_read(notification)
+        counters.mark_notification_read(notification)
+        self.assertEqual(self.read(self.student).unread_notifications, 0)
+
+    def test_grading_moves_ungraded(self):
+        self.read(self.teacher)
+        submission = StudentAssignment.objects.create(assignment=self.assignment, student=self.student)
+        self.assertEqual(self.read(self.teacher).ungraded_submissions, 1)
+        submission = StudentAssignment.objects.get(pk=submission.pk)
+        submission.is_graded = True
+        submission.save()
+        submission.save()
+        self.assertEqual(self.read(self.teacher).ungraded_submissions, 0)
+        submission.delete()
+        self.assertEqual(self.read(self.teacher).ungraded_submissions, 0)
+
+    def test_pending_recounted_after_changes(self):
+        self.assertEqual(self.read(self.student).pending_assignments, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentAssignment.objects.create(assignment=self.assignment, student=self.student)
+        self.assertEqual(self.read(self.student).pending_assignments, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Assignment.objects.create(
+                title='Exam', teacher=self.teacher, subject=self.subject, classroom=self.classroom, due_date=timezone.now()
+            )
+        self.assertEqual(self.read(self.student).pending_assignments, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.class_grade = '9-B'
+            self.student.save()
+        self.assertEqual(self.read(self.student).pending_assignments, 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.read(self.student)
+        self.read(self.teacher)
+        UserCounters.objects.update(pending_assignments=7, ungraded_submissions=3)
+        self.assertEqual(counters.reconcile([self.student.pk, self.teacher.pk]), 2)
+        self.assertEqual(self.read(self.student).pending_assignments, 1)
+        self.assertEqual(self.read(self.teacher).ungraded_submissions, 0)
+        self.assertEqual(counters.reconcile([self.student.pk, self.teacher.pk]), 0)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        cls.student = User.objects.create(username='student', name='Student', role='student')
+        subject = Subject.objects.create(name='Science')
+        classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        for i in range(25):
+            assignment = Assignment.objects.create(
+                title=f'Assignment {i}', teacher=teacher, subject=subject, classroom=classroom, due_date=timezone.now()
+            )
+            Notification.objects.create(assignment=assignment, student=cls.student, message='New assignment')
+        # Ties on the timestamp are broken by the id
+        Notification.objects.filter(pk__in=Notification.objects.order_by('pk').values('pk')[5:15]).update(created_at=timezone.now())
+        cls.newest_first = list(Notification.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def queryset(self):
+        return Notification.objects.filter(student=self.student)
+
+    def test_walks_every_row_once_both_ways(self):
+        seen, pages, page = [], [], keyset_page(self.queryset(), 'created_at', 4)
+        while True:
+            pages.append(page)
+            seen += [row.pk for row in page]
+            if not page.has_next():
+                break
+            page = keyset_page(self.queryset(), 'created_at', 4, after=page.next_cursor)
+        self.assertEqual(seen, self.newest_first)
+        self.assertEqual(len(pages), 7)
+
+        back = keyset_page(self.queryset(), 'created_at', 4, before=pages[-1].previous_cursor)
+        self.assertEqual([row.pk for row in back], [row.pk for row in pages[-2]])
+        first = keyset_page(self.queryset(), 'created_at', 4, before=pages[1].previous_cursor)
+        self.assertEqual([row.pk for row in first], self.newest_first[:4])
+        self.assertFalse(first.has_previous())
+
+    def test_no_count_and_flat_cost(self):
+        page = keyset_page(self.queryset(), 'created_at', 4)
+        for _ in range(4):
+            page = keyset_page(self.queryset(), 'created_at', 4, after=page.next_cursor)
+        with CaptureQueriesContext(connection) as queries:
+            keyset_page(self.queryset(), 'created_at', 4, after=page.next_cursor)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_page_numbers_for_first_pages(self):
+        page = keyset_page(self.queryset(), 'created_at', 4, page='2')
+        self.assertEqual([row.pk for row in page], self.newest_first[4:8])
+        self.assertEqual(page.number, 2)
+        after = keyset_page(self.queryset(), 'created_at', 4, after=page.next_cursor)
+        self.assertEqual([row.pk for row in after], self.newest_first[8:12])
+
+    def test_invalid_pages_are_404(self):
+        for params in ({'page': '6'}, {'page': 'x'}, {'after': 'not-a-cursor'}):
+            request = RequestFactory().get('/', params)
+            request.user = self.student
+            view = NotificationListView()
+            view.setup(request)
+            view.object_list = view.get_queryset()
+            with self.subTest(params=params), self.assertRaises(Http404):
+                view.get_context_data()
+
+    def test_submissions_follow_assignment_teacher(self):
+        assignment = Assignment.objects.first()
+        submission = StudentAssignment.objects.create(assignment=assignment, student=self.student)
+        self.assertEqual(submission.teacher_id, assignment.teacher_id)
+        other = User.objects.create(username='other', name='Other', role='teacher')
+        assignment.refresh_from_db(fields=Assignment.COUNT_FIELDS)
+        assignment.teacher = other
+        assignment.save()
+        self.assertEqual(StudentAssignment.objects.get(pk=submission.pk).teacher, other)
+
+
+class StudentQueryPlanTests(QueryPlanMixin, QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        cls.student = User.objects.create_user(username='student', password='pw', name='Student', role='student', class_grade='10-A')
+        subject = Subject.objects.create(name='Science')
+        classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        for i in range(3):
+            assignment = Assignment.objects.create(
+                title=f'Assignment {i}', teacher=teacher, subject=subject, classroom=classroom, due_date=timezone.now()
+            )
+            Notification.objects.create(assignment=assignment, student=cls.student, message='New assignment')
+            StudentAssignment.objects.create(
+                assignment=assignment, student=cls.student, score=5, is_graded=True, evaluated_at=timezone.now()
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+    def test_visible_assignments(self):
+        self.assertUsesIndexes(lambda: resolve_visible_assignment_ids(self.student), 'assignment_active', 'membership_student')
+
+    def test_dashboard(self):
+        self.assertUsesIndexes(lambda: self.client.get('/Student/dashboard/'), 'result_keyset')
+
+    def test_result_list(self):
+        self.assertUsesIndexes(lambda: self.page_rows(ResultList, self.student, 10, ['assignment.title']), 'result_keyset')
+
+    def test_notification_list(self):
+        self.assertUsesIndexes(lambda: self.page_rows(NotificationListView, self.student, 20, ['assignment.title']), 'notification_keyset')
+
+    def test_counter_recount(self):
+        self.assertUsesIndexes(lambda: counters.reconcile([self.student.pk]), 'notification_unread', 'assignment_active')
+
+
+class WinnowingTests(SimpleTestCase):
+    PASSAGE = (
+        "Photosynthesis converts light energy into chemical energy stored in glucose "
+        "molecules inside the chloroplasts of plant cells using water and carbon dioxide"
+    )
+
+    def test_fingerprints_are_stable_and_cover_the_text(self):
+        fingerprints = fingerprint(self.PASSAGE)
+        self.assertEqual(fingerprints, fingerprint(self.PASSAGE.upper()))
+        self.assertEqual([fp.position for fp in fingerprints], sorted({fp.position for fp in fingerprints}))
+        # Every window of WINDOW_SIZE k-grams keeps at least one fingerprint
+        positions = [fp.position for fp in fingerprints]
+        kgrams = len(self.PASSAGE.split()) - KGRAM_SIZE + 1
+        self.assertTrue(all(any(start <= p < start + WINDOW_SIZE for p in positions) for start in range(kgrams - WINDOW_SIZE + 1)))
+        for fp in fingerprints:
+            self.assertEqual(len(tokenize(self.PASSAGE[fp.start:fp.end])), KGRAM_SIZE)
+        self.assertEqual(fingerprint("too short"), [])
+
+    def test_copied_passage_is_aligned(self):
+        prefix = "My own introduction comes first. "
+        text = prefix + self.PASSAGE
+        spans = align_matches(fingerprint(text), fingerprint(self.PASSAGE + " and then something else"))
+        self.assertEqual(len(spans), 1)
+        start, end, other_start, other_end = spans[0]
+        self.assertEqual(text[start:end], self.PASSAGE[other_start:other_end])
+        self.assertGreaterEqual(start, len(prefix))
+        self.assertEqual(align_matches(fingerprint(text), fingerprint("Nothing in common with the other answer at all today")), [])
+
+    def test_repeated_hashes_are_not_paired(self):
+        repeated = " ".join(["the same line is written out again and again"] * 1000)
+        started = time.perf_counter()
+        self.assertEqual(align_matches(fingerprint(repeated), fingerprint(repeated)), [])
+        self.assertLess(time.perf_counter() - started, 1)
+        # A copied passage next to the boilerplate is still found
+        spans = align_matches(fingerprint(repeated + " " + self.PASSAGE), fingerprint(self.PASSAGE))
+        self.assertEqual(len(spans), 1)
+
+    def test_highlight_segments(self):
+        self.assertEqual(
+            highlight_segments("abcdefgh", [[2, 4, 0, 2], [3, 6, 0, 3]]),
+            [("ab", False), ("cd", True), ("ef", True), ("gh", False)],
+        )
+
+
+class ExactDuplicateTests(SubmissionFixtureMixin, TestCase):
+    def test_same_text_after_normalization(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        copy = self.submit(self.students[1], "  " + ORIGINAL_ANSWER.upper().replace(" ", "\n "))
+        self.submit(self.students[2], UNRELATED_ANSWER)
+        self.assertEqual(copy.text_hash, original.text_hash)
+        self.assertEqual(find_exact_duplicate(copy), original.pk)
+        self.assertEqual(find_exact_duplicate(original), copy.pk)
+
+    def test_same_file_bytes(self):
+        original = self.submit(self.students[0], file=SimpleUploadedFile('mine.txt', b'my scanned answer'))
+        copy = self.submit(self.students[1], file=SimpleUploadedFile('renamed.txt', b'my scanned answer'))
+        other = self.submit(self.students[2], file=SimpleUploadedFile('other.txt', b'a different answer'))
+        self.assertEqual(find_exact_duplicate(copy), original.pk)
+        self.assertIsNone(find_exact_duplicate(other))
+
+    def test_other_assignments_and_empty_answers_do_not_match(self):
+        elsewhere = Assignment.objects.create(
+            title='Other', teacher=self.teacher, subject=self.subject, classroom=self.classroom, due_date=timezone.now()
+        )
+        StudentAssignment.objects.create(assignment=elsewhere, student=self.students[0], answer_text=ORIGINAL_ANSWER)
+        self.assertIsNone(find_exact_duplicate(self.submit(self.students[1], ORIGINAL_ANSWER)))
+        empty = self.submit(self.students[2])
+        with self.assertNumQueries(0):
+            self.assertIsNone(find_exact_duplicate(empty))
+
+    def test_submitted_copy_is_rejected_without_model_work(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        self.client.force_login(self.students[1])
+        response = self.client.post(f'/Student/assignments/{self.assignment.pk}/submit/', {'answer_text': ORIGINAL_ANSWER})
+        self.assertRedirects(response, f'/Student/assignments/{self.assignment.pk}/', fetch_redirect_response=False)
+        copy = StudentAssignment.objects.get(student=self.students[1])
+        self.assertEqual((copy.duplicate_of_id, copy.plagiarism, copy.status), (original.pk, True, StudentAssignment.STATUS_DONE))
+        self.assertTrue(StudentAssignment.objects.get(pk=original.pk).plagiarism)
+        self.assertFalse(Job.objects.exists())
+
+
+class SubmissionPipelineTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    def process(self, submission, **kwargs):
+        statuses = []
+        advance = pipeline._advance
+        with mock.patch.object(pipeline, '_advance', side_effect=lambda s, status, *args: statuses.append(status) or advance(s, status, *args)):
+            pipeline.process_submission(submission.pk, **kwargs)
+        return statuses, StudentAssignment.objects.get(pk=submission.pk)
+
+    def test_queued_to_done(self):
+        self.client.force_login(self.students[0])
+        self.client.post(f'/Student/assignments/{self.assignment.pk}/submit/', {'answer_text': ORIGINAL_ANSWER})
+        submission = StudentAssignment.objects.get(student=self.students[0])
+        self.assertEqual(submission.status, StudentAssignment.STATUS_QUEUED)
+        self.assertEqual(Job.objects.get().payload, {'submission_id': submission.pk})
+        statuses, submission = self.process(submission)
+        self.assertEqual(statuses, [StudentAssignment.STATUS_EXTRACTING, StudentAssignment.STATUS_CHECKING, StudentAssignment.STATUS_GRADING])
+        self.assertEqual((submission.status, submission.is_graded), (StudentAssignment.STATUS_DONE, True))
+        self.assertGreater(submission.score, 0)
+        response = self.client.get(f'/Student/submissions/{submission.pk}/status/')
+        self.assertEqual(response.json()['status'], StudentAssignment.STATUS_DONE)
+        self.assertFalse(response.json()['processing'])
+
+    def test_without_text_or_key(self):
+        _, submission = self.process(self.submit(self.students[0]))
+        self.assertEqual((submission.status, submission.is_graded), (StudentAssignment.STATUS_DONE, False))
+        Assignment.objects.filter(pk=self.assignment.pk).update(key_answer_text='')
+        _, submission = self.process(self.submit(self.students[1], ORIGINAL_ANSWER))
+        self.assertEqual(submission.status_message, 'Automatic grading is not available as no answer key is provided.')
+
+    def test_extraction_failure(self):
+        submission = self.submit(self.students[0], file=SimpleUploadedFile('scan.png', b'not really an image'))
+        def unreadable(path):
+            raise ValueError("unreadable scan")
+        self.assertFalse(pipeline.extract_stage(submission, extract=unreadable))
+        submission.refresh_from_db()
+        self.assertEqual(submission.status, StudentAssignment.STATUS_FAILED)
+        self.assertIn('unreadable scan', submission.status_message)
+
+    def test_error_is_retried_then_failed(self):
+        submission = self.submit(self.students[0], ORIGINAL_ANSWER)
+        with mock.patch.object(pipeline, 'check_and_grade_stage', side_effect=RuntimeError("model crashed")):
+            with self.assertRaises(RuntimeError):
+                self.process(submission, final_attempt=False)
+            self.assertEqual(StudentAssignment.objects.get(pk=submission.pk).status, StudentAssignment.STATUS_QUEUED)
+            _, submission = self.process(submission)
+        self.assertEqual(submission.status, StudentAssignment.STATUS_FAILED)
+        self.assertIn('model crashed', submission.status_message)
+
+
+class PlagiarismPairTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    PARAPHRASE = ORIGINAL_ANSWER + " That is how plants make food."
+
+    def flags(self, *submissions):
+        return [StudentAssignment.objects.get(pk=submission.pk).plagiarism for submission in submissions]
+
+    def test_reprocessed_submission_clears_its_own_flag(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        copy = self.submit(self.students[1], self.PARAPHRASE)
+        pipeline.process_submission(original.pk)
+        pipeline.process_submission(copy.pk)
+        self.assertEqual(self.flags(original, copy), [True, True])
+        # Rewritten and processed again while still flagged: the check clears
+        # both flags and grading must not write the old one back
+        copy = StudentAssignment.objects.get(pk=copy.pk)
+        copy.answer_text = UNRELATED_ANSWER
+        copy.save(update_fields=['answer_text'])
+        pipeline.process_submission(copy.pk)
+        copy.refresh_from_db()
+        self.assertTrue(copy.is_graded)
+        self.assertEqual(self.flags(original, copy), [False, False])
+        self.assertFalse(PlagiarismPair.objects.exists())
+
+    def test_pairs_are_stored_once_per_pair(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        copy = self.submit(self.students[1], self.PARAPHRASE)
+        self.submit(self.students[2], UNRELATED_ANSWER)
+        for submission in StudentAssignment.objects.all():
+            update_plagiarism_pairs(submission)
+        pair = PlagiarismPair.objects.get()
+        self.assertEqual((pair.first_id, pair.second_id, pair.is_match), (original.pk, copy.pk, True))
+        # Recomputing from either side updates the same row
+        self.assertTrue(update_plagiarism_pairs(StudentAssignment.objects.get(pk=original.pk)))
+        self.assertTrue(update_plagiarism_pairs(StudentAssignment.objects.get(pk=copy.pk)))
+        self.assertEqual(PlagiarismPair.objects.get().pk, pair.pk)
+        self.assertEqual(self.flags(original, copy), [True, True])
+
+    def test_sweep_finds_the_pair_the_per_submission_check_missed(self):
+        # The original's embedding failed, so the copy's check had no vector to compare with
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        copy = self.submit(self.students[1], self.PARAPHRASE)
+        self.assertFalse(update_plagiarism_pairs(copy))
+        self.assertFalse(PlagiarismPair.objects.exists())
+        self.assertEqual(sweep_assignment(self.assignment), 1)
+        pair = PlagiarismPair.objects.get()
+        self.assertEqual((pair.first_id, pair.second_id, pair.is_match), (original.pk, copy.pk, True))
+        self.assertEqual(self.flags(original, copy), [True, True])
+        self.assertIsNotNone(Assignment.objects.get(pk=self.assignment.pk).plagiarism_swept_at)
+
+    def test_sweep_runs_at_the_deadline(self):
+        job = tasks.schedule_sweep(self.assignment)
+        self.assertAlmostEqual(job.run_after, self.assignment.due_date, delta=timedelta(seconds=1))
+        # A moved deadline replaces the queued sweep
+        self.assignment.due_date -= timedelta(days=1)
+        self.assignment.save()
+        tasks.schedule_sweep(self.assignment)
+        self.assertEqual(Job.objects.filter(name='sweep_plagiarism').count(), 1)
+        with mock.patch.object(tasks, 'sweep_assignment') as sweep:
+            tasks.sweep_plagiarism(self.assignment.pk)
+            sweep.assert_not_called()
+            Assignment.objects.filter(pk=self.assignment.pk).update(due_date=timezone.now())
+            tasks.sweep_plagiarism(self.assignment.pk)
+            sweep.assert_called_once()
+
+    def test_flags_clear_when_the_pair_disappears(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        copy = self.submit(self.students[1], self.PARAPHRASE)
+        update_plagiarism_pairs(original)
+        update_plagiarism_pairs(copy)
+        original = StudentAssignment.objects.get(pk=original.pk)
+        original.answer_text = UNRELATED_ANSWER
+        original.save(update_fields=['answer_text'])
+        self.assertFalse(update_plagiarism_pairs(original))
+        self.assertFalse(PlagiarismPair.objects.exists())
+        self.assertEqual(self.flags(original, copy), [False, False])
+
+    def test_resubmitted_copy_releases_its_source(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        self.client.force_login(self.students[1])
+        url = f'/Student/assignments/{self.assignment.pk}/submit/'
+        self.client.post(url, {'answer_text': ORIGINAL_ANSWER})
+        copy = StudentAssignment.objects.get(student=self.students[1])
+        self.assertEqual(self.flags(original, copy), [True, True])
+        self.client.post(url, {'answer_text': UNRELATED_ANSWER})
+        self.assertEqual(self.flags(original, copy), [False, False])
+        pipeline.process_submission(copy.pk)
+        copy.refresh_from_db()
+        self.assertEqual((copy.duplicate_of_id, copy.plagiarism, copy.is_graded), (None, False, True))
+        self.assertEqual(self.flags(original), [False])
+
+    def test_recheck_refreshes_exact_duplicates(self):
+        original = self.submit(self.students[0], ORIGINAL_ANSWER)
+        copy = self.submit(self.students[1], ORIGINAL_ANSWER, duplicate_of=original)
+        copy_of_copy = self.submit(self.students[2], ORIGINAL_ANSWER, duplicate_of=copy)
+        # Flags left stale, as by a write that skipped the refresh
+        StudentAssignment.objects.update(plagiarism=False)
+        update_plagiarism_pairs(StudentAssignment.objects.get(pk=copy.pk))
+        self.assertEqual(self.flags(original, copy, copy_of_copy), [True, True, True])
+
+
+@task('tests.record')
+def record_job(**payload):
+    JobQueueTests.runs.append(payload)
+
+
+@task('tests.fail', max_attempts=2)
+def failing_job():
+    raise RuntimeError("handler failed")
+
+
+@task('tests.slow', bind=True)
+def slow_job(job, seconds):
+    time.sleep(seconds)
+    JobLeaseTests.reclaimed_while_running = claim('another-worker') is not None
+
+
+class JobQueueTests(TestCase):
+    runs = []
+
+    def setUp(self):
+        JobQueueTests.runs = []
+
+    def expire_lease(self, job):
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_leases_a_job_to_one_worker(self):
+        job = enqueue('tests.record', {'n': 1})
+        claimed = claim('worker-1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.locked_by, claimed.attempts), (job.pk, Job.STATUS_RUNNING, 'worker-1', 1))
+        self.assertIsNone(claim('worker-2'))
+        self.assertTrue(run_job(claimed))
+        self.assertEqual(self.runs, [{'n': 1}])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.locked_until), (Job.STATUS_DONE, '', None))
+
+    def test_expired_lease_is_reclaimed_and_the_old_worker_cannot_finish(self):
+        enqueue('tests.record')
+        stalled = claim('worker-1')
+        self.expire_lease(stalled)
+        reclaimed = claim('worker-2')
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (stalled.pk, 2))
+        self.assertFalse(renew_lease(stalled))
+        run_job(stalled)
+        self.assertEqual(Job.objects.get(pk=stalled.pk).locked_by, 'worker-2')
+        self.assertTrue(renew_lease(reclaimed))
+
+    def test_retry_with_backoff_then_dead_letter(self):
+        job = enqueue('tests.fail')
+        self.assertEqual(job.max_attempts, 2)
+        before = timezone.now()
+        self.assertFalse(run_job(claim('worker-1')))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertIn('handler failed', job.last_error)
+        backoff = queue_setting('RETRY_BACKOFF')
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=backoff * 0.8))
+        self.assertLessEqual(job.run_after, timezone.now() + timedelta(seconds=backoff * 1.2))
+        self.assertIsNone(claim('worker-1'))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertFalse(run_job(claim('worker-1')))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_DEAD, 2))
+        self.assertIsNotNone(job.finished_at)
+        requeue(Job.objects.filter(pk=job.pk))
+        self.assertEqual(claim('worker-1').pk, job.pk)
+
+
+class JobLeaseTests(TransactionTestCase):
+    reclaimed_while_running = None
+
+    @override_settings(JOB_QUEUE={'LEASE_SECONDS': 0.3})
+    def test_running_job_keeps_its_lease(self):
+        job = enqueue('tests.slow', {'seconds': 0.8})
+        self.assertTrue(run_job(claim('worker-1')))
+        self.assertIs(self.reclaimed_while_running, False)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_DONE, 1))
+
+
+class GradingContextCacheTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    def test_reused_until_the_assignment_changes(self):
+        with mock.patch.object(grading, 'build_grading_context', wraps=grading.build_grading_context) as build:
+            context = get_grading_context(self.assignment)
+            self.assertIs(get_grading_context(Assignment.objects.get(pk=self.assignment.pk)), context)
+            self.assertEqual(build.call_count, 1)
+
+            self.assignment.key_answer_text = ORIGINAL_ANSWER
+            self.assignment.save()
+            self.assertFalse(context.is_current(self.assignment))
+            rebuilt = get_grading_context(self.assignment)
+            self.assertEqual(build.call_count, 2)
+        self.assertEqual(rebuilt.key_text, ORIGINAL_ANSWER)
+        self.assertNotEqual(rebuilt.memo_key, context.memo_key)
+
+    def test_changed_embedding_model_and_invalidation(self):
+        context = get_grading_context(self.assignment)
+        with mock.patch.object(grading, 'EMBEDDING_MODEL_NAME', 'another-model'):
+            self.assertFalse(context.is_current(self.assignment))
+        invalidate_grading_context(self.assignment.pk)
+        self.assertIsNot(get_grading_context(self.assignment), context)
+
+    def test_contexts_without_a_key_are_not_kept(self):
+        Assignment.objects.filter(pk=self.assignment.pk).update(key_answer_text='')
+        assignment = Assignment.objects.get(pk=self.assignment.pk)
+        context = get_grading_context(assignment)
+        self.assertFalse(context.has_key)
+        self.assertIsNot(get_grading_context(assignment), context)
+
+
+class RegradeTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    def test_key_change_rescores_finished_submissions(self):
+        get_teacher_stats(self.teacher)
+        answer = self.submit(self.students[0], ORIGINAL_ANSWER)
+        pipeline.process_submission(answer.pk)
+        flagged = self.submit(self.students[1], UNRELATED_ANSWER, plagiarism=True)
+        unprocessed = self.submit(self.students[2], UNRELATED_ANSWER, status=StudentAssignment.STATUS_QUEUED)
+        before = StudentAssignment.objects.get(pk=answer.pk).score
+
+        Assignment.objects.filter(pk=self.assignment.pk).update(key_answer_text=ORIGINAL_ANSWER, updated_at=timezone.now())
+        self.assertEqual(regrade_assignment(Assignment.objects.get(pk=self.assignment.pk)), 1)
+        answer.refresh_from_db()
+        self.assertGreater(answer.score, before)
+        self.assertEqual(answer.score, self.assignment.max_score)
+        for untouched in (flagged, unprocessed):
+            self.assertFalse(StudentAssignment.objects.get(pk=untouched.pk).is_graded)
+        stats = TeacherStats.objects.get(teacher=self.teacher)
+        self.assertEqual((stats.graded_submissions, stats.graded_score), (1, answer.score))
+
+    def test_batches_report_progress(self):
+        for student in self.students:
+            self.submit(student, f"{ORIGINAL_ANSWER} {student.username}")
+        progress = []
+        self.assertEqual(regrade_assignment(self.assignment, batch_size=2, progress=lambda done, total: progress.append((done, total))), 3)
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+        self.assertEqual(StudentAssignment.objects.filter(is_graded=True).count(), 3)
+
+
+class JobSchedulingTests(TestCase):
+    def waiting(self, seconds, **kwargs):
+        job = enqueue('tests.record', **kwargs)
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(seconds=seconds))
+        return job
+
+    def test_interactive_work_goes_first(self):
+        self.waiting(30, priority=Job.PRIORITY_BACKGROUND)
+        normal = self.waiting(20, priority=Job.PRIORITY_NORMAL)
+        interactive = self.waiting(10, priority=Job.PRIORITY_INTERACTIVE)
+        self.assertEqual([claim('worker').pk, claim('worker').pk], [interactive.pk, normal.pk])
+
+    def test_waiting_background_work_ages_into_the_top_class(self):
+        aged = self.waiting(queue_setting('PRIORITY_AGING') + 60, priority=Job.PRIORITY_BACKGROUND)
+        self.waiting(10, priority=Job.PRIORITY_INTERACTIVE)
+        self.assertEqual(claim('worker').pk, aged.pk)
+
+    def test_fair_share_between_classrooms(self):
+        busy = [self.waiting(60 - i, fair_key='classroom:1') for i in range(3)]
+        quiet = self.waiting(5, fair_key='classroom:2')
+        self.assertEqual(claim('worker').pk, busy[0].pk)
+        # classroom:1 has started a job in the window, so classroom:2 is next
+        self.assertEqual(claim('worker').pk, quiet.pk)
+        self.assertEqual(claim('worker').pk, busy[1].pk)
+
+
+class RubricGradingTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    RUBRIC = "- 3 | Chlorophyll absorbs sunlight in the chloroplasts.\n\n* Oxygen is released when water is split.\n0 | Neat handwriting."
+
+    def test_parse_rubric(self):
+        self.assertEqual(parse_rubric(self.RUBRIC), [
+            ("Chlorophyll absorbs sunlight in the chloroplasts.", 3.0),
+            ("Oxygen is released when water is split.", 1.0),
+        ])
+        self.assertEqual(parse_rubric("", "First point.\n\nSecond point\nstill second."), [
+            ("First point.", 1.0), ("Second point\nstill second.", 1.0),
+        ])
+        self.assertEqual(split_sentences("One. Two!\nThree?  "), ["One.", "Two!", "Three?"])
+
+    def test_points_are_scored_by_their_best_sentence(self):
+        self.assignment.grading_mode = Assignment.GRADING_RUBRIC
+        self.assignment.rubric = self.RUBRIC
+        self.assignment.save()
+        context = get_grading_context(self.assignment)
+        self.assertTrue(context.uses_rubric)
+        full, partial, none = context.grade([
+            "Oxygen is released when water is split. Chlorophyll absorbs sunlight in the chloroplasts.",
+            f"Chlorophyll absorbs sunlight in the chloroplasts. {UNRELATED_ANSWER}",
+            UNRELATED_ANSWER,
+        ])
+        self.assertEqual(full['score'], 10.0)
+        self.assertEqual([point['awarded'] for point in full['rubric']], [3.0, 1.0])
+        self.assertEqual([point['awarded'] for point in partial['rubric']], [3.0, 0.0])
+        self.assertEqual(partial['score'], 7.5)
+        self.assertEqual(none['score'], 0.0)
+
+    def test_partial_credit_between_thresholds(self):
+        context = GradingContext(self.assignment.pk, None, '', None, 10.0, [("Point", 1.0)], np.ones((1, 1), dtype=np.float32))
+        middle = (RUBRIC_NO_CREDIT + RUBRIC_FULL_CREDIT) / 2
+        self.assertEqual(context._result([middle])['score'], 5.0)
+        self.assertEqual(context._result([RUBRIC_NO_CREDIT])['score'], 0.0)
+        self.assertEqual(context._result([1.0])['score'], 10.0)
+
+
+class GradeMemoTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    def grade_without_model(self, context, text):
+        with mock.patch.object(grading, 'get_embeddings', side_effect=AssertionError("model called")):
+            return context.grade([text])[0]
+
+    def test_hit_after_first_grade(self):
+        context = get_grading_context(self.assignment)
+        first = context.grade([ORIGINAL_ANSWER])[0]
+        memo_row = GradeMemo.objects.get()
+        self.assertEqual((memo_row.key_hash, memo_row.engine_version), (context.memo_key, memo.ENGINE_VERSION))
+        # Whitespace and case do not change the answer hash
+        self.assertEqual(self.grade_without_model(context, "  " + ORIGINAL_ANSWER.upper()), first)
+
+    def test_engine_version_change_is_a_miss(self):
+        context = get_grading_context(self.assignment)
+        context.grade([ORIGINAL_ANSWER])
+        with mock.patch.object(memo, 'ENGINE_VERSION', f'{memo.ENGINE_VERSION}-next'):
+            with self.assertRaisesMessage(AssertionError, "model called"):
+                self.grade_without_model(context, ORIGINAL_ANSWER)
+            context.grade([ORIGINAL_ANSWER])
+            self.grade_without_model(context, ORIGINAL_ANSWER)
+        self.assertEqual(GradeMemo.objects.count(), 2)
+
+    def test_memo_keeps_similarity_so_the_scale_can_change(self):
+        context = get_grading_context(self.assignment)
+        score = context.grade([ORIGINAL_ANSWER])[0]['score']
+        self.assignment.max_score = 20
+        self.assignment.save()
+        rescaled = self.grade_without_model(get_grading_context(self.assignment), ORIGINAL_ANSWER)
+        self.assertAlmostEqual(rescaled['score'], score * 2, places=1)
+
+    @override_settings(GRADE_MEMO={'MAX_ENTRIES': 2, 'TTL_DAYS': 30})
+    def test_prune_expires_and_trims(self):
+        memo.store('key', {f'answer{i}': (0.5, [], 'feedback') for i in range(4)})
+        GradeMemo.objects.filter(answer_hash='answer0').update(last_used_at=timezone.now() - timedelta(days=31))
+        GradeMemo.objects.filter(answer_hash='answer1').update(last_used_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(memo.lookup('key', ['answer0']), {})
+        self.assertEqual(memo.prune(), 2)
+        self.assertEqual(set(GradeMemo.objects.values_list('answer_hash', flat=True)), {'answer2', 'answer3'})
+
+
+class AdmissionControlTests(TestCase):
+    def test_full_queue_is_rejected_and_background_work_waits(self):
+        limiter = Limiter('embedding', concurrency=1, queue_size=0, timeout=0.05)
+        with limiter.admit('first'):
+            with self.assertRaises(Overloaded) as rejected:
+                with limiter.admit('second'):
+                    pass
+            self.assertEqual(rejected.exception.retry_after, admission_setting('RETRY_AFTER'))
+            def background_job():
+                with limiter.admit('job', background=True):
+                    pass
+            waiter = threading.Thread(target=background_job)
+            waiter.start()
+            waiter.join(0.1)
+            self.assertTrue(waiter.is_alive())
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        endpoints = limiter.stats()['endpoints']
+        self.assertEqual((endpoints['second']['rejected'], endpoints['job']['admitted']), (1, 1))
+
+    def test_wait_times_out(self):
+        limiter = Limiter('ocr', concurrency=1, queue_size=1, timeout=0.05)
+        with limiter.admit('first'):
+            started = time.monotonic()
+            with self.assertRaises(Overloaded):
+                with limiter.admit('second'):
+                    pass
+            self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_busy_model_answers_503_with_retry_after(self):
+        student = User.objects.create_user(username='student', password='pw', name='Student', role='student')
+        question = Question.objects.create(question_text='What is photosynthesis?', model_answer=KEY_ANSWER)
+        busy = Limiter('embedding', concurrency=1, queue_size=0, timeout=0.05)
+        self.client.force_login(student)
+        with mock.patch.dict(admission._limiters, {'embedding': busy}), busy.admit('another request'):
+            response = self.client.post('/Student/upload/', {'question': question.pk, 'answer_text': ORIGINAL_ANSWER})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(admission_setting('RETRY_AFTER')))
+        self.assertEqual(busy.stats()['endpoints']['UploadAnswerView']['rejected'], 1)
+
+
+class StagedPipelineTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TransactionTestCase):
+    STUDENT_COUNT = 4
+
+    def test_batch_runs_through_every_stage(self):
+        answers = [
+            self.submit(self.students[0], ORIGINAL_ANSWER),
+            self.submit(self.students[1], ORIGINAL_ANSWER + " That is how plants make food."),
+            self.submit(self.students[2], UNRELATED_ANSWER),
+            self.submit(self.students[3]),
+        ]
+        StudentAssignment.objects.update(status=StudentAssignment.STATUS_QUEUED)
+        staged = StagedPipeline(ocr_processes=1, embed_batch_size=8, embed_max_wait=0.2, score_workers=2)
+        stats = {stage['stage']: stage for stage in staged.run([answer.pk for answer in answers])}
+        self.assertEqual({name: (stage['processed'], stage['failed']) for name, stage in stats.items()}, {
+            'extract': (4, 0), 'embed': (3, 0), 'score': (3, 0),
+        })
+        original, copy, unrelated, empty = [StudentAssignment.objects.get(pk=answer.pk) for answer in answers]
+        self.assertTrue(all(answer.status == StudentAssignment.STATUS_DONE for answer in (original, copy, unrelated, empty)))
+        self.assertTrue(copy.plagiarism and original.plagiarism)
+        self.assertTrue(unrelated.is_graded and not unrelated.plagiarism)
+        self.assertFalse(empty.is_graded)
+        self.assertEqual(unrelated.embedding_hash, unrelated.text_hash)
+        self.assertEqual(len(format_stats(staged.stats(), staged.elapsed)), 4)
+
+
+class PlagiarismBenchmarkTests(TestCase):
+    def test_small_class_precision_and_recall(self):
+        texts, origins = generate_corpus(40, copy_rate=0.15, paraphrase_rate=0.15, seed=1)
+        result = run_engine(texts, origins, HashingEmbedder(), thresholds=(0.5, 0.75, 0.9))
+        true_pairs = sum(origins[i] == origins[j] for i in range(len(origins)) for j in range(i))
+        self.assertEqual((result['n'], result['positive_pairs']), (40, true_pairs))
+        calibration = {row['threshold']: (row['precision'], row['recall']) for row in result['calibration']}
+        # Copies and close paraphrases clear the match threshold, while the
+        # lowest one also catches independent answers on the same topic
+        self.assertEqual(calibration[0.9], (1.0, 1.0))
+        self.assertEqual(calibration[0.5][1], 1.0)
+        self.assertLess(calibration[0.5][0], calibration[0.75][0])
+        self.assertGreater(result['passage_pairs'], 0)
+        # The run's rows are rolled back
+        self.assertFalse(StudentAssignment.objects.exists() or PlagiarismPair.objects.exists())
+
+    def test_command_reports_every_threshold(self):
+        # The command makes its own test database; this test already runs in one
+        creation = connection.creation
+        with mock.patch.object(creation, 'create_test_db', return_value=connection.settings_dict['NAME']), \
+                mock.patch.object(creation, 'destroy_test_db') as destroy:
+            out = StringIO()
+            call_command('benchmark_plagiarism', sizes=[10], thresholds=[0.8, 0.9], json=True, stdout=out)
+        destroy.assert_called_once()
+        [result] = json.loads(out.getvalue())
+        self.assertEqual([row['threshold'] for row in result['calibration']], [0.8, 0.9])
+
+
+async def read_events(response, timeout=5):
+    """The events of an SSE response until it ends, as dicts of their id, event and decoded data."""
+    async def collect():
+        return [chunk async for chunk in response.streaming_content]
+    text = b''.join(await asyncio.wait_for(collect(), timeout)).decode()
+    events = []
+    for block in text.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'data' in fields:
+            events.append({'id': fields.get('id'), 'event': fields['event'], 'data': json.loads(fields['data'])})
+    return events
+
+
+class SubmissionEventsTests(SubmissionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(events, 'POLL_INTERVAL', 0.01))
+        self.submission = self.submit(self.students[0], ORIGINAL_ANSWER, status=StudentAssignment.STATUS_GRADING)
+        self.url = reverse('Student:submission_events', args=[self.submission.pk])
+
+    async def test_student_cannot_stream_another_students_submission(self):
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 403)
+        await self.async_client.aforce_login(self.students[1])
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 404)
+
+    async def test_payload_shape(self):
+        await self.async_client.aforce_login(self.students[0])
+        await StudentAssignment.objects.filter(pk=self.submission.pk).aupdate(status=StudentAssignment.STATUS_DONE, is_graded=True, score=8)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        [event] = await read_events(response)
+        submission = await StudentAssignment.objects.aget(pk=self.submission.pk)
+        self.assertEqual(event, {'id': submission.updated_at.isoformat(), 'event': 'status', 'data': {
+            'id': submission.pk, 'status': 'done', 'status_display': 'Done', 'message': '', 'processing': False,
+            'is_graded': True, 'plagiarism': False, 'score': 8.0, 'max_score': 10.0,
+        }})
+
+    async def test_stream_closes_once_grading_finishes(self):
+        await self.async_client.aforce_login(self.students[0])
+        response = await self.async_client.get(self.url)
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry: '))
+        self.assertIn(b'"status": "grading"', await anext(chunks))
+        await StudentAssignment.objects.filter(pk=self.submission.pk).aupdate(
+            status=StudentAssignment.STATUS_DONE, is_graded=True, score=8, updated_at=timezone.now() + timedelta(seconds=1),
+        )
+        # The finished state is the last event, then the stream ends
+        remaining = await asyncio.wait_for(read_events(mock.Mock(streaming_content=chunks)), 5)
+        self.assertEqual([(event['data']['status'], event['data']['processing']) for event in remaining], [('done', False)])
+
+
+class InlinePool:
+    """multiprocessing Pool stand-in that extracts in this process, where the test's patches apply."""
+
+    def __init__(self, processes=None, initializer=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def imap(self, fn, items):
+        return map(fn, items)
+
+
+class BatchGradingTests(FakeEmbeddingMixin, SubmissionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.sheets = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sheets, ignore_errors=True)
+        self.enterContext(mock.patch.object(batch_grading.multiprocessing, 'get_context', return_value=mock.Mock(Pool=InlinePool)))
+        self.extract = self.enterContext(mock.patch.object(batch_grading, 'extract_text_from_file', side_effect=lambda path: open(path).read()))
+
+    def write_sheets(self, **answers):
+        for username, text in answers.items():
+            with open(os.path.join(self.sheets, f'{username}.pdf'), 'w') as sheet:
+                sheet.write(text)
+
+    def grade(self):
+        rows = []
+        with tempfile.TemporaryDirectory() as workdir:
+            done = grade_sheets(self.assignment, self.sheets, workdir, report=rows.extend)
+        return done, {row['student']: row['status'] for row in rows}
+
+    def submission(self, student):
+        return StudentAssignment.objects.get(assignment=self.assignment, student=student)
+
+    def test_resume_skips_sheets_already_graded_from_the_same_file(self):
+        self.write_sheets(student0=ORIGINAL_ANSWER, student1=UNRELATED_ANSWER)
+        self.assertEqual(self.grade(), (2, {'student0': 'graded', 'student1': 'graded'}))
+        self.assertEqual(self.grade(), (0, {'student0': 'unchanged', 'student1': 'unchanged'}))
+        self.assertEqual(self.extract.call_count, 2)
+        self.write_sheets(student1=UNRELATED_ANSWER + " Lava cools into new rock.")
+        self.assertEqual(self.grade(), (1, {'student0': 'unchanged', 'student1': 'graded'}))
+        self.assertEqual(StudentAssignment.objects.count(), 2)
+
+    def test_copies_get_the_online_plagiarism_checks(self):
+        self.write_sheets(student0=ORIGINAL_ANSWER, student1=ORIGINAL_ANSWER, student2=UNRELATED_ANSWER)
+        _, statuses = self.grade()
+        self.assertEqual(statuses, {'student0': 'plagiarised', 'student1': 'plagiarised', 'student2': 'graded'})
+        original, copy = self.submission(self.students[0]), self.submission(self.students[1])
+        self.assertEqual((original.duplicate_of_id, copy.duplicate_of_id), (None, original.pk))
+        self.assertFalse(original.is_graded or copy.is_graded)
+        self.assertEqual(PlagiarismPair.objects.get(is_match=True).second_id, copy.pk)
+        self.assertTrue(original.plagiarism_spans and AnswerFingerprint.objects.filter(submission=copy).exists())
+
+    def test_reimport_clears_the_old_answers_evidence(self):
+        self.write_sheets(student0=ORIGINAL_ANSWER, student1=ORIGINAL_ANSWER)
+        self.grade()
+        self.write_sheets(student1=UNRELATED_ANSWER)
+        self.assertEqual(self.grade()[1], {'student0': 'unchanged', 'student1': 'graded'})
+        original, rewritten = self.submission(self.students[0]), self.submission(self.students[1])
+        self.assertEqual((original.plagiarism, rewritten.plagiarism, rewritten.duplicate_of_id), (False, False, None))
+        self.assertEqual(original.plagiarism_spans, [])
+        self.assertFalse(PlagiarismPair.objects.filter(is_match=True).exists())
+
+    def test_failed_chunk_leaves_no_stored_files(self):
+        self.write_sheets(student0=ORIGINAL_ANSWER, student1=UNRELATED_ANSWER)
+        with mock.patch.object(batch_grading, 'grade_submissions', side_effect=RuntimeError("grading failed")):
+            with self.assertRaises(RuntimeError):
+                self.grade()
+        self.assertFalse(StudentAssignment.objects.exists())
+        stored = os.path.join(settings.MEDIA_ROOT, 'assignments', 'submissions')
+        self.assertEqual(os.listdir(stored) if os.path.isdir(stored) else [], [])
+
+    def test_match_by_id_ignores_leading_zeros(self):
+        student = self.students[0]
+        sheet = (f'00{student.pk}_quiz.pdf', '/sheets/a.pdf')
+        matched, unmatched = match_students([sheet], pattern=r'^(?P<student>\d+)_', match_by='id')
+        self.assertEqual((matched, unmatched), ([(*sheet, student)], []))
+
+    def test_command_writes_a_report(self):
+        self.write_sheets(student0=ORIGINAL_ANSWER, nobody=UNRELATED_ANSWER)
+        report = os.path.join(self.sheets, 'report.csv')
+        out = StringIO()
+        call_command('grade_batch', self.assignment.pk, self.sheets, report=report, stdout=out)
+        with open(report) as report_file:
+            rows = {row['file']: row for row in csv.DictReader(report_file)}
+        self.assertEqual((rows['student0.pdf']['status'], rows['nobody.pdf']['status']), ('graded', 'unmatched'))
+        self.assertIn('1 graded, 1 unmatched', out.getvalue())
@@ -9,8 +9,11 @@ urlpatterns = [
     path("assignments/<int:pk>/",views.AssignmentDetailView.as_view(),name="assignment_detail"),
     path("assignments/<int:assignment_id>/submit/",views.SubmitAssignmentView.as_view(),name="submit_assignment"),
     path("assignments/<int:pk>/result/",views.AssignmentResultView.as_view(),name="assignment_result"),
+    path("submissions/<int:pk>/status/",views.SubmissionStatusView.as_view(),name="submission_status"),
+    path("submissions/<int:pk>/events/",views.SubmissionEventsView.as_view(),name="submission_events"),
     path("result/",views.ResultList.as_view(),name="result"),
     path("resultDetail/<int:pk>/",views.ResultDetail.as_view(),name="resultDetail"),
+    path("metrics/admission/",views.AdmissionStatsView.as_view(),name="admission_stats"),
     path("notifications/",views.NotificationListView.as_view(),name="notifications"),
     # AI Evaluation URLs (for questions)
     path("upload/",views.UploadAnswerView.as_view(),name="upload_answer"),
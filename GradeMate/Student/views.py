@@ -1,6 +1,7 @@
-import os
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import TemplateView, ListView, DetailView
+from django.http import Http404, HttpResponseForbidden, JsonResponse
+from django.views.generic import TemplateView, ListView, DetailView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.utils import timezone
@@ -8,11 +9,18 @@ from django.db.models import Q
 from django.conf import settings
 from .models import StudentAnswer, StudentAssignment
 from .forms import StudentAnswerForm, AssignmentSubmissionForm
-from Teacher.models import Assignment, Subject, Classroom, Notification
-from Teacher.utils import find_students_for_classroom
-from .services.ai_evaluator import evaluate_answer
-from .services.ocr import extract_text_from_file
-from .services.plagiarism import check_plagiarism
+from Teacher.models import Assignment, Subject, Notification
+from .services.admission import AdmissionControlMixin, Overloaded, admission_stats
+from .services.grading import evaluate_answer_memoized
+from .services.events import event_rows, event_stream, submission_events, submission_payload
+from .services.pagination import KeysetPaginationMixin
+from .services.plagiarism import find_exact_duplicate, record_passage_matches, refresh_plagiarism_flags
+from .services.tasks import enqueue_submission
+from .services.counters import get_counters, mark_notification_read
+from .services.stats import student_stats
+from .services.visibility import can_see_assignment, visible_assignment_ids, visible_assignments
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -23,62 +31,25 @@ class Dashboard(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         student = self.request.user
         
-        # Get assignments for student using flexible matching
-        # Method 1: Get assignments where student has notifications (most reliable)
-        notification_assignments = Assignment.objects.filter(
-            notifications__student=student,
-            is_active=True
-        ).distinct()
-        
-        # Method 2: Get assignments by matching student's class_grade with classroom names
-        student_class = student.class_grade
-        classroom_assignments = Assignment.objects.none()
-        
-        if student_class:
-            student_class = student_class.strip()
-            # Try exact match first
-            classroom_assignments = Assignment.objects.filter(
-                classroom__name__iexact=student_class,
-                is_active=True
-            )
-            
-            # Also try matching by checking if student would be found for each classroom
-            all_classrooms = Classroom.objects.all()
-            matching_classroom_ids = []
-            for classroom in all_classrooms:
-                students_in_classroom = find_students_for_classroom(classroom)
-                if student in students_in_classroom:
-                    matching_classroom_ids.append(classroom.id)
-            
-            if matching_classroom_ids:
-                additional_assignments = Assignment.objects.filter(
-                    classroom__id__in=matching_classroom_ids,
-                    is_active=True
-                )
-                classroom_assignments = (classroom_assignments | additional_assignments).distinct()
-        
-        # Combine both methods - notifications take priority but include classroom matches too
-        assignments = (notification_assignments | classroom_assignments).distinct().order_by('-created_at')
+        # Assignments the student was notified about or that belong to their classrooms
+        assignment_ids = visible_assignment_ids(student)
+        assignments = Assignment.objects.filter(id__in=assignment_ids).order_by('-created_at')
         
         # Get student's submissions
         submissions = StudentAssignment.objects.filter(student=student)
         submitted_assignment_ids = submissions.values_list('assignment_id', flat=True)
+        graded_submissions = submissions.filter(is_graded=True)
         
-        # Statistics
-        context['total_assignments_count'] = assignments.count()
-        context['pending_assignments_count'] = assignments.exclude(
-            id__in=submitted_assignment_ids
-        ).count()
-        context['completed_assignments_count'] = submissions.filter(is_graded=True).count()
+        # Statistics, including the average score, in one query
+        stats = student_stats(student, assignment_ids)
+        context['total_assignments_count'] = stats['total_assignments']
         
-        # Calculate average score
-        graded_submissions = submissions.filter(is_graded=True)
-        if graded_submissions.exists():
-            total_score = sum(float(sub.score) for sub in graded_submissions)
-            max_score = sum(float(sub.assignment.max_score) for sub in graded_submissions)
-            context['average_score'] = round((total_score / max_score * 100), 1) if max_score > 0 else 0
-        else:
-            context['average_score'] = 0
+        # Pending work and unread notifications from the stored counters
+        counters = get_counters(student)
+        context['pending_assignments_count'] = counters.pending_assignments
+        context['unread_notifications_count'] = counters.unread_notifications
+        context['completed_assignments_count'] = stats['completed_assignments']
+        context['average_score'] = stats['average_percentage']
         
         # Upcoming assignments (not yet submitted)
         context['upcoming_assignments'] = assignments.exclude(
@@ -86,7 +57,7 @@ class Dashboard(LoginRequiredMixin, TemplateView):
         ).order_by('due_date')[:5]
         
         # Recent results (graded submissions)
-        context['recent_results'] = graded_submissions.order_by('-evaluated_at')[:5]
+        context['recent_results'] = graded_submissions.select_related('assignment').order_by('-evaluated_at')[:5]
         
         # Get unread notifications
         context['notifications'] = Notification.objects.filter(
@@ -95,6 +66,7 @@ class Dashboard(LoginRequiredMixin, TemplateView):
         ).order_by('-created_at')[:5]
         
         context['subjects'] = Subject.objects.all()
+        student_class = student.class_grade.strip() if student.class_grade else student.class_grade
         if student_class:
             context['teachers'] = Assignment.objects.filter(
                 classroom__name__iexact=student_class
@@ -104,7 +76,7 @@ class Dashboard(LoginRequiredMixin, TemplateView):
         
         # Debug information (can be removed in production)
         context['debug_student_class'] = student_class
-        context['debug_assignments_count'] = assignments.count()
+        context['debug_assignments_count'] = stats['total_assignments']
         
         return context
 
@@ -115,51 +87,17 @@ class AssignmentView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         student = self.request.user
-        student_class = student.class_grade
         
         # Filter by subject if provided
         subject_id = self.request.GET.get('subject')
         
-        # Get assignments using flexible matching (same as dashboard)
-        # Method 1: Get assignments where student has notifications
-        notification_assignments = Assignment.objects.filter(
-            notifications__student=student,
-            is_active=True
-        ).distinct()
-        
-        # Method 2: Get assignments by matching student's class_grade with classroom names
-        classroom_assignments = Assignment.objects.none()
-        
-        if student_class:
-            student_class = student_class.strip()
-            # Try exact match first
-            classroom_assignments = Assignment.objects.filter(
-                classroom__name__iexact=student_class,
-                is_active=True
-            )
-            
-            # Also try matching by checking if student would be found for each classroom
-            all_classrooms = Classroom.objects.all()
-            matching_classroom_ids = []
-            for classroom in all_classrooms:
-                students_in_classroom = find_students_for_classroom(classroom)
-                if student in students_in_classroom:
-                    matching_classroom_ids.append(classroom.id)
-            
-            if matching_classroom_ids:
-                additional_assignments = Assignment.objects.filter(
-                    classroom__id__in=matching_classroom_ids,
-                    is_active=True
-                )
-                classroom_assignments = (classroom_assignments | additional_assignments).distinct()
-        
-        # Combine both methods
-        queryset = (notification_assignments | classroom_assignments).distinct()
+        # Assignments the student was notified about or that belong to their classrooms
+        queryset = visible_assignments(student)
         
         if subject_id:
             queryset = queryset.filter(subject_id=subject_id)
         
-        return queryset.order_by('-created_at')
+        return queryset.select_related('subject', 'teacher').order_by('-created_at')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -178,19 +116,22 @@ class ResultDetail(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return StudentAssignment.objects.filter(student=self.request.user)
 
-class ResultList(LoginRequiredMixin, ListView):
+class ResultList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name="Student/result_list.html"
     context_object_name = 'submissions'
     paginate_by = 10
+    keyset_field = 'evaluated_at'
     
     def get_queryset(self):
+        # Grading always sets evaluated_at; the cursor needs it to be set
         return StudentAssignment.objects.filter(
             student=self.request.user,
-            is_graded=True
-        ).order_by('-evaluated_at')
+            is_graded=True,
+            evaluated_at__isnull=False
+        ).select_related('assignment__subject').order_by('-evaluated_at')
 
 # AI Evaluation Views
-class UploadAnswerView(LoginRequiredMixin, TemplateView):
+class UploadAnswerView(LoginRequiredMixin, AdmissionControlMixin, TemplateView):
     template_name = 'Student/upload.html'
     
     def get_context_data(self, **kwargs):
@@ -224,7 +165,7 @@ class UploadAnswerView(LoginRequiredMixin, TemplateView):
             
             # Evaluate using AI
             try:
-                evaluation_result = evaluate_answer(
+                evaluation_result = evaluate_answer_memoized(
                     model_answer=question.model_answer,
                     student_answer=answer_text
                 )
@@ -238,6 +179,9 @@ class UploadAnswerView(LoginRequiredMixin, TemplateView):
                 # Redirect to result page
                 return redirect('Student:result_detail', pk=student_answer.pk)
                 
+            except Overloaded:
+                # Answered with 503 and Retry-After by AdmissionControlMixin
+                raise
             except Exception as e:
                 messages.error(request, f'Error during evaluation: {str(e)}')
                 return redirect('Student:upload_answer')
@@ -261,42 +205,8 @@ class AssignmentDetailView(LoginRequiredMixin, DetailView):
     
     def get_queryset(self):
         student = self.request.user
-        # Get assignments using flexible matching
-        # Method 1: Get assignments where student has notifications
-        notification_assignments = Assignment.objects.filter(
-            notifications__student=student,
-            is_active=True
-        ).distinct()
-        
-        # Method 2: Get assignments by matching student's class_grade with classroom names
-        classroom_assignments = Assignment.objects.none()
-        student_class = student.class_grade
-        
-        if student_class:
-            student_class = student_class.strip()
-            # Try exact match first
-            classroom_assignments = Assignment.objects.filter(
-                classroom__name__iexact=student_class,
-                is_active=True
-            )
-            
-            # Also try matching by checking if student would be found for each classroom
-            all_classrooms = Classroom.objects.all()
-            matching_classroom_ids = []
-            for classroom in all_classrooms:
-                students_in_classroom = find_students_for_classroom(classroom)
-                if student in students_in_classroom:
-                    matching_classroom_ids.append(classroom.id)
-            
-            if matching_classroom_ids:
-                additional_assignments = Assignment.objects.filter(
-                    classroom__id__in=matching_classroom_ids,
-                    is_active=True
-                )
-                classroom_assignments = (classroom_assignments | additional_assignments).distinct()
-        
-        # Combine both methods
-        return (notification_assignments | classroom_assignments).distinct()
+        # Assignments the student was notified about or that belong to their classrooms
+        return visible_assignments(student)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -325,17 +235,7 @@ class SubmitAssignmentView(LoginRequiredMixin, TemplateView):
             raise Http404("Assignment not found")
         
         # Verify student has access to this assignment
-        has_notification = Notification.objects.filter(
-            assignment=assignment,
-            student=student
-        ).exists()
-        
-        has_classroom_access = False
-        if student.class_grade:
-            students_in_classroom = find_students_for_classroom(assignment.classroom)
-            has_classroom_access = student in students_in_classroom
-        
-        if not (has_notification or has_classroom_access):
+        if not can_see_assignment(student, assignment):
             from django.http import Http404
             raise Http404("You don't have access to this assignment")
         context['assignment'] = assignment
@@ -361,17 +261,7 @@ class SubmitAssignmentView(LoginRequiredMixin, TemplateView):
             raise Http404("Assignment not found")
         
         # Verify student has access to this assignment
-        has_notification = Notification.objects.filter(
-            assignment=assignment,
-            student=student
-        ).exists()
-        
-        has_classroom_access = False
-        if student.class_grade:
-            students_in_classroom = find_students_for_classroom(assignment.classroom)
-            has_classroom_access = student in students_in_classroom
-        
-        if not (has_notification or has_classroom_access):
+        if not can_see_assignment(student, assignment):
             from django.http import Http404
             raise Http404("You don't have access to this assignment")
         
@@ -398,113 +288,52 @@ class SubmitAssignmentView(LoginRequiredMixin, TemplateView):
             
             # Save the submission first so the file is written to disk
             submission.save()
+            # An earlier copy's source is only flagged because of this submission
+            previous_duplicate_id = submission.duplicate_of_id
             
-            # Extract text from student's file if provided and no text exists
-            if submission.file and not submission.answer_text:
-                try:
-                    # Now we can access the file path after saving
-                    file_path = submission.file.path
-                    if os.path.exists(file_path):
-                        extracted_text = extract_text_from_file(file_path)
-                        if extracted_text and extracted_text.strip():
-                            submission.answer_text = extracted_text
-                            # Save again with extracted text
-                            submission.save(update_fields=['answer_text'])
-                    else:
-                        messages.warning(request, f'File not found at {file_path}. Please try uploading again.')
-                except Exception as e:
-                    messages.warning(request, f'Could not extract text from file: {str(e)}. Please enter text manually.')
-            
-            # Ensure we have key answer text - extract from file if needed
-            key_answer_text = assignment.key_answer_text
-            if not key_answer_text and assignment.key_answer_file:
-                try:
-                    key_file_path = assignment.key_answer_file.path
-                    if os.path.exists(key_file_path):
-                        key_answer_text = extract_text_from_file(key_file_path)
-                        if key_answer_text and key_answer_text.strip():
-                            # Save extracted text to assignment for future use
-                            Assignment.objects.filter(pk=assignment.pk).update(key_answer_text=key_answer_text)
-                            assignment.key_answer_text = key_answer_text
-                except Exception as e:
-                    print(f"⚠️ Could not extract text from key answer file: {e}")
-            
-            # Check for duplicate/plagiarized submissions before grading
-            if submission.answer_text and submission.answer_text.strip():
-                other_answers_qs = StudentAssignment.objects.filter(
-                    assignment=assignment
-                ).exclude(id=submission.id).exclude(
-                    answer_text__isnull=True
-                ).exclude(
-                    answer_text__exact=''
-                )
-                
-                if other_answers_qs.exists():
-                    other_answers = list(other_answers_qs.values_list('answer_text', flat=True))
+            # Identical text or file to another submission needs no model work to reject
+            duplicate_id = find_exact_duplicate(submission)
+            if duplicate_id:
+                submission.duplicate_of_id = duplicate_id
+                if submission.answer_text and submission.answer_text.strip():
                     try:
-                        if check_plagiarism(submission.answer_text, other_answers):
-                            submission.plagiarism = True
-                            submission.is_graded = False
-                            submission.score = 0
-                            submission.feedback = ''
-                            submission.evaluated_at = None
-                            submission.save(update_fields=['plagiarism', 'is_graded', 'score', 'feedback', 'evaluated_at'])
-                            
-                            messages.error(
-                                request,
-                                'Submission rejected because it matches another student\'s submission. Please submit your own work.'
-                            )
-                            return redirect('Student:assignment_detail', pk=assignment.pk)
-                    except Exception as e:
-                        print(f"⚠️ Error during plagiarism check for submission {submission.pk}: {e}")
-                        # Continue with evaluation but mark as not graded yet
+                        record_passage_matches(submission)
+                    except Exception:
+                        logger.exception("Error recording passage matches for submission %s", submission.pk)
+                response = self._reject_plagiarised(request, submission, assignment)
+                refresh_plagiarism_flags({duplicate_id, previous_duplicate_id} - {None})
+                return response
             
-            # Evaluate using AI if we have both key answer and student answer
-            if key_answer_text and key_answer_text.strip() and submission.answer_text and submission.answer_text.strip():
-                try:
-                    print(f"🤖 Starting AI evaluation for submission {submission.pk}")
-                    evaluation_result = evaluate_answer(
-                        model_answer=key_answer_text,
-                        student_answer=submission.answer_text
-                    )
-                    
-                    # Convert score from 0-10 to 0-max_score scale
-                    max_score = float(assignment.max_score)
-                    raw_score = float(evaluation_result['score'])
-                    scaled_score = (raw_score / 10.0) * max_score
-                    
-                    submission.score = round(scaled_score, 2)
-                    submission.feedback = evaluation_result['feedback']
-                    submission.is_graded = True
-                    submission.evaluated_at = timezone.now()
-                    submission.save()
-                    
-                    print(f"✅ Evaluation complete: Score {submission.score}/{max_score}")
-                    messages.success(request, f'Assignment submitted and evaluated successfully! Your score: {submission.score}/{max_score}')
-                    return redirect('Student:assignment_result', pk=submission.pk)
-                    
-                except Exception as e:
-                    import traceback
-                    error_details = traceback.format_exc()
-                    print(f"❌ Error during evaluation: {e}")
-                    print(f"Error details: {error_details}")
-                    messages.error(request, f'Error during evaluation: {str(e)}. Please contact your teacher.')
-                    submission.is_graded = False
-                    submission.save()
-            elif not key_answer_text or not key_answer_text.strip():
-                messages.warning(request, 'Assignment submitted successfully! However, automatic grading is not available as no answer key is provided.')
-                return redirect('Student:assignment_detail', pk=assignment.pk)
-            elif not submission.answer_text or not submission.answer_text.strip():
-                messages.warning(request, 'Assignment submitted successfully! However, automatic grading requires text content. Please ensure your file contains text or enter text manually.')
-                return redirect('Student:assignment_detail', pk=assignment.pk)
+            # Extraction, plagiarism checking and grading run in the background;
+            # the result page polls the submission's status until they finish
+            submission.duplicate_of = None
+            submission.plagiarism = False
+            submission.status = StudentAssignment.STATUS_QUEUED
+            submission.status_message = ''
+            submission.save(update_fields=['duplicate_of', 'plagiarism', 'status', 'status_message'])
+            if previous_duplicate_id:
+                refresh_plagiarism_flags([previous_duplicate_id])
+            enqueue_submission(submission)
             
-            # If we reach here, something unexpected happened
-            messages.info(request, 'Assignment submitted successfully!')
-            return redirect('Student:assignment_detail', pk=assignment.pk)
+            messages.info(request, 'Assignment submitted successfully! Your answer is being evaluated.')
+            return redirect('Student:assignment_result', pk=submission.pk)
         else:
             context = self.get_context_data()
             context['form'] = form
             return render(request, self.template_name, context)
+    
+    def _reject_plagiarised(self, request, submission, assignment):
+        submission.plagiarism = True
+        submission.is_graded = False
+        submission.score = 0
+        submission.feedback = ''
+        submission.evaluated_at = None
+        submission.status = StudentAssignment.STATUS_DONE
+        submission.status_message = 'Submission rejected because it matches another student\'s submission. Please submit your own work.'
+        submission.save(update_fields=['plagiarism', 'duplicate_of', 'is_graded', 'score', 'feedback', 'evaluated_at', 'status', 'status_message'])
+        
+        messages.error(request, submission.status_message)
+        return redirect('Student:assignment_detail', pk=assignment.pk)
 
 class AssignmentResultView(LoginRequiredMixin, DetailView):
     template_name = 'Student/assignment_result.html'
@@ -513,15 +342,42 @@ class AssignmentResultView(LoginRequiredMixin, DetailView):
     def get_queryset(self):
         return StudentAssignment.objects.filter(student=self.request.user)
 
-class NotificationListView(LoginRequiredMixin, ListView):
+class SubmissionStatusView(LoginRequiredMixin, View):
+    """Lightweight JSON status for clients that cannot use the event stream"""
+    
+    def get(self, request, pk):
+        submission = get_object_or_404(event_rows(), pk=pk, student=request.user)
+        return JsonResponse(submission_payload(submission))
+
+class SubmissionEventsView(View):
+    """Server-sent events stream of a submission's progress until it is processed"""
+    
+    async def get(self, request, pk):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponseForbidden()
+        if not await StudentAssignment.objects.filter(pk=pk, student=user).aexists():
+            raise Http404("Submission not found")
+        return event_stream(submission_events(pk))
+
+class AdmissionStatsView(LoginRequiredMixin, View):
+    """Model inference concurrency, rejections and queue wait of this process (staff only)"""
+    
+    def get(self, request):
+        if not request.user.is_staff:
+            return HttpResponseForbidden()
+        return JsonResponse({"limiters": admission_stats()})
+
+class NotificationListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'Student/notifications.html'
     context_object_name = 'notifications'
     paginate_by = 20
+    keyset_field = 'created_at'
     
     def get_queryset(self):
         return Notification.objects.filter(
             student=self.request.user
-        ).order_by('-created_at')
+        ).select_related('assignment__subject', 'assignment__classroom').order_by('-created_at')
     
     def post(self, request, *args, **kwargs):
         # Mark notification as read
@@ -532,7 +388,6 @@ class NotificationListView(LoginRequiredMixin, ListView):
                 id=notification_id,
                 student=request.user
             )
-            notification.is_read = True
-            notification.save()
+            mark_notification_read(notification)
             messages.success(request, 'Notification marked as read.')
         return redirect('Student:notifications')
@@ -1,7 +1,6 @@
 import os
 from django.contrib import admin
 from .models import Question, Subject, Classroom, Assignment, Notification
-from .utils import find_students_for_classroom
 
 # Register your models here.
 
@@ -27,6 +26,7 @@ class QuestionAdmin(admin.ModelAdmin):
     list_display = ['id', 'question_text_short', 'model_answer_short', 'created_by', 'created_at', 'updated_at']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['question_text', 'model_answer']
+    list_select_related = ['created_by']
     readonly_fields = ['created_at', 'updated_at']
     
     fieldsets = (
@@ -56,17 +56,18 @@ class QuestionAdmin(admin.ModelAdmin):
 @admin.register(Assignment)
 class AssignmentAdmin(admin.ModelAdmin):
     list_display = ['title', 'subject', 'classroom', 'teacher', 'due_date', 'max_score', 'is_active', 'created_at', 'has_key_answer_text']
-    list_filter = ['subject', 'classroom', 'is_active', 'created_at', 'due_date']
+    list_filter = ['subject', 'classroom', 'grading_mode', 'is_active', 'created_at', 'due_date']
     search_fields = ['title', 'description', 'subject__name', 'classroom__name']
+    list_select_related = ['subject', 'classroom', 'teacher']
     readonly_fields = ['created_at', 'updated_at']
-    actions = ['extract_text_from_files']
+    actions = ['extract_text_from_files', 'regrade_submissions']
     
     fieldsets = (
         ('Assignment Details', {
             'fields': ('title', 'description', 'subject', 'classroom', 'teacher')
         }),
         ('Answer Key', {
-            'fields': ('key_answer_file', 'key_answer_text')
+            'fields': ('key_answer_file', 'key_answer_text', 'grading_mode', 'rubric')
         }),
         ('Settings', {
             'fields': ('due_date', 'max_score', 'is_active')
@@ -84,37 +85,28 @@ class AssignmentAdmin(admin.ModelAdmin):
     has_key_answer_text.short_description = 'Has Answer Text'
     
     def extract_text_from_files(self, request, queryset):
-        """Admin action to extract text from key answer files"""
-        from Student.services.ocr import extract_text_from_file
-        success_count = 0
-        error_count = 0
-        
+        """Admin action to extract text from key answer files in the background"""
+        from Student.services.tasks import extract_key_text, teacher_key
+        queued_count = 0
         for assignment in queryset:
             if assignment.key_answer_file:
-                try:
-                    file_path = assignment.key_answer_file.path
-                    if file_path and os.path.exists(file_path):
-                        extracted_text = extract_text_from_file(file_path)
-                        if extracted_text:
-                            assignment.key_answer_text = extracted_text
-                            assignment.save(update_fields=['key_answer_text'])
-                            success_count += 1
-                        else:
-                            error_count += 1
-                    else:
-                        error_count += 1
-                except Exception as e:
-                    print(f"⚠️ Error extracting text from {assignment.title}: {e}")
-                    error_count += 1
-            else:
-                error_count += 1
+                extract_key_text.enqueue(assignment_id=assignment.pk, fair_key=teacher_key(assignment))
+                queued_count += 1
         
         self.message_user(
             request,
-            f'Successfully extracted text from {success_count} assignment(s). {error_count} assignment(s) had errors or no files.'
+            f'Queued text extraction for {queued_count} assignment(s). {queryset.count() - queued_count} assignment(s) have no key answer file.'
         )
     extract_text_from_files.short_description = 'Extract text from key answer files'
     
+    def regrade_submissions(self, request, queryset):
+        """Admin action to re-grade submissions against the current answer key"""
+        from Student.services.tasks import enqueue_regrade
+        for assignment in queryset:
+            enqueue_regrade(assignment)
+        self.message_user(request, f'Queued a re-grade for {queryset.count()} assignment(s).')
+    regrade_submissions.short_description = 'Re-grade submissions against the answer key'
+    
     def save_model(self, request, obj, form, change):
         if not change:  # Only set on creation
             # Only set teacher if user is a teacher, otherwise let them select it
@@ -133,6 +125,7 @@ class AssignmentAdmin(admin.ModelAdmin):
         
         # Extract text from key answer file if provided and no text exists
         if obj.key_answer_file and not obj.key_answer_text:
+            from Student.services.admission import Overloaded
             try:
                 from Student.services.ocr import extract_text_from_file
                 file_path = obj.key_answer_file.path
@@ -142,28 +135,27 @@ class AssignmentAdmin(admin.ModelAdmin):
                         # Update the text field directly in database to avoid recursion
                         Assignment.objects.filter(pk=obj.pk).update(key_answer_text=extracted_text)
                         obj.key_answer_text = extracted_text  # Update instance for immediate use
+            except Overloaded:
+                # OCR is busy: extract in the background instead
+                from Student.services.tasks import extract_key_text, teacher_key
+                extract_key_text.enqueue(assignment_id=obj.pk, fair_key=teacher_key(obj))
+                self.message_user(request, 'Text extraction from the key answer file is queued and will finish shortly.')
             except Exception as e:
                 import traceback
                 print(f"⚠️ Could not extract text from key answer file: {e}")
                 print(traceback.format_exc())
         
+        # Existing grades were computed against the old key or scale
+        if change and {'key_answer_text', 'key_answer_file', 'grading_mode', 'rubric', 'max_score'} & set(form.changed_data):
+            from Student.services.tasks import enqueue_regrade
+            enqueue_regrade(obj)
+        
         # Create notifications for all students in the assigned classroom (only on creation)
         if not change and obj.is_active:
-            students = find_students_for_classroom(obj.classroom)
-            
-            notification_count = 0
-            for student in students:
-                notification, created = Notification.objects.get_or_create(
-                    assignment=obj,
-                    student=student,
-                    defaults={
-                        'message': f"New assignment: {obj.title} in {obj.subject.name}. Due: {obj.due_date.strftime('%Y-%m-%d %H:%M')}"
-                    }
-                )
-                if created:
-                    notification_count += 1
+            from Student.services.notifications import new_assignment_message, notify_classroom
+            result = notify_classroom(obj, new_assignment_message(obj))
             
-            if notification_count == 0:
+            if result['students'] == 0:
                 print(f"⚠️ Warning: No students found for classroom '{obj.classroom.name}'. Students may not see this assignment.")
 
 
@@ -172,4 +164,6 @@ class NotificationAdmin(admin.ModelAdmin):
     list_display = ['assignment', 'student', 'is_read', 'created_at']
     list_filter = ['is_read', 'created_at']
     search_fields = ['assignment__title', 'student__name', 'message']
+    # Assignment.__str__ shows the classroom and subject
+    list_select_related = ['student', 'assignment__classroom', 'assignment__subject']
     readonly_fields = ['created_at']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TeacherConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Teacher'
+
+    def ready(self):
+        from . import signals  # noqa: F401 - connects the membership signals
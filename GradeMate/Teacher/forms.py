@@ -27,7 +27,7 @@ class QuestionForm(forms.ModelForm):
 class AssignmentForm(forms.ModelForm):
     class Meta:
         model = Assignment
-        fields = ['title', 'description', 'subject', 'classroom', 'key_answer_file', 'key_answer_text', 'due_date', 'max_score']
+        fields = ['title', 'description', 'subject', 'classroom', 'key_answer_file', 'key_answer_text', 'grading_mode', 'rubric', 'due_date', 'max_score']
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent',
@@ -53,6 +53,14 @@ class AssignmentForm(forms.ModelForm):
                 'rows': 6,
                 'placeholder': 'Enter key answer text (optional, can be extracted from file)...'
             }),
+            'grading_mode': forms.Select(attrs={
+                'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent'
+            }),
+            'rubric': forms.Textarea(attrs={
+                'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent',
+                'rows': 6,
+                'placeholder': '2 | Chlorophyll absorbs light energy\n1 | Oxygen is released as a by-product'
+            }),
             'due_date': forms.DateTimeInput(attrs={
                 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent',
                 'type': 'datetime-local'
@@ -70,6 +78,8 @@ class AssignmentForm(forms.ModelForm):
             'classroom': 'Class/Classroom',
             'key_answer_file': 'Key Answer File',
             'key_answer_text': 'Key Answer Text (Optional)',
+            'grading_mode': 'Grading Mode',
+            'rubric': 'Rubric Points (Optional)',
             'due_date': 'Due Date',
             'max_score': 'Maximum Score',
         }
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from Teacher.utils import rebuild_memberships
+
+
+class Command(BaseCommand):
+    help = "Re-derive every classroom's memberships from the students' classes (after bulk imports or update() calls that bypass signals)"
+
+    def handle(self, *args, **options):
+        added, removed = rebuild_memberships()
+        self.stdout.write(self.style.SUCCESS(f"Added {added} and removed {removed} classroom membership(s)"))
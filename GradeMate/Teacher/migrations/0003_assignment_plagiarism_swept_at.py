@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Teacher', '0002_classroom_subject_assignment_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='plagiarism_swept_at',
+            field=models.DateTimeField(blank=True, help_text='Last post-deadline plagiarism sweep', null=True),
+        ),
+    ]
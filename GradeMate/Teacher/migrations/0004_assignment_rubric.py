@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Teacher', '0003_assignment_plagiarism_swept_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='grading_mode',
+            field=models.CharField(choices=[('holistic', 'Whole answer against the key answer'), ('rubric', 'Rubric points')], default='holistic', help_text='How answers are scored against the key', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='rubric',
+            field=models.TextField(blank=True, help_text="One rubric point per line, optionally weighted as '2 | statement'. If empty, each key answer paragraph is a point."),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_memberships(apps, schema_editor):
+    # The rules of Teacher.utils.classroom_matches_student, on historical models
+    Classroom = apps.get_model('Teacher', 'Classroom')
+    ClassroomMembership = apps.get_model('Teacher', 'ClassroomMembership')
+    User = apps.get_model('USER', 'User')
+    students = list(User.objects.filter(role='student', class_key__isnull=False).values_list('id', 'class_key', 'grade'))
+    memberships = []
+    for classroom in Classroom.objects.all():
+        name = classroom.name.strip().upper() if classroom.name else ""
+        grade = classroom.grade.strip() if classroom.grade else ""
+        for student_id, class_key, student_grade in students:
+            if class_key in name or name in class_key or (grade and student_grade == grade):
+                memberships.append(ClassroomMembership(classroom_id=classroom.id, student_id=student_id))
+    ClassroomMembership.objects.bulk_create(memberships, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Teacher', '0004_assignment_rubric'),
+        ('USER', '0002_user_class_grade_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassroomMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='Teacher.classroom')),
+                ('student', models.ForeignKey(limit_choices_to={'role': 'student'}, on_delete=django.db.models.deletion.CASCADE, related_name='classroom_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Classroom Membership',
+                'verbose_name_plural': 'Classroom Memberships',
+                'indexes': [models.Index(fields=['student', 'classroom'], name='membership_student')],
+                'unique_together': {('classroom', 'student')},
+            },
+        ),
+        migrations.RunPython(populate_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Teacher', '0005_classroommembership'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['student', 'created_at', 'id'], name='notification_keyset'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Teacher', '0006_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['classroom', 'created_at'], name='assignment_active'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['student', 'created_at'], name='notification_unread'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_submissions(apps, schema_editor):
+    Assignment = apps.get_model('Teacher', 'Assignment')
+    StudentAssignment = apps.get_model('Student', 'StudentAssignment')
+    counts = StudentAssignment.objects.filter(assignment=OuterRef('pk')).order_by().values('assignment')
+    Assignment.objects.update(
+        submission_count=Coalesce(Subquery(counts.annotate(n=Count('id')).values('n')), 0),
+        ungraded_count=Coalesce(Subquery(counts.annotate(n=Count('id', filter=Q(is_graded=False))).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Student', '0014_hot_path_indexes'),
+        ('Teacher', '0007_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='submission_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Submissions received, kept current by Student/services/teacher_stats.py'),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='ungraded_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Submissions awaiting a grade, kept current by Student/services/teacher_stats.py'),
+        ),
+        migrations.RunPython(count_submissions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['teacher', 'created_at'], name='assignment_teacher_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('ungraded_count__gt', 0)), fields=['teacher', 'created_at'], name='assignment_pending'),
+        ),
+    ]
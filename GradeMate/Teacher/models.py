@@ -52,6 +52,13 @@ class Question(models.Model):
 
 class Assignment(models.Model):
     """Assignment model for teachers to assign to classes"""
+    GRADING_HOLISTIC = 'holistic'
+    GRADING_RUBRIC = 'rubric'
+    GRADING_MODE_CHOICES = (
+        (GRADING_HOLISTIC, 'Whole answer against the key answer'),
+        (GRADING_RUBRIC, 'Rubric points'),
+    )
+    
     title = models.CharField(max_length=200, help_text="Assignment title")
     description = models.TextField(help_text="Assignment description/instructions")
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='assignments')
@@ -63,16 +70,32 @@ class Assignment(models.Model):
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx', 'txt'])]
     )
     key_answer_text = models.TextField(blank=True, help_text="Key answer text (extracted from file or manually entered)")
+    grading_mode = models.CharField(max_length=10, choices=GRADING_MODE_CHOICES, default=GRADING_HOLISTIC, help_text="How answers are scored against the key")
+    rubric = models.TextField(blank=True, help_text="One rubric point per line, optionally weighted as '2 | statement'. If empty, each key answer paragraph is a point.")
     due_date = models.DateTimeField(help_text="Assignment due date")
     max_score = models.DecimalField(max_digits=5, decimal_places=2, default=10.0, help_text="Maximum score")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True, help_text="Is assignment active?")
+    plagiarism_swept_at = models.DateTimeField(null=True, blank=True, help_text="Last post-deadline plagiarism sweep")
+    submission_count = models.IntegerField(default=0, editable=False, help_text="Submissions received, kept current by Student/services/teacher_stats.py")
+    ungraded_count = models.IntegerField(default=0, editable=False, help_text="Submissions awaiting a grade, kept current by Student/services/teacher_stats.py")
+    
+    # Moved with UPDATE ... SET n = n + delta by the teacher stats service; an
+    # instance held while submissions arrive refreshes them before a save
+    COUNT_FIELDS = ('submission_count', 'ungraded_count')
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Assignment"
         verbose_name_plural = "Assignments"
+        indexes = [
+            # A classroom's open assignments (visibility, pending counts)
+            models.Index(fields=['classroom', 'created_at'], condition=models.Q(is_active=True), name='assignment_active'),
+            # A teacher's latest assignments, and the latest with work to grade (dashboard)
+            models.Index(fields=['teacher', 'created_at'], name='assignment_teacher_recent'),
+            models.Index(fields=['teacher', 'created_at'], condition=models.Q(ungraded_count__gt=0), name='assignment_pending'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.classroom.name} ({self.subject.name})"
@@ -91,6 +114,29 @@ class Notification(models.Model):
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
         unique_together = ['assignment', 'student']
+        indexes = [
+            # Keyset pagination (Student/services/pagination.py) of a student's notifications
+            models.Index(fields=['student', 'created_at', 'id'], name='notification_keyset'),
+            models.Index(fields=['student', 'created_at'], condition=models.Q(is_read=False), name='notification_unread'),
+        ]
     
     def __str__(self):
         return f"Notification for {self.student.name} - {self.assignment.title}"
+
+
+class ClassroomMembership(models.Model):
+    """A student's membership of a classroom, derived from their class_grade and kept current by Teacher.signals"""
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='memberships')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='classroom_memberships', limit_choices_to={'role': 'student'})
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Classroom Membership"
+        verbose_name_plural = "Classroom Memberships"
+        unique_together = ['classroom', 'student']
+        indexes = [
+            models.Index(fields=['student', 'classroom'], name='membership_student'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student.name} in {self.classroom.name}"
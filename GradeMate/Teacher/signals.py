@@ -0,0 +1,28 @@
+"""
+Keep ClassroomMembership in step with the users and classrooms it is
+derived from.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from USER.models import User
+from .models import Classroom
+from .utils import sync_classroom_memberships, sync_student_memberships
+
+# Saves touching none of these fields cannot change a user's classrooms
+_MEMBERSHIP_FIELDS = {'class_grade', 'role'}
+
+
+@receiver(post_save, sender=User)
+def update_student_memberships(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not _MEMBERSHIP_FIELDS & set(update_fields)):
+        return
+    if created and instance.role != 'student':
+        return
+    sync_student_memberships(instance)
+
+
+@receiver(post_save, sender=Classroom)
+def update_classroom_memberships(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_classroom_memberships(instance)
@@ -1,3 +1,546 @@
-from django.test import TestCase
+import re
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from Student.models import StudentAnswer, StudentAssignment, TeacherStats, UserCounters
+from Student.models import Job
+from Student.services.notifications import fan_out, notify_classroom
+from Student.services import counters, events, tasks, teacher_stats
+from Student.services.admission import Overloaded
+from Student.tests import KEY_ANSWER, QueryBudgetMixin, QueryPlanMixin, SubmissionFixtureMixin, read_events
+from USER.models import User
+from django.core.management import call_command
+from .models import Assignment, Classroom, ClassroomMembership, Notification, Question, Subject
+from .utils import find_students_for_classroom, match_students_for_classroom
 
-# Create your tests here.
+
+def legacy_find_students_for_classroom(classroom):
+    """The Python scan find_students_for_classroom replaced, kept as the reference semantics."""
+    if not classroom:
+        return User.objects.none()
+
+    classroom_name = classroom.name.strip() if classroom.name else ""
+    classroom_grade = classroom.grade.strip() if classroom.grade else ""
+    classroom_section = classroom.section.strip() if classroom.section else ""
+
+    all_students = User.objects.filter(role='student')
+    matching_students = []
+
+    for student in all_students:
+        if not student.class_grade:
+            continue
+
+        student_class = student.class_grade.strip()
+        student_class_upper = student_class.upper()
+        classroom_name_upper = classroom_name.upper()
+
+        if student_class_upper == classroom_name_upper:
+            matching_students.append(student)
+            continue
+
+        student_grade = None
+        student_section = None
+
+        match = re.match(r'(\d+)[\s\-]?([A-Za-z])?', student_class)
+        if match:
+            student_grade = match.group(1)
+            if match.group(2):
+                student_section = match.group(2).upper()
+
+        if not student_grade:
+            match = re.search(r'(\d+)[\s\-]?([A-Za-z])?', student_class)
+            if match:
+                student_grade = match.group(1)
+                if match.group(2):
+                    student_section = match.group(2).upper()
+
+        if student_grade and classroom_grade:
+            if student_grade == classroom_grade:
+                if not classroom_section or not student_section or student_section == classroom_section.upper():
+                    if student not in matching_students:
+                        matching_students.append(student)
+                    continue
+
+        if student_class_upper in classroom_name_upper or classroom_name_upper in student_class_upper:
+            if student not in matching_students:
+                matching_students.append(student)
+            continue
+
+        if student_grade and classroom_grade and student_grade == classroom_grade:
+            if student not in matching_students:
+                matching_students.append(student)
+
+    if matching_students:
+        return User.objects.filter(id__in=[s.id for s in matching_students])
+    return User.objects.none()
+
+
+class FindStudentsForClassroomTests(TestCase):
+    CLASS_GRADES = [
+        None, '', ' ', '-', '10', '10-A', '10A', '10 A', '10a', ' 10-b', '10B', '10-', '10 -A',
+        '9', '9-A', '09', '100', '1', '11', 'A', 'a', 'Gr10', 'G10A', 'x9y', 'GRADE', 'Ten', '10-A1',
+    ]
+    CLASSROOMS = [
+        ('Grade 10-A', '10', 'A'),
+        ('Grade 10-B', '10', 'B'),
+        ('10-A', '10', ''),
+        ('10', ' 10 ', ''),
+        ('Class 9', '9', 'A'),
+        ('A', '', ''),
+        ('1', '1', ''),
+        ('Ten', 'ten', ''),
+        ('Gr10', '', ''),
+        ('Grade 100 Advanced', '100', ''),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        for i, class_grade in enumerate(cls.CLASS_GRADES):
+            User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade=class_grade)
+        # Teachers never match, whatever their class
+        User.objects.create(username='teacher', name='Teacher', role='teacher', class_grade='10-A')
+        for name, grade, section in cls.CLASSROOMS:
+            Classroom.objects.create(name=name, grade=grade, section=section)
+
+    def test_matches_legacy_scan(self):
+        for classroom in Classroom.objects.all():
+            with self.subTest(classroom=classroom.name):
+                self.assertEqual(
+                    set(find_students_for_classroom(classroom).values_list('username', flat=True)),
+                    set(legacy_find_students_for_classroom(classroom).values_list('username', flat=True)),
+                )
+
+    def test_resolves_in_one_query(self):
+        classroom = Classroom.objects.get(name='Grade 10-A')
+        with self.assertNumQueries(1):
+            students = list(find_students_for_classroom(classroom))
+        self.assertTrue(students)
+
+    def test_no_classroom(self):
+        self.assertFalse(find_students_for_classroom(None).exists())
+
+    def test_columns_follow_class_grade(self):
+        student = User.objects.get(class_grade=' 10-b')
+        self.assertEqual((student.class_key, student.grade, student.section), ('10-B', '10', 'B'))
+        student.class_grade = 'Gr9'
+        student.save(update_fields=['class_grade'])
+        student.refresh_from_db()
+        self.assertEqual((student.class_key, student.grade, student.section), ('GR9', '9', None))
+        student.class_grade = ''
+        student.save()
+        student.refresh_from_db()
+        self.assertEqual((student.class_key, student.grade, student.section), (None, None, None))
+
+
+class ClassroomMembershipTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create(username='student', name='Student', role='student', class_grade='10-A')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.other = Classroom.objects.create(name='Grade 9-B', grade='9', section='B')
+
+    def members(self, classroom):
+        return set(find_students_for_classroom(classroom).values_list('username', flat=True))
+
+    def test_follows_student_class(self):
+        self.assertEqual(self.members(self.classroom), {'student'})
+        self.student.class_grade = '9B'
+        self.student.save(update_fields=['class_grade'])
+        self.assertEqual(self.members(self.classroom), set())
+        self.assertEqual(self.members(self.other), {'student'})
+
+    def test_follows_classroom_changes(self):
+        self.other.name = 'Grade 10 Science'
+        self.other.grade = '10'
+        self.other.save()
+        self.assertEqual(self.members(self.other), {'student'})
+        self.classroom.name = 'Grade 11-A'
+        self.classroom.grade = '11'
+        self.classroom.save()
+        self.assertEqual(self.members(self.classroom), set())
+
+    def test_follows_role(self):
+        self.student.role = 'teacher'
+        self.student.save()
+        self.assertFalse(ClassroomMembership.objects.filter(student=self.student).exists())
+
+    def test_rebuild(self):
+        # update() bypasses the signals; the command catches up
+        User.objects.filter(pk=self.student.pk).update(class_grade='9-B', class_key='9-B', grade='9', section='B')
+        self.assertEqual(self.members(self.other), set())
+        call_command('rebuild_memberships', stdout=StringIO())
+        for classroom in (self.classroom, self.other):
+            self.assertEqual(self.members(classroom), set(match_students_for_classroom(classroom).values_list('username', flat=True)))
+        self.assertEqual(self.members(self.other), {'student'})
+
+
+class TeacherListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    ADMIN_CHANGELISTS = [
+        '/admin/Teacher/assignment/',
+        '/admin/Teacher/notification/',
+        '/admin/Teacher/question/',
+        '/admin/Student/studentassignment/',
+        '/admin/Student/studentanswer/',
+    ]
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='pw', name='Teacher', role='teacher')
+        self.admin = User.objects.create_superuser(username='admin', password='pw', name='Admin', role='teacher')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+
+    def seed(self, size):
+        for i in range(Assignment.objects.count(), size):
+            subject = Subject.objects.create(name=f'Subject {i}', code=f'S{i}')
+            classroom = Classroom.objects.create(name=f'Grade {i}-B', grade=str(i), section='B')
+            student = User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade=f'{i}-B')
+            assignment = Assignment.objects.create(
+                title=f'Assignment {i}', teacher=self.teacher, subject=subject, classroom=classroom,
+                due_date=timezone.now(),
+            )
+            Notification.objects.create(assignment=assignment, student=student, message='New assignment')
+            StudentAssignment.objects.create(assignment=assignment, student=student, is_graded=i % 2 == 0)
+            question = Question.objects.create(question_text=f'Question {i}', model_answer='Answer', created_by=self.teacher)
+            StudentAnswer.objects.create(student=student, question=question, answer_text='Answer')
+        # As the signals would on commit, which never comes inside a test
+        UserCounters.objects.update(stale=True)
+        TeacherStats.objects.update(stale=True)
+
+    def test_teacher_pages(self):
+        self.client.force_login(self.teacher)
+        for url in ['/Teacher/dashboard/', '/Teacher/AssignmentList/', '/Teacher/SubmissionList/']:
+            with self.subTest(url=url):
+                self.assertFlatQueryCount(self.seed, lambda size: self.client.get(url))
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        for url in self.ADMIN_CHANGELISTS:
+            with self.subTest(url=url):
+                self.assertFlatQueryCount(self.seed, lambda size: self.assertEqual(self.client.get(url).status_code, 200))
+
+
+class NotificationFanOutTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(username='teacher', name='Teacher', role='teacher')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.students = [
+            User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade='10-A')
+            for i in range(5)
+        ]
+        self.assignment = Assignment.objects.create(
+            title='Quiz', teacher=self.teacher, subject=Subject.objects.create(name='Science'),
+            classroom=self.classroom, due_date=timezone.now(),
+        )
+
+    def messages(self):
+        return dict(Notification.objects.filter(assignment=self.assignment).values_list('student__username', 'message'))
+
+    @override_settings(ASSIGNMENT_NOTIFICATIONS={'BATCH_SIZE': 2})
+    def test_creates_missing_and_refreshes_changed(self):
+        Notification.objects.create(assignment=self.assignment, student=self.students[0], message='Old', is_read=True)
+        Notification.objects.create(assignment=self.assignment, student=self.students[1], message='Quiz due', is_read=True)
+        self.assertEqual(fan_out(self.assignment, 'Quiz due', refresh=True), (3, 1))
+        self.assertEqual(set(self.messages().values()), {'Quiz due'})
+        # Only the rewritten notification is unread again
+        self.assertFalse(Notification.objects.get(student=self.students[0]).is_read)
+        self.assertTrue(Notification.objects.get(student=self.students[1]).is_read)
+
+    def test_new_assignment_keeps_existing_messages(self):
+        Notification.objects.create(assignment=self.assignment, student=self.students[0], message='Old')
+        self.assertEqual(fan_out(self.assignment, 'New'), (4, 0))
+        self.assertEqual(self.messages()['student0'], 'Old')
+
+    def test_query_count_does_not_grow_with_roster(self):
+        fan_out(self.assignment, 'Quiz due')
+        with self.assertNumQueries(2):
+            self.assertEqual(fan_out(self.assignment, 'Quiz due', refresh=True), (0, 0))
+        for i in range(5, 40):
+            User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade='10-A')
+        with self.assertNumQueries(10):
+            # Read roster and notifications, lock the assignment and read the
+            # notifications again, insert and read back, update, the unread
+            # counters, and the savepoint pair
+            self.assertEqual(fan_out(self.assignment, 'Quiz moved', refresh=True), (35, 5))
+
+    def assertCountersExact(self):
+        student_ids = [student.pk for student in self.students]
+        stored = dict(UserCounters.objects.filter(user_id__in=student_ids).values_list('user_id', 'unread_notifications'))
+        self.assertEqual(stored, {user_id: values['unread_notifications'] for user_id, values in counters._count(student_ids).items()})
+
+    def test_notification_written_meanwhile_is_not_counted_twice(self):
+        # Another fan-out notifies student0 after this one first read the
+        # notifications but before it takes the lock
+        counters.reconcile([student.pk for student in self.students])
+        lock = Assignment.objects.select_for_update
+
+        def notify_then_lock():
+            Notification.objects.create(assignment=self.assignment, student=self.students[0], message='Quiz due')
+            return lock()
+
+        with mock.patch.object(Assignment.objects, 'select_for_update', side_effect=notify_then_lock):
+            self.assertEqual(fan_out(self.assignment, 'Quiz due'), (4, 0))
+        self.assertCountersExact()
+
+    @override_settings(ASSIGNMENT_NOTIFICATIONS={'BATCH_SIZE': 2})
+    def test_overlapping_fan_outs_neither_fail_nor_double_count(self):
+        # SQLite has no row locks, so a second fan-out can read the same
+        # missing students; here it runs between the first one's batches
+        counters.reconcile([student.pk for student in self.students])
+        insert = Notification.objects.bulk_create
+        results = []
+
+        def insert_after_other_fan_out(objs, **kwargs):
+            if len(insert_calls.call_args_list) == 2:
+                results.append(fan_out(self.assignment, 'Quiz due'))
+            return insert(objs, **kwargs)
+
+        with mock.patch.object(Notification.objects, 'bulk_create', side_effect=insert_after_other_fan_out) as insert_calls:
+            results.insert(0, fan_out(self.assignment, 'Quiz due'))
+        # The first wrote students 0 and 1, the second the other three
+        self.assertEqual(results, [(2, 0), (3, 0)])
+        self.assertEqual(Notification.objects.filter(assignment=self.assignment).count(), 5)
+        self.assertCountersExact()
+
+    @override_settings(ASSIGNMENT_NOTIFICATIONS={'INLINE_LIMIT': 3})
+    def test_large_classroom_is_queued(self):
+        result = notify_classroom(self.assignment, 'Quiz due')
+        self.assertTrue(result['queued'])
+        self.assertFalse(Notification.objects.exists())
+        self.assertTrue(Job.objects.filter(name='notify_students', payload__assignment_id=self.assignment.pk).exists())
+
+
+class TeacherQueryPlanTests(QueryPlanMixin, QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(username='teacher', password='pw', name='Teacher', role='teacher')
+        subject = Subject.objects.create(name='Science')
+        classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        assignment = Assignment.objects.create(
+            title='Quiz', teacher=cls.teacher, subject=subject, classroom=classroom, due_date=timezone.now()
+        )
+        for i in range(3):
+            student = User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade='10-A')
+            StudentAssignment.objects.create(assignment=assignment, student=student, is_graded=i == 0)
+
+    def test_dashboard(self):
+        self.client.force_login(self.teacher)
+        self.client.get('/Teacher/dashboard/')
+        self.assertUsesIndexes(lambda: self.client.get('/Teacher/dashboard/'), 'assignment_teacher_recent', 'assignment_pending')
+
+    def test_submission_list(self):
+        from .views import SubmissionList
+        self.assertUsesIndexes(lambda: self.page_rows(SubmissionList, self.teacher, 20, ['student.name']), 'submission_keyset')
+
+    def test_counter_recount(self):
+        self.assertUsesIndexes(lambda: counters.reconcile([self.teacher.pk]), 'submission_pending')
+
+
+class TeacherStatsTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='pw', name='Teacher', role='teacher')
+        self.subject = Subject.objects.create(name='Science')
+        self.classroom = Classroom.objects.create(name='Grade 10-A', grade='10', section='A')
+        self.students = [
+            User.objects.create(username=f'student{i}', name=f'Student {i}', role='student', class_grade='10-A') for i in range(3)
+        ]
+        teacher_stats.get_teacher_stats(self.teacher)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignment = self.create_assignment(max_score=10)
+        teacher_stats.get_teacher_stats(self.teacher)
+
+    def create_assignment(self, **kwargs):
+        return Assignment.objects.create(
+            title='Quiz', teacher=self.teacher, subject=self.subject, classroom=self.classroom, due_date=timezone.now(), **kwargs
+        )
+
+    def assertMatchesRecount(self):
+        stats = TeacherStats.objects.get(teacher=self.teacher)
+        self.assertEqual({field: getattr(stats, field) for field in teacher_stats.STATS_FIELDS}, teacher_stats._count([self.teacher.pk])[self.teacher.pk])
+        for assignment in Assignment.objects.filter(teacher=self.teacher):
+            submissions = StudentAssignment.objects.filter(assignment=assignment)
+            self.assertEqual((assignment.submission_count, assignment.ungraded_count), (submissions.count(), submissions.filter(is_graded=False).count()))
+
+    def test_running_totals_follow_submissions_and_grading(self):
+        first, second, third = [StudentAssignment.objects.create(assignment=self.assignment, student=student) for student in self.students]
+        self.assertMatchesRecount()
+        for submission, score in ((first, 8), (second, 6.5)):
+            submission = StudentAssignment.objects.get(pk=submission.pk)
+            submission.score, submission.is_graded = score, True
+            submission.save()
+        self.assertMatchesRecount()
+        self.assertEqual(TeacherStats.objects.get(teacher=self.teacher).average_percentage, 72.5)
+        # A re-grade only changes the score
+        regraded = StudentAssignment.objects.get(pk=first.pk)
+        regraded.score = 9
+        regraded.save()
+        self.assertMatchesRecount()
+        StudentAssignment.objects.get(pk=second.pk).delete()
+        StudentAssignment.objects.get(pk=third.pk).delete()
+        self.assertMatchesRecount()
+        self.assertFalse(TeacherStats.objects.get(teacher=self.teacher).stale)
+
+    def test_assignment_changes(self):
+        self.create_assignment(is_active=False)
+        self.assertMatchesRecount()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignment.max_score = 20
+            self.assignment.save()
+        self.assertTrue(TeacherStats.objects.get(teacher=self.teacher).stale)
+        self.assertEqual(teacher_stats.get_teacher_stats(self.teacher).students, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create(username='late', name='Late', role='student', class_grade='10-A')
+        self.assertEqual(teacher_stats.get_teacher_stats(self.teacher).students, 4)
+        self.assertMatchesRecount()
+
+    def test_save_writes_the_counts_it_is_given(self):
+        # save() is standard: admin, fixtures and tests can set the counts
+        self.assignment.submission_count = 4
+        self.assignment.save()
+        self.assertEqual(Assignment.objects.get(pk=self.assignment.pk).submission_count, 4)
+
+    def test_edit_keeps_counts_of_submissions_made_meanwhile(self):
+        loaded = Assignment.objects.get(pk=self.assignment.pk)
+        StudentAssignment.objects.create(assignment=self.assignment, student=self.students[0])
+        # What AssignmentUpdateView does before saving the form
+        loaded.refresh_from_db(fields=Assignment.COUNT_FIELDS)
+        loaded.title = 'Renamed'
+        loaded.save()
+        self.assertMatchesRecount()
+
+    def test_dashboard_counts_students_of_active_classrooms(self):
+        # Students of classrooms with only inactive assignments, or none, are not counted
+        other = Classroom.objects.create(name='Grade 9-B', grade='9', section='B')
+        User.objects.create(username='elsewhere', name='Elsewhere', role='student', class_grade='9-B')
+        User.objects.create(username='unplaced', name='Unplaced', role='student')
+        with self.captureOnCommitCallbacks(execute=True):
+            Assignment.objects.create(
+                title='Old quiz', teacher=self.teacher, subject=self.subject, classroom=other, due_date=timezone.now(), is_active=False,
+            )
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get('/Teacher/dashboard/').context['active_students_count'], 3)
+
+    def test_reconcile_repairs_drift(self):
+        StudentAssignment.objects.create(assignment=self.assignment, student=self.students[0])
+        TeacherStats.objects.update(assignments=9)
+        Assignment.objects.update(submission_count=5)
+        self.assertEqual(teacher_stats.reconcile([self.teacher.pk]), 2)
+        self.assertMatchesRecount()
+        self.assertEqual(teacher_stats.reconcile([self.teacher.pk]), 0)
+
+    def test_dashboard_reads_stored_figures(self):
+        StudentAssignment.objects.create(assignment=self.assignment, student=self.students[0])
+        self.client.force_login(self.teacher)
+        self.client.get('/Teacher/dashboard/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/Teacher/dashboard/')
+        self.assertEqual(response.context['pending_evaluations_count'], 1)
+        self.assertEqual([assignment.submission_count for assignment in response.context['pending_evaluation_assignments']], [1])
+        self.assertFalse([query['sql'] for query in queries if 'Student_studentassignment' in query['sql']])
+
+
+NEW_KEY = "Photosynthesis turns light energy, water and carbon dioxide into glucose and oxygen."
+
+
+class AssignmentRegradeTests(SubmissionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.assignment.description = 'Explain photosynthesis'
+        self.assignment.key_answer_file = SimpleUploadedFile('key.txt', KEY_ANSWER.encode())
+        self.assignment.save()
+        self.client.force_login(self.teacher)
+
+    def edit(self, **changes):
+        data = {
+            'title': self.assignment.title, 'description': self.assignment.description, 'subject': self.subject.pk,
+            'classroom': self.classroom.pk, 'key_answer_text': KEY_ANSWER, 'grading_mode': Assignment.GRADING_HOLISTIC,
+            'rubric': '', 'due_date': self.assignment.due_date.strftime('%Y-%m-%d %H:%M'), 'max_score': '10.00',
+        }
+        data.update(changes)
+        response = self.client.post(f'/Teacher/assignments/{self.assignment.pk}/update/', data)
+        self.assertEqual(response.status_code, 302)
+
+    def regrade_jobs(self):
+        return Job.objects.filter(name='regrade_assignment', payload__assignment_id=self.assignment.pk)
+
+    def test_key_changes_queue_one_regrade(self):
+        self.edit(title='Photosynthesis quiz')
+        self.assertFalse(self.regrade_jobs().exists())
+        self.edit(key_answer_text=KEY_ANSWER + ' Glucose stores the energy.')
+        self.edit(max_score='20.00')
+        self.assertEqual(self.regrade_jobs().count(), 1)
+
+    def test_new_key_file_is_extracted_before_the_regrade(self):
+        # The form still carries the old key text, unedited
+        with mock.patch('Student.services.ocr.extract_text_from_file', return_value=NEW_KEY):
+            self.edit(key_answer_file=SimpleUploadedFile('new-key.txt', NEW_KEY.encode()))
+        self.assignment.refresh_from_db()
+        self.assertEqual(self.assignment.key_answer_text, NEW_KEY)
+        self.assertEqual(self.regrade_jobs().count(), 1)
+
+    def test_busy_ocr_regrades_after_the_deferred_extraction(self):
+        with mock.patch('Student.services.ocr.extract_text_from_file', side_effect=Overloaded('ocr', 5)):
+            self.edit(key_answer_file=SimpleUploadedFile('new-key.txt', NEW_KEY.encode()))
+        self.assertFalse(self.regrade_jobs().exists())
+        extraction = Job.objects.get(name='extract_key_text')
+        self.assertEqual(extraction.payload, {'assignment_id': self.assignment.pk, 'regrade': True})
+        with mock.patch.object(tasks, 'extract_text_from_file', return_value=NEW_KEY):
+            tasks.extract_key_text(**extraction.payload)
+        self.assignment.refresh_from_db()
+        self.assertEqual(self.assignment.key_answer_text, NEW_KEY)
+        self.assertEqual(self.regrade_jobs().count(), 1)
+
+    def test_due_date_change_reschedules_the_sweep(self):
+        due = (self.assignment.due_date + timedelta(days=1)).replace(second=0, microsecond=0)
+        self.edit(due_date=timezone.localtime(due).strftime('%Y-%m-%d %H:%M'))
+        job = Job.objects.get(name='sweep_plagiarism', payload__assignment_id=self.assignment.pk)
+        self.assertAlmostEqual(job.run_after, due, delta=timedelta(seconds=1))
+
+    def test_regrade_button(self):
+        self.client.post(f'/Teacher/assignments/{self.assignment.pk}/regrade/')
+        self.assertEqual(self.regrade_jobs().get().priority, Job.PRIORITY_BACKGROUND)
+
+
+class TeacherSubmissionEventsTests(SubmissionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # The change feed runs until STREAM_SECONDS, so keep it short
+        self.enterContext(mock.patch.object(events, 'POLL_INTERVAL', 0.01))
+        self.enterContext(mock.patch.object(events, 'STREAM_SECONDS', 0.2))
+        other_teacher = User.objects.create(username='other', name='Other', role='teacher')
+        other_assignment = Assignment.objects.create(
+            title='Other quiz', teacher=other_teacher, subject=self.subject, classroom=self.classroom, due_date=timezone.now(),
+        )
+        now = timezone.now()
+        self.old = self.submit(self.students[0])
+        self.new = self.submit(self.students[1])
+        self.foreign = StudentAssignment.objects.create(assignment=other_assignment, student=self.students[2])
+        StudentAssignment.objects.filter(pk=self.old.pk).update(updated_at=now - timedelta(hours=2))
+        StudentAssignment.objects.filter(pk__in=[self.new.pk, self.foreign.pk]).update(updated_at=now - timedelta(minutes=10))
+        self.since = (now - timedelta(hours=1)).isoformat()
+        self.url = reverse('Teacher:submission_events')
+
+    async def stream(self, url=None, **headers):
+        await self.async_client.aforce_login(self.teacher)
+        return await self.async_client.get(url or self.url, headers=headers)
+
+    async def test_teacher_only_sees_their_own_assignments(self):
+        received = await read_events(await self.stream(**{'Last-Event-ID': (timezone.now() - timedelta(days=1)).isoformat()}))
+        self.assertEqual({event['data']['id'] for event in received}, {self.old.pk, self.new.pk})
+
+    async def test_resumes_from_last_event_id(self):
+        [event] = await read_events(await self.stream(**{'Last-Event-ID': self.since}))
+        self.assertEqual(event['data']['id'], self.new.pk)
+        new = await StudentAssignment.objects.aget(pk=self.new.pk)
+        self.assertEqual(event['id'], new.updated_at.isoformat())
+        # Without a cursor the feed starts now
+        self.assertEqual(await read_events(await self.stream()), [])
+
+    async def test_assignment_filter(self):
+        self.assertEqual(await read_events(await self.stream(f'{self.url}?assignment={self.assignment.pk + 1}', **{'Last-Event-ID': self.since})), [])
+        self.assertEqual((await self.stream(f'{self.url}?assignment=abc')).status_code, 400)
+        await self.async_client.aforce_login(self.students[0])
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 403)
@@ -8,10 +8,12 @@ urlpatterns = [
     path("AssignmentForm/",views.AssignmentFormView.as_view(),name="TAssignment"),
     path("AssignmentList/",views.AssignmentList.as_view(),name="assignment_list"),
     path("SubmissionList/",views.SubmissionList.as_view(),name="TSubmissionList"),
+    path("submissions/events/",views.SubmissionEventsView.as_view(),name="submission_events"),
     # Assignment CRUD URLs
     path("assignments/create/",views.AssignmentCreateView.as_view(),name="assignment_create"),
     path("assignments/<int:pk>/",views.AssignmentDetailView.as_view(),name="assignment_detail"),
     path("assignments/<int:pk>/update/",views.AssignmentUpdateView.as_view(),name="assignment_update"),
+    path("assignments/<int:pk>/regrade/",views.AssignmentRegradeView.as_view(),name="assignment_regrade"),
     path("assignments/<int:pk>/delete/",views.AssignmentDeleteView.as_view(),name="assignment_delete"),
     path("submissions/<int:pk>/",views.SubmissionDetailView.as_view(),name="submission_detail"),
     # Question CRUD URLs
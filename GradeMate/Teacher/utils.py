@@ -1,19 +1,28 @@
 """
 Utility functions for Teacher app
 """
-import re
+from django.db import transaction
+from django.db.models import Q
 from USER.models import User
-from .models import Classroom
+from .models import Classroom, ClassroomMembership
 
 
-def find_students_for_classroom(classroom):
+def _substrings(text, max_length):
+    """Every distinct substring of text up to max_length characters, including ''."""
+    return {text[start:end] for start in range(len(text) + 1) for end in range(start, min(len(text), start + max_length) + 1)}
+
+
+def match_students_for_classroom(classroom):
     """
-    Find all students that belong to a given classroom.
-    Uses flexible matching to handle different formats:
+    Apply the classroom matching rules to every student:
     - Exact match (case-insensitive): "Grade 10-A" matches "Grade 10-A"
-    - Name match: "Grade 10-A" matches "10-A" or "10A"
-    - Grade+Section match: Matches by grade and section separately
-    - Partial match: "Grade 10-A" matches "10-A" or "10A" or "10"
+    - Partial match: "Grade 10-A" matches "10-A" or "10A", and the other way round
+    - Grade match: the first number in the student's class equals the
+      classroom's grade, so "10", "10B" and "Grade 10" all match grade 10
+    
+    Matching runs as one query on the class_key and grade columns that
+    User.save() parses from class_grade. Used to maintain
+    ClassroomMembership; look rosters up with find_students_for_classroom.
     
     Args:
         classroom: Classroom instance
@@ -24,73 +33,106 @@ def find_students_for_classroom(classroom):
     if not classroom:
         return User.objects.none()
     
-    classroom_name = classroom.name.strip() if classroom.name else ""
+    classroom_name = classroom.name.strip().upper() if classroom.name else ""
     classroom_grade = classroom.grade.strip() if classroom.grade else ""
-    classroom_section = classroom.section.strip() if classroom.section else ""
     
-    # Build a list of possible matches
-    all_students = User.objects.filter(role='student')
-    matching_students = []
+    # The student's class is part of the classroom name: class_grade holds
+    # at most key_length characters, so every possible key is one of the
+    # name's short substrings and this is an indexed IN lookup
+    key_length = User._meta.get_field('class_grade').max_length
+    matches = Q(class_key__in=_substrings(classroom_name, key_length))
+    # The classroom name is part of the student's class (only possible for
+    # names no longer than a class)
+    if len(classroom_name) <= key_length:
+        matches |= Q(class_key__contains=classroom_name)
+    if classroom_grade:
+        matches |= Q(grade=classroom_grade)
+    return User.objects.filter(matches, role='student')
+
+
+def classroom_matches_student(classroom, student):
+    """The rules of match_students_for_classroom for one classroom and one student."""
+    if student.role != 'student' or student.class_key is None:
+        return False
+    classroom_name = classroom.name.strip().upper() if classroom.name else ""
+    classroom_grade = classroom.grade.strip() if classroom.grade else ""
+    return (
+        student.class_key in classroom_name
+        or classroom_name in student.class_key
+        or bool(classroom_grade and student.grade == classroom_grade)
+    )
+
+
+def find_students_for_classroom(classroom):
+    """
+    Students of a classroom, from the ClassroomMembership table.
     
-    for student in all_students:
-        if not student.class_grade:
-            continue
-            
-        student_class = student.class_grade.strip()
-        student_class_upper = student_class.upper()
-        classroom_name_upper = classroom_name.upper()
-        
-        # Method 1: Exact match (case-insensitive, whitespace-tolerant)
-        if student_class_upper == classroom_name_upper:
-            matching_students.append(student)
-            continue
-        
-        # Method 2: Extract grade and section from student class_grade
-        # Try patterns like "10-A", "10A", "10 A", "Grade 10-A", etc.
-        student_grade = None
-        student_section = None
-        
-        # Try to extract grade and section from student class_grade
-        # Pattern 1: "10-A" or "10A"
-        match = re.match(r'(\d+)[\s\-]?([A-Za-z])?', student_class)
-        if match:
-            student_grade = match.group(1)
-            if match.group(2):
-                student_section = match.group(2).upper()
-        
-        # Pattern 2: "Grade 10-A" or "Grade 10 A"
-        if not student_grade:
-            match = re.search(r'(\d+)[\s\-]?([A-Za-z])?', student_class)
-            if match:
-                student_grade = match.group(1)
-                if match.group(2):
-                    student_section = match.group(2).upper()
-        
-        # Method 3: Match by grade and section if available
-        if student_grade and classroom_grade:
-            if student_grade == classroom_grade:
-                # If sections match or one is empty, consider it a match
-                if not classroom_section or not student_section or student_section == classroom_section.upper():
-                    if student not in matching_students:
-                        matching_students.append(student)
-                    continue
-        
-        # Method 4: Partial match - check if classroom name contains student class or vice versa
-        if student_class_upper in classroom_name_upper or classroom_name_upper in student_class_upper:
-            if student not in matching_students:
-                matching_students.append(student)
-            continue
+    Args:
+        classroom: Classroom instance
         
-        # Method 5: Match if grade is in both (for cases like "10" matching "Grade 10-A")
-        if student_grade and classroom_grade and student_grade == classroom_grade:
-            if student not in matching_students:
-                matching_students.append(student)
-    
-    # Return as a queryset
-    if matching_students:
-        student_ids = [s.id for s in matching_students]
-        return User.objects.filter(id__in=student_ids)
-    else:
+    Returns:
+        QuerySet of User objects (students)
+    """
+    if not classroom:
         return User.objects.none()
+    return User.objects.filter(classroom_memberships__classroom=classroom, role='student')
+
+
+def _memberships_changed(student_ids, classroom_ids):
+    """
+    Students whose classrooms changed see a different set of assignments,
+    and the classrooms' teachers have different students.
+    """
+    if student_ids:
+        from Student.services.counters import mark_stale
+        from Student.services.teacher_stats import mark_classrooms_stale
+        from Student.services.visibility import invalidate_students
+        transaction.on_commit(lambda: invalidate_students(student_ids))
+        transaction.on_commit(lambda: mark_stale(student_ids))
+        transaction.on_commit(lambda: mark_classrooms_stale(classroom_ids))
+
+
+def sync_classroom_memberships(classroom):
+    """
+    Bring a classroom's memberships in line with the matching rules.
+    Returns (added, removed).
+    """
+    matched = set(match_students_for_classroom(classroom).values_list('id', flat=True))
+    current = set(ClassroomMembership.objects.filter(classroom=classroom).values_list('student_id', flat=True))
+    with transaction.atomic():
+        removed, _ = ClassroomMembership.objects.filter(classroom=classroom, student_id__in=current - matched).delete()
+        ClassroomMembership.objects.bulk_create(
+            [ClassroomMembership(classroom=classroom, student_id=student_id) for student_id in matched - current],
+            ignore_conflicts=True,
+        )
+        _memberships_changed(matched ^ current, [classroom.pk])
+    return len(matched - current), removed
+
+
+def sync_student_memberships(student):
+    """
+    Bring one student's memberships in line with the matching rules; one
+    pass over the classrooms, however many students there are.
+    Returns (added, removed).
+    """
+    matched = {classroom.id for classroom in Classroom.objects.only('id', 'name', 'grade') if classroom_matches_student(classroom, student)}
+    current = set(ClassroomMembership.objects.filter(student=student).values_list('classroom_id', flat=True))
+    with transaction.atomic():
+        removed, _ = ClassroomMembership.objects.filter(student=student, classroom_id__in=current - matched).delete()
+        ClassroomMembership.objects.bulk_create(
+            [ClassroomMembership(classroom_id=classroom_id, student=student) for classroom_id in matched - current],
+            ignore_conflicts=True,
+        )
+        if matched != current:
+            _memberships_changed([student.pk], matched ^ current)
+    return len(matched - current), removed
 
 
+def rebuild_memberships():
+    """Re-derive every classroom's memberships. Returns (added, removed)."""
+    added = removed = 0
+    for classroom in Classroom.objects.all():
+        classroom_added, classroom_removed = sync_classroom_memberships(classroom)
+        added += classroom_added
+        removed += classroom_removed
+    return added, removed
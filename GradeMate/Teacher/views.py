@@ -1,14 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponseBadRequest, HttpResponseForbidden
+from django.views import View
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.utils import timezone
 from django.db.models import Q
-from .models import Question, Assignment, Subject, Classroom, Notification
+from .models import Question, Assignment, Subject, Classroom
 from .forms import QuestionForm, AssignmentForm, SubmissionGradingForm
 from .utils import find_students_for_classroom
-from USER.models import User
+from Student.services.admission import AdmissionControlMixin
+from Student.services.counters import get_counters
+from Student.services.pagination import KeysetPaginationMixin
+from Student.services.stats import submission_stats
+from Student.services.teacher_stats import get_teacher_stats
 
 class Dashboard(LoginRequiredMixin, TemplateView):
     template_name="Teacher/dashboard.html"
@@ -17,41 +23,19 @@ class Dashboard(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         teacher = self.request.user
         
-        # Get assignments
-        assignments = Assignment.objects.filter(teacher=teacher)
-        active_assignments = assignments.filter(is_active=True)
+        # Statistics from the stored running totals (one read each)
+        stats = get_teacher_stats(teacher)
+        context['total_assignments_count'] = stats.assignments
+        context['active_assignments'] = stats.active_assignments
+        context['active_students_count'] = stats.students  # Students in the teacher's active classrooms
+        context['pending_evaluations_count'] = get_counters(teacher).ungraded_submissions
+        context['average_grade'] = stats.average_percentage or 0
         
-        # Statistics
-        context['total_assignments_count'] = assignments.count()
-        context['active_assignments'] = active_assignments.count()
-        context['active_students_count'] = User.objects.filter(role='student').count()  # Total students
-        context['recent_assignments'] = assignments.order_by('-created_at')[:5]
-        
-        # Get pending evaluations (submissions not yet graded)
-        from Student.models import StudentAssignment
-        pending_submissions = StudentAssignment.objects.filter(
-            assignment__teacher=teacher,
-            is_graded=False
-        )
-        context['pending_evaluations_count'] = pending_submissions.count()
-        
-        # Get assignments with pending evaluations
-        assignment_ids_with_pending = pending_submissions.values_list('assignment_id', flat=True).distinct()
-        context['pending_evaluation_assignments'] = Assignment.objects.filter(
-            id__in=assignment_ids_with_pending
-        )[:5]
-        
-        # Calculate average grade
-        graded_submissions = StudentAssignment.objects.filter(
-            assignment__teacher=teacher,
-            is_graded=True
-        )
-        if graded_submissions.exists():
-            total_score = sum(float(sub.score) for sub in graded_submissions)
-            max_score = sum(float(sub.assignment.max_score) for sub in graded_submissions)
-            context['average_grade'] = round((total_score / max_score * 100), 1) if max_score > 0 else 0
-        else:
-            context['average_grade'] = 0
+        # Latest assignments, and the latest with submissions to grade; both
+        # carry their submission counts
+        assignments = Assignment.objects.filter(teacher=teacher).order_by('-created_at')
+        context['recent_assignments'] = assignments[:5]
+        context['pending_evaluation_assignments'] = assignments.filter(ungraded_count__gt=0)[:5]
         
         context['subjects'] = Subject.objects.all()
         context['classrooms'] = Classroom.objects.all()
@@ -69,26 +53,51 @@ class AssignmentList(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Show all assignments for teachers, but prioritize own assignments
         if self.request.user.is_superuser:
-            return Assignment.objects.all().order_by('-created_at')
-        if hasattr(self.request.user, 'role') and self.request.user.role == 'teacher':
+            assignments = Assignment.objects.all()
+        elif hasattr(self.request.user, 'role') and self.request.user.role == 'teacher':
             # Show all assignments, but order by own assignments first
             own_assignments = Assignment.objects.filter(teacher=self.request.user)
             other_assignments = Assignment.objects.exclude(teacher=self.request.user)
             # Combine: own assignments first, then others
-            return (own_assignments | other_assignments).distinct().order_by('-created_at')
-        return Assignment.objects.filter(teacher=self.request.user).order_by('-created_at')
+            assignments = (own_assignments | other_assignments).distinct()
+        else:
+            assignments = Assignment.objects.filter(teacher=self.request.user)
+        # Submission counts are stored on the assignment
+        return assignments.order_by('-created_at')
 
-class SubmissionList(LoginRequiredMixin, ListView):
+class SubmissionList(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name="Teacher/submission_list.html"
     context_object_name = 'submissions'
     paginate_by = 20
+    keyset_field = 'submitted_at'
     
     def get_queryset(self):
         from Student.models import StudentAssignment
         # Get all submissions for assignments created by this teacher
         return StudentAssignment.objects.filter(
-            assignment__teacher=self.request.user
-        ).order_by('-submitted_at')
+            teacher=self.request.user
+        ).select_related('assignment', 'student').order_by('-submitted_at')
+
+class SubmissionEventsView(View):
+    """
+    Server-sent events stream of status and score changes to the teacher's
+    submissions, optionally limited to one assignment (?assignment=<id>)
+    """
+    
+    async def get(self, request):
+        from Student.services.events import event_stream, parse_cursor, submission_change_events
+        user = await request.auser()
+        if not user.is_authenticated or not (user.is_superuser or user.role == 'teacher'):
+            return HttpResponseForbidden()
+        
+        filters = Q() if user.is_superuser else Q(teacher=user)
+        assignment_id = request.GET.get('assignment')
+        if assignment_id:
+            if not assignment_id.isdigit():
+                return HttpResponseBadRequest("assignment must be an id")
+            filters &= Q(assignment_id=int(assignment_id))
+        since = parse_cursor(request.headers.get('Last-Event-ID'))
+        return event_stream(submission_change_events(filters, since))
 
 # Question CRUD Views
 class QuestionListView(LoginRequiredMixin, ListView):
@@ -131,7 +140,7 @@ class QuestionDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 # Assignment CRUD Views
-class AssignmentCreateView(LoginRequiredMixin, CreateView):
+class AssignmentCreateView(LoginRequiredMixin, AdmissionControlMixin, CreateView):
     model = Assignment
     form_class = AssignmentForm
     template_name = 'Teacher/assignment_form.html'
@@ -141,7 +150,9 @@ class AssignmentCreateView(LoginRequiredMixin, CreateView):
         form.instance.teacher = self.request.user
         
         # Extract text from key answer file if provided
+        extraction_deferred = False
         if form.instance.key_answer_file and not form.instance.key_answer_text:
+            from Student.services.admission import Overloaded
             try:
                 from Student.services.ocr import extract_text_from_file
                 file_path = form.instance.key_answer_file.path
@@ -149,34 +160,37 @@ class AssignmentCreateView(LoginRequiredMixin, CreateView):
                     extracted_text = extract_text_from_file(file_path)
                     if extracted_text:
                         form.instance.key_answer_text = extracted_text
+            except Overloaded:
+                # OCR is busy: extract in the background once the file is saved
+                extraction_deferred = True
             except Exception as e:
                 print(f"⚠️ Could not extract text from key answer file: {e}")
         
         response = super().form_valid(form)
+        from Student.services.tasks import schedule_sweep
+        schedule_sweep(form.instance)
+        if extraction_deferred:
+            from Student.services.tasks import extract_key_text, teacher_key
+            extract_key_text.enqueue(assignment_id=form.instance.pk, fair_key=teacher_key(form.instance))
+            messages.info(self.request, 'Text extraction from the key answer file is queued and will finish shortly.')
         
         # Create notifications for all students in the assigned classroom
         assignment = form.instance
-        students = find_students_for_classroom(assignment.classroom)
-        
-        notification_count = 0
-        for student in students:
-            notification, created = Notification.objects.get_or_create(
-                assignment=assignment,
-                student=student,
-                defaults={
-                    'message': f"New assignment: {assignment.title} in {assignment.subject.name}. Due: {assignment.due_date.strftime('%Y-%m-%d %H:%M')}"
-                }
-            )
-            if created:
-                notification_count += 1
+        from Student.services.notifications import new_assignment_message, notify_classroom
+        result = notify_classroom(assignment, new_assignment_message(assignment))
         
-        if notification_count > 0:
-            messages.success(self.request, f'Assignment created and notifications sent to {notification_count} students!')
+        if result['queued']:
+            messages.success(self.request, f"Assignment created! Notifications to {result['students']} students are being sent in the background.")
+        elif result['created'] > 0:
+            messages.success(self.request, f"Assignment created and notifications sent to {result['created']} students!")
         else:
             messages.warning(self.request, f'Assignment created but no students found for classroom "{assignment.classroom.name}". Please check that students have matching class_grade.')
         return response
 
-class AssignmentUpdateView(LoginRequiredMixin, UpdateView):
+# Editing any of these makes the stored scores of an assignment stale
+REGRADE_FIELDS = {'key_answer_text', 'key_answer_file', 'grading_mode', 'rubric', 'max_score'}
+
+class AssignmentUpdateView(LoginRequiredMixin, AdmissionControlMixin, UpdateView):
     model = Assignment
     form_class = AssignmentForm
     template_name = 'Teacher/assignment_form.html'
@@ -190,8 +204,12 @@ class AssignmentUpdateView(LoginRequiredMixin, UpdateView):
         return Assignment.objects.filter(teacher=self.request.user)
     
     def form_valid(self, form):
-        # Extract text from key answer file if provided and text is empty
-        if form.instance.key_answer_file and not form.instance.key_answer_text:
+        # Extract text from key answer file if provided and text is empty, or
+        # if a new file was uploaded without editing the (pre-filled) text
+        extraction_deferred = False
+        new_key_file = 'key_answer_file' in form.changed_data and 'key_answer_text' not in form.changed_data
+        if form.instance.key_answer_file and (new_key_file or not form.instance.key_answer_text):
+            from Student.services.admission import Overloaded
             try:
                 from Student.services.ocr import extract_text_from_file
                 file_path = form.instance.key_answer_file.path
@@ -199,65 +217,71 @@ class AssignmentUpdateView(LoginRequiredMixin, UpdateView):
                     extracted_text = extract_text_from_file(file_path)
                     if extracted_text:
                         form.instance.key_answer_text = extracted_text
+            except Overloaded:
+                # OCR is busy: extract in the background once the file is saved
+                extraction_deferred = True
             except Exception as e:
                 print(f"⚠️ Could not extract text from key answer file: {e}")
         
-        # Save the form first
+        # Save the form first, with the counts as they are now: submissions
+        # may have arrived since the assignment was loaded
+        form.instance.refresh_from_db(fields=Assignment.COUNT_FIELDS)
         response = super().form_valid(form)
+        if 'due_date' in form.changed_data:
+            from Student.services.tasks import schedule_sweep
+            schedule_sweep(form.instance)
+        regrade = bool(set(form.changed_data) & REGRADE_FIELDS)
+        if extraction_deferred:
+            # Re-grading waits for the new key text, so the job queues it
+            from Student.services.tasks import extract_key_text, teacher_key
+            extract_key_text.enqueue(assignment_id=form.instance.pk, regrade=regrade, fair_key=teacher_key(form.instance))
+            messages.info(self.request, 'Text extraction from the key answer file is queued and will finish shortly.')
         
         # Refresh assignment from database to ensure we have the latest data
         assignment = Assignment.objects.get(pk=form.instance.pk)
         
-        # Create/update notifications for all students in the assigned classroom
-        # Use the utility function to find students
-        students = find_students_for_classroom(assignment.classroom)
-        
-        # Fallback: Also try direct classroom name matching and combine results
-        direct_match_students = User.objects.filter(
-            role='student',
-            class_grade__iexact=assignment.classroom.name
-        )
+        # Existing grades were computed against the old key or scale
+        if regrade and extraction_deferred:
+            messages.info(self.request, 'The answer key changed, so existing submissions will be re-graded once its text is extracted.')
+        elif regrade:
+            from Student.services.tasks import enqueue_regrade
+            enqueue_regrade(assignment)
+            messages.info(self.request, 'The answer key changed, so existing submissions are being re-graded in the background.')
         
-        # Combine both querysets to ensure we get all students
-        if students.exists() and direct_match_students.exists():
-            # Combine both querysets
-            student_ids = list(students.values_list('id', flat=True)) + list(direct_match_students.values_list('id', flat=True))
-            students = User.objects.filter(id__in=student_ids).distinct()
-        elif direct_match_students.exists() and not students.exists():
-            # Use direct match if utility function found nothing
-            students = direct_match_students
+        # Create notifications for students who have none and refresh the
+        # ones whose message changed
+        from Student.services.notifications import notify_classroom, updated_assignment_message
+        result = notify_classroom(assignment, updated_assignment_message(assignment), refresh=True)
+        notification_count, updated_count = result['created'], result['updated']
         
-        notification_count = 0
-        updated_count = 0
-        
-        # Create or update notification for each student
-        update_message = f"Assignment updated: {assignment.title} in {assignment.subject.name}. Due: {assignment.due_date.strftime('%Y-%m-%d %H:%M')}"
-        
-        for student in students:
-            try:
-                notification, created = Notification.objects.update_or_create(
-                    assignment=assignment,
-                    student=student,
-                    defaults={
-                        'message': update_message,
-                        'is_read': False  # Always mark as unread when updated
-                    }
-                )
-                if created:
-                    notification_count += 1
-                else:
-                    updated_count += 1
-            except Exception as e:
-                print(f"⚠️ Error creating/updating notification for student {student.id}: {e}")
-                continue
-        
-        if notification_count > 0 or updated_count > 0:
+        if result['queued']:
+            messages.success(self.request, f"Assignment updated! Notifications to {result['students']} students are being sent in the background.")
+        elif notification_count > 0 or updated_count > 0:
             messages.success(self.request, f'Assignment updated and notifications sent to {notification_count + updated_count} students! ({notification_count} new, {updated_count} updated)')
+        elif result['students'] > 0:
+            messages.success(self.request, f"Assignment updated! All {result['students']} students already have an up-to-date notification.")
         else:
             messages.warning(self.request, f'Assignment updated but no students found for classroom "{assignment.classroom.name}". Please check that students have matching class_grade.')
         
         return response
 
+class AssignmentRegradeView(LoginRequiredMixin, View):
+    """Queue a re-grade of every submission against the current answer key"""
+    
+    def post(self, request, pk):
+        if request.user.is_superuser:
+            assignment = get_object_or_404(Assignment, pk=pk)
+        else:
+            assignment = get_object_or_404(Assignment, pk=pk, teacher=request.user)
+        
+        if not assignment.key_answer_text and not assignment.key_answer_file:
+            messages.error(request, 'This assignment has no answer key to grade against.')
+        else:
+            from Student.services.tasks import enqueue_regrade
+            enqueue_regrade(assignment)
+            messages.success(request, 'Re-grading submissions in the background. Scores will update shortly.')
+        return redirect('Teacher:assignment_detail', pk=assignment.pk)
+
 class AssignmentDeleteView(LoginRequiredMixin, DeleteView):
     model = Assignment
     template_name = 'Teacher/assignment_confirm_delete.html'
@@ -324,20 +348,15 @@ class AssignmentDetailView(LoginRequiredMixin, DetailView):
         # Use flexible matching to count students
         students = find_students_for_classroom(self.object.classroom)
         context['total_students'] = students.count()
-        context['submitted_count'] = submissions.count()
+        
+        # Submitted count and average score in one query
+        stats = submission_stats(submissions)
+        context['submitted_count'] = stats['submitted']
+        context['average_score'] = stats['average_percentage']
         
         # Calculate pending count
         context['pending_count'] = max(0, context['total_students'] - context['submitted_count'])
         
-        # Calculate average score if there are graded submissions
-        graded_submissions = submissions.filter(is_graded=True)
-        if graded_submissions.exists():
-            total_score = sum(float(sub.score) for sub in graded_submissions)
-            max_score = sum(float(sub.assignment.max_score) for sub in graded_submissions)
-            context['average_score'] = round((total_score / max_score * 100), 1) if max_score > 0 else 0
-        else:
-            context['average_score'] = None
-        
         return context
 
 class SubmissionDetailView(LoginRequiredMixin, DetailView):
@@ -352,6 +371,24 @@ class SubmissionDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         submission = self.get_object()
         context['form'] = SubmissionGradingForm(instance=submission)
+        
+        # Highlight passages stored by the plagiarism check
+        from Student.models import StudentAssignment
+        from Student.services.fingerprint import highlight_segments
+        spans = [span for match in submission.plagiarism_spans for span in match['spans']]
+        context['answer_segments'] = highlight_segments(submission.answer_text, spans)
+        matched = StudentAssignment.objects.filter(
+            id__in=[match['submission'] for match in submission.plagiarism_spans]
+        ).select_related('student').in_bulk()
+        context['passage_matches'] = [
+            {
+                'submission': matched[match['submission']],
+                'passage_count': len(match['spans']),
+                'matched_chars': sum(span[1] - span[0] for span in match['spans']),
+            }
+            for match in submission.plagiarism_spans
+            if match['submission'] in matched
+        ]
         return context
     
     def post(self, request, *args, **kwargs):
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:28
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_class_columns(apps, schema_editor):
+    User = apps.get_model('USER', 'User')
+    users = []
+    for user in User.objects.exclude(class_grade__isnull=True).exclude(class_grade='').only('id', 'class_grade').iterator():
+        class_grade = user.class_grade.strip()
+        user.class_key = class_grade.upper()
+        match = re.search(r'(\d+)[\s\-]?([A-Za-z])?', class_grade)
+        if match:
+            user.grade = match.group(1)
+            user.section = match.group(2).upper() if match.group(2) else None
+        users.append(user)
+    User.objects.bulk_update(users, ['class_key', 'grade', 'section'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='class_key',
+            field=models.CharField(blank=True, editable=False, help_text='Stripped, upper-cased class_grade', max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='grade',
+            field=models.CharField(blank=True, editable=False, help_text='First number in class_grade', max_length=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='section',
+            field=models.CharField(blank=True, editable=False, help_text='Section letter following the grade', max_length=1, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'grade'], name='user_role_grade'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'class_key'], name='user_role_class_key'),
+        ),
+        migrations.RunPython(backfill_class_columns, migrations.RunPython.noop),
+    ]
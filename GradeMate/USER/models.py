@@ -1,8 +1,28 @@
+import re
 from django.db import models
 
 # Create your models here.
 from django.contrib.auth.models import AbstractUser
 
+# First number in a class, and the section letter right after it: "10-A", "10A", "Grade 10 A"
+_CLASS_GRADE_RE = re.compile(r'(\d+)[\s\-]?([A-Za-z])?')
+
+
+def parse_class_grade(class_grade):
+    """
+    Split a student's free-text class into the normalized (class_key, grade,
+    section) columns used to match classrooms. All three are None when no
+    class is set; grade and section are None when the class has no number.
+    """
+    if not class_grade:
+        return None, None, None
+    class_key = class_grade.strip().upper()
+    match = _CLASS_GRADE_RE.search(class_grade.strip())
+    if not match:
+        return class_key, None, None
+    return class_key, match.group(1), match.group(2).upper() if match.group(2) else None
+
+
 class User(AbstractUser):
     Role_choices=(
         ("student","Student"),
@@ -13,8 +33,23 @@ class User(AbstractUser):
     mobile=models.CharField(max_length=15,blank=True,null=True)
     class_grade=models.CharField(max_length=5,blank=True,null=True)
     subject=models.CharField(max_length=5,blank=True,null=True)
+    # Parsed from class_grade on save; see parse_class_grade
+    class_key=models.CharField(max_length=10,blank=True,null=True,editable=False,help_text="Stripped, upper-cased class_grade")
+    grade=models.CharField(max_length=5,blank=True,null=True,editable=False,help_text="First number in class_grade")
+    section=models.CharField(max_length=1,blank=True,null=True,editable=False,help_text="Section letter following the grade")
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['role', 'grade'], name='user_role_grade'),
+            models.Index(fields=['role', 'class_key'], name='user_role_class_key'),
+        ]
 
     def __str__(self):
         return f"{self.name}({self.role})"
-    
- 
\ No newline at end of file
+
+    def save(self, *args, **kwargs):
+        self.class_key, self.grade, self.section = parse_class_grade(self.class_grade)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'class_grade' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'class_key', 'grade', 'section'}
+        super().save(*args, **kwargs)